@@ -0,0 +1,66 @@
+"""
+CSV ingestion throughput: csv_source against csv_batch_source
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_csv.py [rows]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from genpipeline import csv_source, null
+from genpipeline.fastcsv import csv_batch_source
+
+SCHEMA = {"id": "int", "quantity": "int", "price": "float", "day": "date"}
+
+
+def write_file(path, rows):
+    with open(path, "w", newline="") as f:
+        f.write("id,name,quantity,price,day,comment\n")
+        for i in range(rows):
+            f.write("{},name {},{},{:.2f},2020-01-{:02d},some comment text\n".format(
+                i, i % 1000, random.randint(0, 100), random.random() * 100, i % 28 + 1))
+
+
+def timed(name, rows, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print("{:>40}: {:.2f}s, {:,.0f} rows/s".format(name, elapsed, rows / elapsed))
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.csv")
+        write_file(path, rows)
+        print("{:,} rows, {:.1f} MB".format(rows, os.path.getsize(path) / 1e6))
+
+        def run_csv_source():
+            with open(path, newline="") as f:
+                csv_source(f) | null()
+
+        baseline = timed("csv_source (dicts of strings)", rows, run_csv_source)
+
+        def run_csv_source_rows():
+            with open(path, newline="") as f:
+                csv_source(f, row_format="row") | null()
+
+        elapsed = timed("csv_source (Row objects)", rows, run_csv_source_rows)
+        print("{:>40}  {:.1f}x csv_source".format("", baseline / elapsed))
+        for name, options in [
+                ("csv_batch_source tuples", {}),
+                ("csv_batch_source tuples, mmap", {"use_mmap": True}),
+                ("csv_batch_source tuples, typed", {"schema": SCHEMA}),
+                ("csv_batch_source columns, typed", {"schema": SCHEMA, "output": "columns"})]:
+            elapsed = timed(name, rows, lambda: csv_batch_source(path, **options) | null())
+            print("{:>40}  {:.1f}x csv_source".format("", baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
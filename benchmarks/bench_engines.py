@@ -0,0 +1,60 @@
+"""
+Push engine against pull engine for linear pipelines
+
+Runs each pipeline over the same items with its ``engine`` set to "push" and to "pull".
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_engines.py [items]
+"""
+
+import sys
+import time
+
+from genpipeline import iter_filter, iter_source, null, project, rename, set_default
+
+
+@iter_filter
+def evens(items):
+    for item in items:
+        if item["id"] % 2 == 0:
+            yield item
+
+
+def row_pipeline():
+    return rename(("a", "id")) | set_default("b", 0) | project(["id", "b"]) | null()
+
+
+def iter_pipeline():
+    return rename(("a", "id")) | evens() | project(["id"]) | null()
+
+
+def rows(items):
+    return ({"a": i, "c": i} for i in range(items))
+
+
+def timed(name, items, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print("{:>40}: {:.2f}s, {:,.0f} items/s".format(name, elapsed, items / elapsed))
+    return elapsed
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    print("{:,} items".format(items))
+    for name, make_pipeline in [("row filters", row_pipeline),
+                                ("row filters + iter_filter", iter_pipeline)]:
+        elapsed = {}
+        for engine in ("push", "pull"):
+            def run():
+                pipeline = make_pipeline()
+                pipeline.engine = engine
+                iter_source(rows(items)) | pipeline
+            elapsed[engine] = timed("{} ({})".format(name, engine), items, run)
+        print("{:>40}  pull {:.1f}x push".format("", elapsed["push"] / elapsed["pull"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Insert throughput of db.inserter methods, against an in-memory SQLite database
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_inserter.py [rows]
+"""
+
+import sqlite3
+import sys
+import time
+
+from genpipeline import iter_source
+from genpipeline.db import inserter
+
+COLUMNS = ["id", "name", "quantity", "price"]
+
+
+def run(rows, **kwargs):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE test (id INTEGER, name TEXT, quantity INTEGER, price REAL)")
+    data = [(i, "name {}".format(i), i % 100, i * 0.5) for i in range(rows)]
+    start = time.perf_counter()
+    iter_source(data) | inserter(conn, "test", COLUMNS, placeholder="?", commit_every=100000,
+                                 **kwargs)
+    elapsed = time.perf_counter() - start
+    assert conn.execute("SELECT count(*) FROM test").fetchone()[0] == rows
+    conn.close()
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    print("{:,} rows".format(rows))
+    for method, batch_size in [("execute", 1), ("executemany", 1000),
+                               ("multirow_values", 100), ("multirow_values", 200)]:
+        elapsed = run(rows, method=method, batch_size=batch_size)
+        print("{:>16} (batch_size={:>4}): {:.2f}s, {:,.0f} rows/s".format(
+            method, batch_size, elapsed, rows / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Per-stage overhead of propagate_exceptions for a 10-stage pipeline
+
+Compares the hand-written PEP-380 trampoline previously used by ``propagate_exceptions`` with the
+current implementation delegating with ``yield from``.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_propagate.py [items]
+"""
+
+import sys
+import time
+from functools import wraps
+
+from genpipeline import PipeElement, coroutine, iter_source, null, propagate_exceptions
+
+STAGES = 10
+
+
+def trampoline_propagate_exceptions(fn):
+    """The previous implementation of propagate_exceptions, kept for comparison"""
+
+    @wraps(fn)
+    def wrapped(*args, **kwargs):
+        try:
+            try:
+                it = iter(fn(*args, **kwargs))
+                try:
+                    y = next(it)
+                except StopIteration:
+                    pass
+                else:
+                    while 1:
+                        try:
+                            s = yield y
+                        except GeneratorExit as e:
+                            try:
+                                close = it.close
+                            except AttributeError:
+                                pass
+                            else:
+                                close()
+                            raise e
+                        except BaseException as e:
+                            exc_info = sys.exc_info()
+                            try:
+                                throw = it.throw
+                            except AttributeError:
+                                raise
+                            else:
+                                try:
+                                    y = throw(*exc_info)
+                                except StopIteration:
+                                    break
+                        else:
+                            try:
+                                if s is None:
+                                    y = next(it)
+                                else:
+                                    y = it.send(s)
+                            except StopIteration:
+                                break
+
+            except Exception as e:
+                if "target" in kwargs:
+                    try:
+                        kwargs["target"].throw(e)
+                    except:
+                        pass
+                raise
+        except GeneratorExit:
+            if "target" in kwargs:
+                kwargs["target"].close()
+    return wrapped
+
+
+def passthrough(target):
+    while True:
+        target.send((yield))
+
+
+def make_filter(decorator):
+    def factory():
+        return PipeElement(coroutine(decorator(passthrough)), (), {})
+    return factory
+
+
+def pipeline(factory):
+    pipe = factory() | factory()
+    for _ in range(STAGES - 2):
+        pipe = pipe | factory()
+    return pipe | null()
+
+
+def bare(items):
+    """Baseline: the same 10 generators chained without any wrapper"""
+
+    sink = coroutine(null.__wrapped__)()
+    for _ in range(STAGES):
+        sink = coroutine(passthrough)(sink)
+    start = time.perf_counter()
+    for i in range(items):
+        sink.send(i)
+    return time.perf_counter() - start
+
+
+def run(factory, items):
+    start = time.perf_counter()
+    iter_source(range(items)) | pipeline(factory)
+    return time.perf_counter() - start
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    baseline = bare(items)
+    results = [
+        ("trampoline", run(make_filter(trampoline_propagate_exceptions), items)),
+        ("yield from", run(make_filter(propagate_exceptions), items)),
+    ]
+    print("{} items, {} stages (unwrapped generators: {:.3f}s)".format(items, STAGES, baseline))
+    for name, elapsed in results:
+        per_stage = (elapsed - baseline) / items / STAGES * 1e9
+        print("{:>12}: {:.3f}s total, {:.0f} ns wrapper overhead per item per stage".format(
+            name, elapsed, per_stage))
+
+
+if __name__ == "__main__":
+    main()
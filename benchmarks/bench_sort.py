@@ -0,0 +1,45 @@
+"""
+sort filter against sorted() on data which fits in memory
+
+Also runs the sort with a small ``max_memory``, so that runs are spilled to disk and merged.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_sort.py [rows]
+"""
+
+import random
+import sys
+import time
+from operator import itemgetter
+
+from genpipeline import appender, iter_source
+from genpipeline.sorting import sort
+
+
+def timed(name, rows, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print("{:>40}: {:.2f}s, {:,.0f} rows/s".format(name, elapsed, rows / elapsed))
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    data = [{"id": i, "key": random.random(), "name": "row {}".format(i)} for i in range(rows)]
+    key = itemgetter("key")
+    print("{:,} rows".format(rows))
+
+    baseline = timed("sorted()", rows, lambda: sorted(data, key=key))
+    for name, max_memory in [("sort, in memory", 1 << 40),
+                             ("sort, 16 MB runs", 16 * 1024 * 1024)]:
+        def run():
+            results = []
+            iter_source(data) | (sort(key=key, max_memory=max_memory) | appender(results))
+        elapsed = timed(name, rows, run)
+        print("{:>40}  {:.1f}x sorted()".format("", elapsed / baseline))
+
+
+if __name__ == "__main__":
+    main()
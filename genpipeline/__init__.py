@@ -84,6 +84,46 @@ to catch the ``GeneratorExit`` exception::
      99 * 2 = 198
     198
 
+Batch Mode
+----------
+
+Every item costs a ``send`` on every stage of a pipeline. For large row counts, the section of a
+pipeline between :py:func:`batch` and :py:func:`unbatch` passes lists of items instead. Built-in
+filters with a ``batched`` argument (:py:func:`project`, :py:func:`rename`,
+:py:func:`set_default`, :py:func:`appender`...) process whole batches; any other filter is
+wrapped with :py:func:`per_item` automatically::
+
+    >> iter_source(rows) | (batch(1000) | rename(("a", "b")) | my_filter() | unbatch()
+                            | appender(results))
+
+When a pipeline is resolved, adjacent built-in row filters (:py:func:`project`, :py:func:`rename`,
+:py:func:`rename_regexp` and :py:func:`set_default`) are merged into a single stage, which calls
+each filter's row function in turn on every row. This saves a ``send`` (and generator switch) per
+row for each merged filter, though the row functions themselves still run separately. The
+``fused`` attribute of the pipeline lists the merged stages; set its ``fuse`` attribute to False
+to disable merging.
+
+.. _pull-engine:
+
+Pull Engine
+-----------
+
+A linear pipeline can also be run as a chain of iterators, each stage pulling items from the one
+before, which avoids a ``send`` per item per stage. :py:func:`iter_filter` functions consume the
+previous stage's iterator directly, and the built-in row filters become ``map`` calls; any other
+filter is driven with ``send``. :py:func:`iter_source` picks the engine from the pipeline's shape:
+pipelines without branches (such as :py:func:`broadcast`) use the pull engine if every stage is a
+built-in filter with a pull implementation, which gives the same results in the same order as the
+push engine. Set the ``engine`` attribute of a pipeline to "push" or "pull" to choose;
+instrumented pipelines always use the push engine. With the pull engine, :py:func:`iter_filter`
+functions run in the calling thread and take items as they come rather than in chunks, so filters
+before them may run further ahead.
+
+A pipeline's output can be iterated over directly with its ``over`` method::
+
+    >> for row in (rename(("a", "b")) | project(["b"])).over(rows):
+    ..     print(row)
+
 Exception Handling
 ------------------
 
@@ -108,6 +148,13 @@ Broadcast / Iterators
 .. autofunction:: broadcast
 .. autofunction:: iter_filter
 
+Batches
+-------
+
+.. autofunction:: batch
+.. autofunction:: unbatch
+.. autofunction:: per_item
+
 Sources
 -------
 .. autofunction:: csv_source
@@ -132,16 +179,81 @@ DB Module
 
 .. automodule:: pipeline.db
 
+Instrumentation
+---------------
+
+.. automodule:: genpipeline.instrument
+
+Buffers
+-------
+
+.. automodule:: genpipeline.buffers
+
+Checkpoints
+-----------
+
+.. automodule:: genpipeline.checkpoint
+
+Lookup Joins
+------------
+
+.. automodule:: genpipeline.join
+
+Aggregation
+-----------
+
+.. automodule:: genpipeline.aggregate
+
+Caching
+-------
+
+.. automodule:: genpipeline.cache
+
+Sorting
+-------
+
+.. automodule:: genpipeline.sorting
+
+Worker Pools
+------------
+
+.. automodule:: genpipeline.workers
+
+Asyncio
+-------
+
+.. automodule:: genpipeline.aio
+
+Bulk CSV Loading
+----------------
+
+.. automodule:: genpipeline.fastcsv
+
+Columnar Batches
+----------------
+
+.. automodule:: genpipeline.columnar
+
+Compact Rows
+------------
+
+.. automodule:: genpipeline.rows
+
 """
 from copy import copy
 
-import sys
 import csv
 import inspect
+import os
 import re
-from functools import wraps
-from greenlet import greenlet
+import queue
+import threading
+from collections import deque
+from functools import partial, wraps
+from itertools import chain, islice
 import logging
+from .instrument import PipelineStats, log_report
+from .rows import Row, Schema, schema_function
 
 
 _log = logging.Logger(__name__)
@@ -185,45 +297,9 @@ def propagate_exceptions(fn):
     def wrapped(*args, **kwargs):
         try:
             try:
-                # yield from fn(*args, **kwargs)
-                # code adapted from PEP-380
-                it = iter(fn(*args, **kwargs))
-                try:
-                    y = next(it)
-                except StopIteration:
-                    pass
-                else:
-                    while 1:
-                        try:
-                            s = yield y
-                        except GeneratorExit as e:
-                            try:
-                                close = it.close
-                            except AttributeError:
-                                pass
-                            else:
-                                close()
-                            raise e
-                        except BaseException as e:
-                            exc_info = sys.exc_info()
-                            try:
-                                throw = it.throw
-                            except AttributeError:
-                                raise
-                            else:
-                                try:
-                                    y = throw(*exc_info)
-                                except StopIteration:
-                                    break
-                        else:
-                            try:
-                                if s is None:
-                                    y = next(it)
-                                else:
-                                    y = it.send(s)
-                            except StopIteration:
-                                break
-
+                # Delegation (including throw and close) to the filter is done by the
+                # interpreter, so a send costs no extra Python code in this frame
+                yield from fn(*args, **kwargs)
             except Exception as e:
                 if "target" in kwargs:
                     try:
@@ -250,9 +326,18 @@ class PipeSource:
 
 
 class Pipe:
+    #: Merge adjacent built-in row filters into a single stage when resolving
+    fuse = True
+    #: Engine used when the pipeline is run by :py:func:`iter_source`: "push", "pull" or "auto"
+    engine = "auto"
+    _stats = None
+    _stats_prefix = ""
+
     def __init__(self, lhs, rhs):
         self.lhs = lhs
         self.rhs = rhs
+        #: Names of the stages merged by the last :py:meth:`resolve`, one tuple per merged stage
+        self.fused = []
 
     def __or__(self, other):
         return Pipe(self, other)
@@ -260,8 +345,57 @@ class Pipe:
     def __repr__(self):
         return "Pipe(lhs={}, rhs={})".format(self.lhs, self.rhs)
 
+    def elements(self):
+        """Return the elements of this pipeline as a flat list, in pipeline order"""
+        return self.lhs.elements() + self.rhs.elements()
+
+    def instrument(self, stats=None):
+        """Record per-stage stats when this pipeline is run
+
+        :param stats: :py:class:`genpipeline.instrument.PipelineStats` to record into; by default
+            a new one is created
+        :returns: the :py:class:`genpipeline.instrument.PipelineStats`
+        """
+
+        self._stats = stats if stats is not None else PipelineStats()
+        return self._stats
+
+    def selected_engine(self):
+        """Return the engine ("push" or "pull") :py:func:`iter_source` will run this pipeline with
+
+        See :ref:`pull-engine`.
+        """
+
+        return _select_engine(self, self.elements())
+
+    def over(self, values):
+        """Return an iterator over the items output by this pipeline for the items of ``values``
+
+        The pipeline is run with the pull engine as the iterator is consumed.
+        """
+
+        return _pull_elements(self._prepare_elements(), values, collect=True)
+
+    def run(self, values):
+        """Run this pipeline over the items of ``values`` with the pull engine"""
+
+        _run_pull(self, self._prepare_elements(), values)
+
+    def _prepare_elements(self):
+        elements = _adapt_batches(self.elements())
+        if self.fuse:
+            elements, self.fused = _fuse_elements(elements)
+        return elements
+
     def resolve(self, target=None):
-        fn = self.lhs.resolve(self.rhs.resolve(target))
+        elements = self._prepare_elements()
+        stats = self._stats
+        if stats is None and os.environ.get("GENPIPELINE_INSTRUMENT") and not self._stats_prefix:
+            stats = self.instrument()
+            stats.add_hook(log_report)
+        if stats is not None:
+            _mark_instrumented(elements, stats, self._stats_prefix)
+        fn = _resolve_elements(elements, target)
         self.throw = fn.throw
         self.send = fn.send
         self.close = fn.close
@@ -281,6 +415,14 @@ class Pipe:
 
 
 class PipeElement:
+    #: Stage name, if different to the name of the filter function
+    name = None
+    #: Engine used when the element is run by :py:func:`iter_source`, see :py:attr:`Pipe.engine`
+    engine = "auto"
+    _stats = None
+    _stats_prefix = ""
+    _stats_name = None
+
     def __init__(self, fn, args, kwargs):
         self.fn = fn
         self.args = args
@@ -292,10 +434,37 @@ class PipeElement:
     def __repr__(self):
         return "PipeElement(fn={}, args={}, kwargs={}".format(self.fn, self.args, self.kwargs)
 
+    def elements(self):
+        return [self]
+
+    def instrument(self, stats=None):
+        """Record stats when this element is run, see :py:meth:`Pipe.instrument`"""
+
+        self._stats = stats if stats is not None else PipelineStats()
+        return self._stats
+
+    def selected_engine(self):
+        """Return the engine this element will be run with, see :py:meth:`Pipe.selected_engine`"""
+
+        return _select_engine(self, [self])
+
+    def over(self, values):
+        """Return an iterator over the items output by this element, see :py:meth:`Pipe.over`"""
+
+        return _pull_elements(_adapt_batches([self]), values, collect=True)
+
+    def run(self, values):
+        """Run this element over the items of ``values`` with the pull engine"""
+
+        _run_pull(self, _adapt_batches([self]), values)
+
     def resolve(self, target=None):
         if target is not None:
             self.kwargs["target"] = target
         fn = self.fn(*self.args, **self.kwargs)
+        if self._stats is not None:
+            _mark_instrumented([self], self._stats, self._stats_prefix)
+            fn = self._stats.wrap(fn, self._stats_name)
         self.send = fn.send
         self.throw = fn.throw
         self.close = fn.close
@@ -314,7 +483,364 @@ class PipeElement:
         self.close()
 
 
-def iter_filter(fn):
+def _filter_function(element):
+    """Return the undecorated function behind a pipeline element, or None"""
+
+    fn = getattr(element, "fn", None)
+    return None if fn is None else inspect.unwrap(fn)
+
+
+def _accepts(element, name):
+    """Return True if the function behind a pipeline element takes the named argument"""
+
+    fn = _filter_function(element)
+    return fn is not None and name in inspect.signature(fn).parameters
+
+
+def _element_name(element):
+    fn = _filter_function(element)
+    return getattr(element, "name", None) or (fn.__name__ if fn is not None else repr(element))
+
+
+def _mark_instrumented(elements, stats, prefix):
+    """Set the stats and stage names used by a list of elements when they are resolved
+
+    Pipelines passed as arguments to an element (the branches of a broadcast) are marked too.
+    """
+
+    for i, element in enumerate(elements):
+        if element._stats_name is not None and element._stats is stats:
+            continue
+        name = "{}{}:{}".format(prefix, i, _element_name(element))
+        element._stats = stats
+        element._stats_name = name
+        stats.stage(name)
+        branches = [arg for arg in element.args if isinstance(arg, (Pipe, PipeElement))]
+        for j, branch in enumerate(branches):
+            branch._stats = stats
+            branch._stats_prefix = "{}[{}]/".format(name, j)
+
+
+def _adapt_batches(elements):
+    """Prepare the section of a pipeline between :py:func:`batch` and :py:func:`unbatch`
+
+    Elements in the batched section which take a ``batched`` argument are switched to batch mode,
+    any other element is wrapped with :py:func:`per_item`.
+    """
+
+    adapted = []
+    in_batch = False
+    for element in elements:
+        fn = _filter_function(element)
+        if in_batch and fn not in (_unbatch_function, _per_item_function):
+            if _accepts(element, "batched"):
+                if "batched" not in element.kwargs:
+                    # The caller's element may be used in other pipelines, so change a copy
+                    element = copy(element)
+                    element.kwargs = dict(element.kwargs, batched=True)
+            else:
+                element = per_item(element)
+        adapted.append(element)
+        if fn is _batch_function:
+            in_batch = True
+        elif fn is _unbatch_function:
+            in_batch = False
+    return adapted
+
+
+def _fuse_elements(elements):
+    """Merge runs of adjacent built-in row filters into single elements
+
+    Returns the new list of elements, and a list with a tuple of the merged filter names for each
+    merged run.
+    """
+
+    fused_elements = []
+    fused_names = []
+    run = []
+
+    def flush():
+        if len(run) > 1:
+            batched = run[0].kwargs.get("batched", False)
+            row_functions = [_row_functions[_filter_function(element)](
+                *element.args,
+                **{k: v for k, v in element.kwargs.items() if k not in ("target", "batched")})
+                for element in run]
+            names = tuple(_filter_function(element).__name__ for element in run)
+            element = _fused(_compose_rows(row_functions), batched=batched)
+            element.name = "+".join(names)
+            fused_elements.append(element)
+            fused_names.append(names)
+        else:
+            fused_elements.extend(run)
+        del run[:]
+
+    for element in elements:
+        if _filter_function(element) in _row_functions:
+            if run and run[0].kwargs.get("batched", False) != element.kwargs.get("batched", False):
+                flush()
+            run.append(element)
+        else:
+            flush()
+            fused_elements.append(element)
+    flush()
+
+    if fused_names:
+        _log.debug("Fused pipeline stages: %s", fused_names)
+    return fused_elements, fused_names
+
+
+def _compose_rows(row_functions):
+    """Compose row functions into a single function applying each in turn
+
+    This is a loop over the row functions rather than generated code merging them: fusion saves
+    the ``send`` between stages, not the work of each row function.
+    """
+
+    def fused_row(row):
+        for row_function in row_functions:
+            row = row_function(row)
+        return row
+    return fused_row
+
+
+def _resolve_elements(elements, target=None):
+    """Resolve a flat list of pipeline elements, returning the coroutine for the first element"""
+
+    for element in reversed(elements):
+        target = element.resolve(target)
+    return target
+
+
+def _pull_function(element):
+    """Return the function running an element with the pull engine, or None
+
+    The function takes an iterator of incoming items followed by the element's arguments, and
+    returns an iterator of outgoing items.
+    """
+
+    iter_function = getattr(element.fn, "iter_function", None)
+    if iter_function is not None:
+        return partial(_pull_iter, iter_function)
+    fn = _filter_function(element)
+    if fn in _row_functions:
+        return partial(_pull_row_filter, _row_functions[fn])
+    return _pull_functions.get(fn)
+
+
+def _select_engine(pipe, elements):
+    """Choose the engine to run a pipeline (or element) with when it is run by a source
+
+    The pull engine is chosen for linear pipelines (without branches, such as
+    :py:func:`broadcast`) when every stage is a built-in filter with a pull implementation, so
+    that the results and side effects are the same as with the push engine. An
+    :py:func:`iter_filter` runs differently with each engine, so only uses the pull engine if it
+    is chosen.
+    """
+
+    if pipe.engine != "auto":
+        return pipe.engine
+    if "send" in vars(pipe) or pipe._stats is not None or os.environ.get("GENPIPELINE_INSTRUMENT"):
+        # Already started, or instrumented (which needs the push engine)
+        return "push"
+
+    for element in elements:
+        if (getattr(element.fn, "iter_function", None) is not None
+                or _pull_function(element) is None
+                or any(isinstance(arg, (Pipe, PipeElement)) for arg in element.args)):
+            return "push"
+    return "pull"
+
+
+def _pull_elements(elements, values, collect=False):
+    """Chain iterators running a flat list of pipeline elements over ``values``
+
+    Elements without a pull implementation are driven with ``send``, collecting what they send
+    on. The last element only sends to a collector if ``collect`` is set.
+    """
+
+    items = iter(values)
+    for i, element in enumerate(elements):
+        kwargs = {k: v for k, v in element.kwargs.items() if k != "target"}
+        pull = _pull_function(element)
+        if pull is not None:
+            items = pull(items, *element.args, **kwargs)
+        else:
+            last = i == len(elements) - 1
+            items = _pull_push_element(element, items, collect or not last)
+    return items
+
+
+def _run_pull(pipe, elements, values):
+    """Run a pipeline with the pull engine, then leave it closed so it can't be run again"""
+
+    deque(_pull_elements(elements, values), maxlen=0)
+    finished = _finished()
+    pipe.send = finished.send
+    pipe.throw = finished.throw
+    pipe.close = finished.close
+
+
+def _finished():
+    # A closed generator: send raises StopIteration, close does nothing
+    generator = (item for item in ())
+    generator.close()
+    return generator
+
+
+def _pull_push_element(element, items, collect):
+    """Drive a push-only element with ``send``, yielding the items it sends on"""
+
+    output = []
+    if collect and _accepts(element, "target"):
+        stage = element.resolve(appender(output))
+    else:
+        stage = element.resolve()
+
+    send = stage.send
+    try:
+        for item in items:
+            send(item)
+            if output:
+                yield from output
+                del output[:]
+    except Exception as e:
+        try:
+            stage.throw(e)
+        except StopIteration:
+            pass
+        raise e
+    stage.close()
+    yield from output
+
+
+def _pull_iter(fn, items, *args, **kwargs):
+    """Pull implementation of :py:func:`iter_filter`: the function consumes the iterator directly"""
+
+    exhausted = False
+
+    def consume():
+        nonlocal exhausted
+        yield from items
+        exhausted = True
+
+    result = fn(consume(), *args, **kwargs)
+    if inspect.isgenerator(result):
+        try:
+            yield from result
+        except RuntimeError as e:
+            if not (exhausted and isinstance(e.__cause__, StopIteration)):
+                raise
+            # The function called next() on the exhausted iterator
+    elif result is not None:
+        yield from result
+
+
+def _pull_row_filter(row_function_factory, items, *args, batched=False, **kwargs):
+    return _pull_rows(items, row_function_factory(*args, **kwargs), batched)
+
+
+def _pull_rows(items, row_function, batched=False):
+    if batched:
+        return ([row_function(row) for row in rows] for rows in items)
+    return map(row_function, items)
+
+
+class _IterHandoff:
+    """Runs a function consuming an iterator in a thread, handing it items a chunk at a time
+
+    The thread and the pipeline take turns: :py:meth:`exchange` hands the thread a message and
+    waits until the function needs the next chunk (or finishes), so the function never runs at the
+    same time as the rest of the pipeline.
+    """
+
+    def __init__(self, fn, args, kwargs):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._requests = queue.Queue(1)
+        self._responses = queue.Queue(1)
+        self._outputs = []
+        self._thread = None
+        self._ended = False
+        self.finished = False
+
+    def _take_outputs(self):
+        outputs, self._outputs = self._outputs, []
+        return outputs
+
+    def _items(self):
+        # The iterator passed to the function
+        while True:
+            self._responses.put(("need", self._take_outputs(), None))
+            kind, value = self._requests.get()
+            if kind == "end":
+                self._ended = True
+                return
+            elif kind == "throw":
+                raise value
+            yield from value
+
+    def _run(self):
+        try:
+            result = self._fn(self._items(), *self._args, **self._kwargs)
+            if inspect.isgenerator(result):
+                for output in result:
+                    self._outputs.append(output)
+        except RuntimeError as e:
+            if self._ended and isinstance(e.__cause__, StopIteration):
+                # A generator calling next() on the exhausted iterator
+                self._responses.put(("done", self._take_outputs(), None))
+            else:
+                self._responses.put(("error", self._take_outputs(), e))
+        except BaseException as e:
+            self._responses.put(("error", self._take_outputs(), e))
+        else:
+            self._responses.put(("done", self._take_outputs(), None))
+
+    def _receive(self):
+        state, outputs, error = self._responses.get()
+        if state != "need":
+            self.finished = True
+        return outputs, error
+
+    def exchange(self, kind, value=None):
+        """Send a message ("items", "throw" or "end") to the function
+
+        :returns: the items output by the function since the last exchange, and the exception the
+            function raised, if it raised one
+        """
+
+        outputs = []
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            outputs, error = self._receive()
+            if self.finished:
+                return outputs, error
+        elif self.finished:
+            return outputs, None
+        self._requests.put((kind, value))
+        more_outputs, error = self._receive()
+        return outputs + more_outputs, error
+
+    def abort(self, error):
+        """End the function after the rest of the pipeline failed, discarding its outputs
+
+        The error is raised in the function by the iterator, so that it can clean up; if the
+        function handles it and carries on, the iterator ends.
+        """
+
+        if self._thread is None or self.finished:
+            return
+        self._requests.put(("throw", error))
+        self._receive()
+        if not self.finished:
+            self._requests.put(("end", None))
+            self._receive()
+
+
+def iter_filter(fn=None, chunk_size=1024):
     """Decorator creating a filter that presents pipeline data as an iterator
 
     The iterator is passed to the decorated function as the first argument.
@@ -324,72 +850,59 @@ def iter_filter(fn):
 
     This is useful to interface a pipeline with a function that requires an iterator as input.
 
-    Caveats:
+    The function runs in its own thread, taking turns with the rest of the pipeline. Items are
+    handed over ``chunk_size`` at a time, so items are sent on in bursts (and the function's
+    exceptions are raised) when a chunk is handed over or the pipeline is closed. Use
+    ``@iter_filter(chunk_size=n)`` to change the chunk size. If a later stage fails, its exception
+    is raised in the function by the iterator, so that the function can clean up.
 
-    * If the wrapped function raises an exception after the last item has been consumed
-      from the iterator, it will not propagate.
+    As the function runs in another thread, it must not use objects which only work in the thread
+    that created them, such as SQLite connections (including those of a SQLAlchemy engine for an
+    in-memory SQLite database, whose pool keeps a database per thread).
     """
 
-    sentinel = object()
+    if fn is None:
+        return lambda fn: iter_filter(fn, chunk_size)
 
-    @pipefilter
     @wraps(fn)
     def wrapped(*args, target=None, **kwargs):
-        def generator():
-            # This is the generator that the wrapped function will consume from
-            while True:
-                item = greenlet.getcurrent().parent.switch(sentinel)
-                if isinstance(item, GeneratorExit):
-                    return
-                else:
-                    yield item
-
-        def run_target():
-            # greenlet executing wrapped function
-            fn(generator(), *args, **kwargs)
+        handoff = _IterHandoff(fn, args, kwargs)
 
-        def run_target_generator():
-            for item in fn(generator(), *args, **kwargs):
-                greenlet.getcurrent().parent.switch(item)
+        def exchange(kind, value=None):
+            outputs, error = handoff.exchange(kind, value)
+            if target is not None:
+                for output in outputs:
+                    target.send(output)
+            if error is not None:
+                raise error
 
-        if inspect.isgeneratorfunction(fn):
-            # Wrapping a filter (consumes an iterator, is a generator)
-            g_consume = greenlet(run_target_generator)
-            g_consume.switch()
-
-            try:
-                while True:
-                    try:
-                        item = (yield)
-                    except Exception as e:
-                        g_consume.throw(e)
-                    else:
-                        value = g_consume.switch(item)
-
-                    # Feed any values the generator yields down the pipeline
-                    while value is not sentinel:
-                        if target is not None:
-                            target.send(value)
-                        value = g_consume.switch()
-            except GeneratorExit as e:
-                g_consume.switch(e)
-        else:
-            # Wrapping a sink (consumes an iterator)
-            g_consume = greenlet(run_target)
-            g_consume.switch()
-
-            try:
-                while True:
-                    try:
-                        item = (yield)
-                    except Exception as e:
-                        g_consume.throw(e)
-                    else:
-                        g_consume.switch(item)
-            except GeneratorExit as e:
-                g_consume.switch(e)
+        chunk = []
+        try:
+            while True:
+                try:
+                    chunk.append((yield))
+                except Exception as e:
+                    exchange("items", chunk)
+                    chunk = []
+                    if handoff.finished:
+                        raise
+                    # The function may handle the exception and carry on consuming
+                    exchange("throw", e)
+                if len(chunk) >= chunk_size:
+                    exchange("items", chunk)
+                    chunk = []
+        except GeneratorExit:
+            if chunk:
+                exchange("items", chunk)
+            exchange("end")
+        except Exception as e:
+            # A later stage failed: end the function rather than leave its thread waiting
+            handoff.abort(e)
+            raise
 
-    return wrapped
+    # Lets the pull engine call the function with its iterator directly
+    wrapped.iter_function = fn
+    return pipefilter(wrapped)
 
 
 iter_sink = iter_filter
@@ -397,7 +910,14 @@ iter_sink = iter_filter
 
 @pipesource
 def iter_source(values, target):
-    """Source: push items from an iterable into a pipeline"""
+    """Source: push items from an iterable into a pipeline
+
+    The pipeline is run with the pull engine instead if it selects it, see :ref:`pull-engine`.
+    """
+
+    if isinstance(target, (Pipe, PipeElement)) and target.selected_engine() == "pull":
+        target.run(values)
+        return
 
     try:
         for i in values:
@@ -413,8 +933,24 @@ def iter_source(values, target):
 
 
 @pipefilter
-def broadcast(*targets):
-    """Broadcast a stream onto multiple targets"""
+def broadcast(*targets, buffer_size=None, overflow="block", stats=None):
+    """Broadcast a stream onto multiple targets
+
+    By default each item is sent to each target in turn, so a slow target holds up the others.
+    If ``buffer_size`` is given, each target is run in its own thread, fed through a
+    :py:class:`genpipeline.buffers.BoundedBuffer`, so that targets only wait for each other when
+    a buffer fills up. Targets must not share state in this mode.
+
+    :param buffer_size: number of items buffered in memory for each target
+    :param overflow: what happens when a buffer is full: "block" (wait for the target),
+        "drop_oldest" (discard the oldest buffered item) or "spill" (buffer items on disk)
+    :param stats: a list, to which a :py:class:`genpipeline.buffers.BufferStats` for each
+        target's buffer is appended, in target order
+    """
+
+    if buffer_size is not None:
+        yield from _broadcast_buffered(targets, buffer_size, overflow, stats)
+        return
 
     try:
         while True:
@@ -446,7 +982,158 @@ def broadcast(*targets):
     except GeneratorExit:
         for target in targets:
             target.close()
-            
+
+
+def _drain_buffer(buffer, target, errors):
+    """Send the items of a buffer to a broadcast target (run in the target's thread)"""
+
+    try:
+        for item in buffer:
+            target.send(item)
+        if buffer.error is not None:
+            try:
+                target.throw(buffer.error)
+            except StopIteration:
+                pass
+            except Exception as e:
+                if e is not buffer.error:
+                    raise
+        else:
+            target.close()
+    except Exception as e:
+        errors.append(e)
+        buffer.close()
+
+
+def _broadcast_buffered(targets, buffer_size, overflow, stats):
+    """Generator body of :py:func:`broadcast` with a buffer and a thread for each target"""
+
+    from .buffers import BoundedBuffer
+
+    buffers = [BoundedBuffer(buffer_size, overflow, name=i) for i in range(len(targets))]
+    if stats is not None:
+        stats.extend(buffer.stats for buffer in buffers)
+    errors = []
+    threads = [threading.Thread(target=_drain_buffer, args=(buffer, target, errors), daemon=True)
+               for buffer, target in zip(buffers, targets)]
+    for thread in threads:
+        thread.start()
+
+    def finish(error=None):
+        for buffer in buffers:
+            buffer.finish(error)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    try:
+        while True:
+            try:
+                item = (yield)
+            except Exception as e:
+                # Thrown into the broadcast: throw it into each target after its buffered items
+                finish(e)
+                raise e
+            if errors:
+                # A target failed: throw its exception into the other targets
+                finish(errors[0])
+            for buffer in buffers:
+                buffer.put(item)
+    except GeneratorExit:
+        finish()
+
+
+@pipefilter
+def batch(size, target):
+    """Filter: group items into lists of up to ``size`` items
+
+    Filters downstream of this element (up to an :py:func:`unbatch`) are run in batch mode.
+    """
+
+    items = []
+    try:
+        while True:
+            items.append((yield))
+            if len(items) >= size:
+                target.send(items)
+                items = []
+    except GeneratorExit:
+        if items:
+            target.send(items)
+
+
+@pipefilter
+def unbatch(target):
+    """Filter: send each item of incoming lists on separately, undoing :py:func:`batch`"""
+
+    while True:
+        for item in (yield):
+            target.send(item)
+
+
+_batch_function = inspect.unwrap(batch)
+_unbatch_function = inspect.unwrap(unbatch)
+
+
+@pipefilter
+def per_item(stage, target=None):
+    """Adapter: run a per-item filter on each item of incoming lists
+
+    Items the filter sends on are collected and sent to the target as a list after each
+    incoming list. This adapter is applied automatically to filters in the batched section of a
+    pipeline.
+
+    :param stage: a pipeline element (or pipeline) expecting one item per ``send``
+    """
+
+    output = []
+    if _accepts(stage, "target") or isinstance(stage, Pipe):
+        inner = stage.resolve(appender(output))
+    else:
+        inner = stage.resolve()
+
+    try:
+        while True:
+            for item in (yield):
+                inner.send(item)
+            if output:
+                if target is not None:
+                    target.send(output[:])
+                del output[:]
+    except GeneratorExit:
+        inner.close()
+        if output and target is not None:
+            target.send(output[:])
+
+
+_per_item_function = inspect.unwrap(per_item)
+
+
+def _map_rows(row_function, batched, target):
+    """Generator body for filters applying a function to each row (or each row of a batch)"""
+
+    if batched:
+        while True:
+            rows = (yield)
+            target.send([row_function(row) for row in rows])
+    else:
+        while True:
+            target.send(row_function((yield)))
+
+
+def _key_function(key):
+    """Return a function getting a key from a row: the value of a field, or a tuple of the values
+    of a list of fields, with None for missing fields (or None for every row, if ``key`` is None)
+    """
+
+    if key is None:
+        return lambda row: None
+    elif isinstance(key, (list, tuple)):
+        names = tuple(key)
+        return lambda row: tuple(row.get(name) for name in names)
+    return lambda row: row.get(key)
+
 
 @pipefilter
 def printer(prefix="", target=None):
@@ -460,15 +1147,17 @@ def printer(prefix="", target=None):
 
 
 @pipefilter
-def appender(output, target=None):
+def appender(output, batched=False, target=None):
     """Sink: append items to a list
 
     :param output: a list to append items to
+    :param batched: if set to True, incoming items are lists, each of which extends the output
     """
 
+    add = output.extend if batched else output.append
     while True:
         item = (yield)
-        output.append(item)
+        add(item)
         if target is not None:
             target.send(item)
 
@@ -481,25 +1170,24 @@ def null():
         _ = (yield)
 
 
-@pipefilter
-def project(keys, target=None):
-    """Projection operator - restrict attributes to those specified in the ``keys`` argument"""
-
-    while True:
-        data = (yield)
-        target.send({k: v for k, v in data.items() if k in keys})
+def _project_row(keys):
+    def project_row(data):
+        return {k: v for k, v in data.items() if k in keys}
+    return schema_function(project_row)
 
 
 @pipefilter
-def rename(*renames, quiet=False, target=None):
-    """Rename operators - parallel attribute rename
+def project(keys, batched=False, target=None):
+    """Projection operator - restrict attributes to those specified in the ``keys`` argument
 
-    :param renames: list of (old_name, new_name) pairs
-    :param quiet: if set to True, don't log warnings when renames fail due to missing keys
+    :param batched: if set to True, incoming items are lists of rows
     """
 
-    while True:
-        data = (yield)
+    yield from _map_rows(_project_row(keys), batched, target)
+
+
+def _rename_row(*renames, quiet=False):
+    def rename_row(data):
         for old_name, new_name in renames:
             try:
                 data[new_name] = data.pop(old_name)
@@ -507,22 +1195,26 @@ def rename(*renames, quiet=False, target=None):
                 if not quiet:
                     _log.warning("Failed to rename %s->%s. Failing row contains: %s" % (
                                     old_name, new_name, data))
-        target.send(data)
+        return data
+    return schema_function(rename_row, in_place=True)
 
 
 @pipefilter
-def rename_regexp(*renames, quiet=False, target=None):
-    """Rename operators with regular expressions - parallel attribute rename
+def rename(*renames, quiet=False, batched=False, target=None):
+    """Rename operators - parallel attribute rename
 
     :param renames: list of (old_name, new_name) pairs
     :param quiet: if set to True, don't log warnings when renames fail due to missing keys
+    :param batched: if set to True, incoming items are lists of rows
     """
 
-    compiled_renames = [(re.compile(regexp), substitution) for regexp, substitution in renames]
+    yield from _map_rows(_rename_row(*renames, quiet=quiet), batched, target)
 
-    while True:
-        data = (yield)
 
+def _rename_regexp_row(*renames, quiet=False):
+    compiled_renames = [(re.compile(regexp), substitution) for regexp, substitution in renames]
+
+    def rename_regexp_row(data):
         pending_renames = {}
         for regexp, substitution in compiled_renames:
             for key in data:
@@ -542,60 +1234,169 @@ def rename_regexp(*renames, quiet=False, target=None):
                 new_data.pop(old_name)
         for key in set(data) - set(pending_renames):
             new_data[key] = data[key]
+        return new_data
+    return schema_function(rename_regexp_row)
+
 
-        target.send(new_data)
+@pipefilter
+def rename_regexp(*renames, quiet=False, batched=False, target=None):
+    """Rename operators with regular expressions - parallel attribute rename
+
+    :param renames: list of (old_name, new_name) pairs
+    :param quiet: if set to True, don't log warnings when renames fail due to missing keys
+    :param batched: if set to True, incoming items are lists of rows
+    """
+
+    yield from _map_rows(_rename_regexp_row(*renames, quiet=quiet), batched, target)
+
+
+def _set_default_row(value, default, default_is_key=False):
+    keys = value if isinstance(value, (list, tuple)) else (value,)
+
+    def set_default_row(data):
+        for key in keys:
+            if data.get(key) is None:
+                if default_is_key:
+                    data[key] = data[default]
+                else:
+                    data[key] = default
+        return data
+    return set_default_row
 
 
 @pipefilter
-def set_default(value, default, default_is_key=False, target=None):
+def set_default(value, default, default_is_key=False, batched=False, target=None):
     """Set the field value to the given default if it doesn't already exist or is None
 
     :param value: the name of a key (or a list / tuple of keys) to set to the default value
     :param default: the default value to set (see `default_is_key`)
     :param default_is_key: if True, default should be a dict mapping key to default value
+    :param batched: if set to True, incoming items are lists of rows
     """
 
-    if isinstance(value, (list, tuple)):
-        while True:
-            data = (yield)
+    yield from _map_rows(_set_default_row(value, default, default_is_key), batched, target)
 
-            for key in value:
-                if data.get(key) is None:
-                    if default_is_key:
-                        data[key] = data[default]
-                    else:
-                        data[key] = default
 
-            target.send(data)
-    else:
-        while True:
-            data = (yield)
+@pipefilter
+def _fused(row_function, batched=False, target=None):
+    """Filter applying the row functions of several merged built-in filters to each row in turn"""
 
-            if data.get(value) is None:
-                if default_is_key:
-                    data[value] = data[default]
-                else:
-                    data[value] = default
+    yield from _map_rows(row_function, batched, target)
 
-            target.send(data)
+
+# Built-in filters which can be merged by Pipe.resolve, mapped to a factory taking the filter's
+# arguments and returning the function the filter applies to each row
+_row_functions = {
+    inspect.unwrap(project): _project_row,
+    inspect.unwrap(rename): _rename_row,
+    inspect.unwrap(rename_regexp): _rename_regexp_row,
+    inspect.unwrap(set_default): _set_default_row,
+}
+
+
+def _pull_batch(items, size):
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _pull_appender(items, output, batched=False):
+    add = output.extend if batched else output.append
+    for item in items:
+        add(item)
+        yield item
+
+
+def _pull_null(items):
+    deque(items, maxlen=0)
+    yield from ()
+
+
+# Built-in filters mapped to their implementation in the pull engine, see _pull_function
+_pull_functions = {
+    inspect.unwrap(batch): _pull_batch,
+    inspect.unwrap(unbatch): chain.from_iterable,
+    inspect.unwrap(appender): _pull_appender,
+    inspect.unwrap(null): _pull_null,
+    inspect.unwrap(_fused): _pull_rows,
+}
+
+
+class _CSVRowReader(csv.DictReader):
+    """:py:class:`csv.DictReader` returning :py:class:`genpipeline.rows.Row` objects"""
+
+    _schema = None
+
+    def __next__(self):
+        if self.line_num == 0:
+            # Read the header
+            self.fieldnames
+        record = next(self.reader)
+        self.line_num = self.reader.line_num
+        while record == []:
+            record = next(self.reader)
+        if self._schema is None:
+            self._schema, self._positions = Schema.from_fields(self.fieldnames)
+            self._width = len(self.fieldnames)
+        width = self._width
+        rest = None
+        if len(record) != width:
+            rest = record[width:]
+            record = record[:width] + [self.restval] * (width - len(record))
+        if self._positions is not None:
+            # Repeated columns keep their last value, as with DictReader
+            record = [record[i] for i in self._positions]
+        row = Row(self._schema, record)
+        if rest:
+            row[self.restkey] = rest
+        return row
 
 
 @pipesource
-def csv_source(file, target=None, **kwargs):
+def csv_source(file, checkpoint=None, row_format="dict", target=None, **kwargs):
     """Pipeline source pushing rows (as dicts) from a file-like object containing CSV data
 
     :py:class:`csv.DictReader` is used to parse the CSV file. Any additional keyword arguments
     passed to this function are passed to the :py:class:`csv.DictReader` constructor.
 
     :param file: a file-like object containing CSV data
+    :param checkpoint: optional :py:class:`genpipeline.checkpoint.Checkpoint` recording the
+        number of rows sent on; a run resumes after the rows of the saved position, and deletes
+        it when complete
+    :param row_format: "dict" to send rows as dicts, or "row" to send rows as
+        :py:class:`genpipeline.rows.Row` objects sharing one schema
     """
 
+    if row_format not in ("dict", "row"):
+        raise ValueError("Unsupported row format: {}".format(row_format))
     try:
-        reader = csv.DictReader(file, **kwargs)
+        reader = (_CSVRowReader if row_format == "row" else csv.DictReader)(file, **kwargs)
+        count = 0
+        if checkpoint is not None:
+            count = checkpoint.start() or 0
+            if count:
+                # Skip the rows already processed without building dicts for them (counting
+                # records as DictReader does, ignoring empty ones)
+                reader.fieldnames
+                skipped = 0
+                for record in reader.reader:
+                    if record:
+                        skipped += 1
+                        if skipped >= count:
+                            break
         for row in reader:
             target.send(row)
+            if checkpoint is not None:
+                count += 1
+                checkpoint.advance(count)
         target.close()
+        if checkpoint is not None:
+            checkpoint.finish()
     except Exception as e:
+        if checkpoint is not None:
+            checkpoint.abandon()
         try:
             target.throw(e)
         except StopIteration:
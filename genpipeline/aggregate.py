@@ -0,0 +1,353 @@
+"""
+Aggregation
+===========
+
+Filters computing aggregates of groups of rows, sending on one row per group::
+
+    >> iter_source(orders) | (group_by("customer_id", {"orders": "count",
+    ..                                                 "total": ("sum", "amount"),
+    ..                                                 "largest": ("max", "amount")})
+    ..                        | appender(results))
+
+Aggregations are given as a dict mapping output field names to an aggregate name, or a tuple of an
+aggregate name and the input field it applies to (which all but ``count`` need). The aggregates
+are:
+
+* ``count``: number of rows, or of rows where the field is not None
+* ``sum``, ``min``, ``max``, ``mean``: of the values of the field which are not None
+* ``first``, ``last``: the value of the field in the first or last row of the group
+
+Only the running state of each aggregate is kept for each group (a total and a count for
+``mean``, for example), never the rows themselves. :py:func:`group_by` keeps every group until the
+stream ends, unless the input is sorted by the key (``presorted=True``), in which case each group
+is sent on as soon as the next one starts.
+
+The window filters aggregate rows by time, using a timestamp field (numbers, or datetimes with a
+timedelta ``size``). :py:func:`tumbling_window` puts each row in one fixed-size window, and
+:py:func:`sliding_window` in each of the overlapping windows of ``size`` starting every ``step``.
+Rows are expected roughly in time order: a window is sent on once a row more than ``lateness``
+past its end arrives, and rows for windows already sent on are dropped, so only recent windows
+are held in memory::
+
+    >> iter_source(events) | (tumbling_window("time", 60, {"events": "count"}, key="page")
+    ..                        | appender(results))
+
+API
+---
+
+.. autofunction:: group_by
+.. autofunction:: tumbling_window
+.. autofunction:: sliding_window
+"""
+
+import datetime
+import logging
+from . import _key_function, pipefilter
+
+_log = logging.getLogger(__name__)
+
+
+class _Count:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        if value is not None:
+            self.value += 1
+
+    def result(self):
+        return self.value
+
+
+class _Sum:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None:
+            self.value = value if self.value is None else self.value + value
+
+    def result(self):
+        return self.value
+
+
+class _Min:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+    def result(self):
+        return self.value
+
+
+class _Max:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+    def result(self):
+        return self.value
+
+
+class _Mean:
+    __slots__ = ("total", "count")
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.total += value
+            self.count += 1
+
+    def result(self):
+        return self.total / self.count if self.count else None
+
+
+class _First:
+    __slots__ = ("value", "empty")
+
+    def __init__(self):
+        self.value = None
+        self.empty = True
+
+    def add(self, value):
+        if self.empty:
+            self.value = value
+            self.empty = False
+
+    def result(self):
+        return self.value
+
+
+class _Last:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+#: Aggregate names mapped to their accumulator classes
+AGGREGATES = {
+    "count": _Count,
+    "sum": _Sum,
+    "min": _Min,
+    "max": _Max,
+    "mean": _Mean,
+    "first": _First,
+    "last": _Last,
+}
+
+#: Aggregates which need a field (rather than keeping whole rows, for ``first`` and ``last``)
+FIELD_AGGREGATES = {"sum", "min", "max", "mean", "first", "last"}
+
+
+class _Aggregations:
+    """Parsed aggregations: creates the accumulators for a group, and adds rows to them"""
+
+    def __init__(self, aggregations):
+        self.names = []
+        self.fields = []
+        self.classes = []
+        for name, aggregation in aggregations.items():
+            function, field = (aggregation, None) if isinstance(aggregation, str) else aggregation
+            try:
+                self.classes.append(AGGREGATES[function])
+            except KeyError:
+                raise ValueError("Unknown aggregate {!r} for {!r}, expected one of {}".format(
+                    function, name, ", ".join(AGGREGATES)))
+            if field is None and function in FIELD_AGGREGATES:
+                raise ValueError("Aggregate {!r} for {!r} needs a field".format(function, name))
+            self.names.append(name)
+            self.fields.append(field)
+
+    def new(self):
+        return [cls() for cls in self.classes]
+
+    def add(self, accumulators, row):
+        for accumulator, field in zip(accumulators, self.fields):
+            accumulator.add(row if field is None else row.get(field))
+
+    def results(self, accumulators):
+        return zip(self.names, (accumulator.result() for accumulator in accumulators))
+
+
+def _key_fields(key, value):
+    """Return the (name, value) pairs of the key fields of an output row"""
+
+    if key is None:
+        return ()
+    elif isinstance(key, (list, tuple)):
+        return zip(key, value)
+    return ((key, value),)
+
+
+@pipefilter
+def group_by(key, aggregations, presorted=False, target=None):
+    """Filter: aggregate rows by key, sending on a row of the key fields and aggregates for each
+    group
+
+    Groups are sent on when the stream ends, in the order they were first seen.
+
+    :param key: field (or list of fields) to group by
+    :param aggregations: dict mapping output field names to aggregations
+    :param presorted: if set to True, the input is sorted by the key, so each group is sent on when
+        the next starts and only one group is held in memory
+    """
+
+    aggregations = _Aggregations(aggregations)
+    get_key = _key_function(key)
+
+    def send(group_key, accumulators):
+        row = dict(_key_fields(key, group_key))
+        row.update(aggregations.results(accumulators))
+        target.send(row)
+
+    if presorted:
+        current_key = None
+        accumulators = None
+        try:
+            while True:
+                row = (yield)
+                row_key = get_key(row)
+                if accumulators is None or row_key != current_key:
+                    if accumulators is not None:
+                        send(current_key, accumulators)
+                    current_key = row_key
+                    accumulators = aggregations.new()
+                aggregations.add(accumulators, row)
+        except GeneratorExit:
+            if accumulators is not None:
+                send(current_key, accumulators)
+    else:
+        groups = {}
+        try:
+            while True:
+                row = (yield)
+                row_key = get_key(row)
+                accumulators = groups.get(row_key)
+                if accumulators is None:
+                    accumulators = groups[row_key] = aggregations.new()
+                aggregations.add(accumulators, row)
+        except GeneratorExit:
+            for group_key, accumulators in groups.items():
+                send(group_key, accumulators)
+
+
+def _origin(timestamp):
+    """Return the time windows are aligned to, for timestamps like the one given"""
+
+    if isinstance(timestamp, datetime.datetime):
+        return datetime.datetime(1970, 1, 1, tzinfo=timestamp.tzinfo)
+    elif isinstance(timestamp, datetime.date):
+        return datetime.date(1970, 1, 1)
+    return 0
+
+
+def _windows(timestamp, size, step, aggregations, key, lateness, target):
+    """Generator body of the window filters: windows of ``size`` starting every ``step``"""
+
+    aggregations = _Aggregations(aggregations)
+    get_key = _key_function(key)
+    # Window start mapped to a dict of group keys mapped to accumulators
+    windows = {}
+    origin = None
+    watermark = None
+    dropped = 0
+
+    def send(start):
+        for group_key, accumulators in windows.pop(start).items():
+            row = {"window_start": start, "window_end": start + size}
+            row.update(_key_fields(key, group_key))
+            row.update(aggregations.results(accumulators))
+            target.send(row)
+
+    try:
+        while True:
+            row = (yield)
+            time = row[timestamp]
+            if origin is None:
+                origin = _origin(time)
+            if watermark is None or time > watermark:
+                watermark = time
+                # Send on the windows which ended before the latest time, less the lateness
+                closed = watermark if lateness is None else watermark - lateness
+                while windows:
+                    start = min(windows)
+                    if start + size > closed:
+                        break
+                    send(start)
+            closed = watermark if lateness is None else watermark - lateness
+
+            row_key = get_key(row)
+            start = time - (time - origin) % step
+            added = False
+            while start + size > time:
+                if start + size > closed:
+                    groups = windows.get(start)
+                    if groups is None:
+                        groups = windows[start] = {}
+                    accumulators = groups.get(row_key)
+                    if accumulators is None:
+                        accumulators = groups[row_key] = aggregations.new()
+                    aggregations.add(accumulators, row)
+                    added = True
+                start -= step
+            if not added:
+                dropped += 1
+    except GeneratorExit:
+        for start in sorted(windows):
+            send(start)
+        if dropped:
+            _log.warning("Dropped %d rows arriving after their windows were sent on", dropped)
+
+
+@pipefilter
+def tumbling_window(timestamp, size, aggregations, key=None, lateness=None, target=None):
+    """Filter: aggregate rows in consecutive windows of time of a fixed size
+
+    Sends on a row for each window and group, with ``window_start`` and ``window_end`` fields,
+    the key fields and the aggregates.
+
+    :param timestamp: name of the field holding the time of each row
+    :param size: length of the windows (a number, or a :py:class:`datetime.timedelta`)
+    :param aggregations: dict mapping output field names to aggregations
+    :param key: optional field (or list of fields) to group by within each window
+    :param lateness: how long after the end of a window rows for it may arrive (after rows for
+        later times); by default windows are sent on as soon as a later row arrives
+    """
+
+    yield from _windows(timestamp, size, size, aggregations, key, lateness, target)
+
+
+@pipefilter
+def sliding_window(timestamp, size, step, aggregations, key=None, lateness=None, target=None):
+    """Filter: aggregate rows in overlapping windows of time, starting every ``step``
+
+    See :py:func:`tumbling_window`; each row is aggregated in every window containing it.
+
+    :param step: time between the starts of consecutive windows
+    """
+
+    yield from _windows(timestamp, size, step, aggregations, key, lateness, target)
@@ -0,0 +1,203 @@
+"""
+Asyncio pipelines
+=================
+
+An asyncio version of the pipeline API, so that one process can overlap many network or database
+waits. Async filters are coroutine functions taking an item (and any other arguments) and
+returning the item to send on. Each async filter runs up to ``concurrency`` calls at the same
+time; results are sent on in the order they complete::
+
+    @async_pipefilter
+    async def fetch(url, session):
+        async with session.get(url) as response:
+            return await response.text()
+
+    await run(async_source(urls) | (fetch(session, concurrency=50) | parse() | appender(pages)))
+
+Ordinary filters (created with :py:func:`genpipeline.pipefilter`) can be used anywhere in an
+async pipeline. They are run on the event loop thread between awaits, so they never run
+concurrently with each other.
+
+Unlike :py:class:`genpipeline.PipeSource`, piping an async source into a pipeline doesn't run it:
+pass the result to :py:func:`run` and await that.
+
+API
+---
+
+.. autofunction:: async_source
+.. autofunction:: async_pipefilter
+.. autofunction:: run
+"""
+
+import asyncio
+import collections
+from functools import wraps
+from . import PipeElement, _adapt_batches, _fuse_elements, _resolve_elements, appender, null
+
+
+_end = object()
+
+
+class AsyncPipeElement(PipeElement):
+    """Pipeline element for an async filter, only usable in pipelines run by :py:func:`run`"""
+
+    def __init__(self, fn, args, kwargs, concurrency=1):
+        super().__init__(fn, args, kwargs)
+        self.concurrency = concurrency
+
+    def __repr__(self):
+        return "AsyncPipeElement(fn={}, args={}, kwargs={}, concurrency={})".format(
+            self.fn, self.args, self.kwargs, self.concurrency)
+
+    def resolve(self, target=None):
+        raise TypeError("Async filter {} can only be run with genpipeline.aio.run".format(
+            self.fn.__name__))
+
+
+class AsyncPipeSource:
+    def __init__(self, values):
+        self.values = values
+
+    def __or__(self, other):
+        return AsyncPipeline(self, other)
+
+
+class AsyncPipeline:
+    """An async source piped into a pipeline, ready to be run with :py:func:`run`"""
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+
+    def __repr__(self):
+        return "AsyncPipeline(source={}, target={})".format(self.source, self.target)
+
+
+def async_source(values):
+    """Async source: push items from an async iterable (or an ordinary iterable) into a pipeline
+    """
+
+    return AsyncPipeSource(values)
+
+
+def async_pipefilter(f):
+    """Decorator creating an async filter from a coroutine function
+
+    The coroutine function is called with each item as its first argument, followed by the
+    arguments given when creating the filter. The ``concurrency`` keyword argument sets the
+    maximum number of calls running at the same time (default 1).
+    """
+
+    @wraps(f)
+    def wrapped(*args, concurrency=1, **kwargs):
+        return AsyncPipeElement(f, args, kwargs, concurrency)
+    return wrapped
+
+
+def _resolve_segment(elements, target):
+    """Resolve a section of a pipeline containing only ordinary filters"""
+
+    if not elements:
+        return target
+    elements, _ = _fuse_elements(_adapt_batches(elements))
+    return _resolve_elements(elements, target)
+
+
+async def _gather(coroutines):
+    """Run coroutines concurrently, cancelling the others if one raises an exception"""
+
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+def _throw(segment, e):
+    try:
+        segment.throw(e)
+    except Exception:
+        pass
+
+
+async def _flush(buffer, queue):
+    while buffer:
+        await queue.put(buffer.popleft())
+
+
+async def _run_source(values, segment, buffer, queue):
+    try:
+        if hasattr(values, "__aiter__"):
+            async for item in values:
+                segment.send(item)
+                await _flush(buffer, queue)
+        else:
+            for item in values:
+                segment.send(item)
+                await _flush(buffer, queue)
+    except Exception as e:
+        _throw(segment, e)
+        raise
+    segment.close()
+    await _flush(buffer, queue)
+    await queue.put(_end)
+
+
+async def _run_stage(element, in_queue, segment, buffer, out_queue):
+    async def worker():
+        while True:
+            item = await in_queue.get()
+            if item is _end:
+                # Put the marker back for the other workers
+                await in_queue.put(_end)
+                return
+            try:
+                segment.send(await element.fn(item, *element.args, **element.kwargs))
+            except Exception as e:
+                _throw(segment, e)
+                raise
+            if out_queue is not None:
+                await _flush(buffer, out_queue)
+
+    await _gather(worker() for _ in range(element.concurrency))
+    segment.close()
+    if out_queue is not None:
+        await _flush(buffer, out_queue)
+        await out_queue.put(_end)
+
+
+async def run(pipeline):
+    """Run an async pipeline (an :py:func:`async_source` piped into a pipeline)
+
+    Any exception raised by the source or a filter is thrown into the pipeline downstream of it,
+    the remaining tasks are cancelled and the exception is raised.
+    """
+
+    segments = [[]]
+    stages = []
+    for element in pipeline.target.elements():
+        if isinstance(element, AsyncPipeElement):
+            stages.append(element)
+            segments.append([])
+        else:
+            segments[-1].append(element)
+
+    if not stages:
+        segment = _resolve_segment(segments[0], None) or null().resolve()
+        await _run_source(pipeline.source.values, segment, collections.deque(), asyncio.Queue())
+        return
+
+    # Each async stage reads from a queue fed by the section of the pipeline before it
+    queues = [asyncio.Queue(maxsize=2 * stage.concurrency) for stage in stages]
+    buffers = [collections.deque() for _ in segments]
+    resolved = [_resolve_segment(elements, appender(buffer).resolve())
+                for elements, buffer in zip(segments[:-1], buffers)]
+    resolved.append(_resolve_segment(segments[-1], None) or null().resolve())
+
+    coroutines = [_run_source(pipeline.source.values, resolved[0], buffers[0], queues[0])]
+    for i, stage in enumerate(stages):
+        out_queue = queues[i + 1] if i + 1 < len(stages) else None
+        coroutines.append(_run_stage(stage, queues[i], resolved[i + 1], buffers[i + 1], out_queue))
+    await _gather(coroutines)
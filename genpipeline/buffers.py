@@ -0,0 +1,385 @@
+"""
+Buffers
+=======
+
+Bounded buffers between a producer and a consumer running in different threads, used by
+:py:func:`genpipeline.broadcast` to decouple its branches::
+
+    >> stats = []
+    >> iter_source(rows) | broadcast(inserter(conn, "t", columns), counter(),
+    ..                               buffer_size=10000, overflow="spill", stats=stats)
+    >> for branch in stats:
+    ..     print(branch)
+
+When a buffer is full, its overflow policy applies:
+
+* ``"block"``: the producer waits until the consumer takes an item
+* ``"drop_oldest"``: the oldest item in the buffer is discarded
+* ``"spill"``: items are written to a temporary file, and read back in order once the items in
+  memory have been consumed
+
+The :py:class:`BufferStats` of a buffer show how full it is and how long the producer waited for
+it, which shows which of several consumers is holding the producer up.
+
+Spilling to Disk
+----------------
+
+A :py:class:`SpillBuffer` is a FIFO queue holding items in memory up to a size limit, beyond which
+items are pickled to a temporary file and read back as a stream as the queue is drained. It is the
+storage for stages which hold more data than fits in memory. The :py:func:`spill_buffer` filter
+uses one to hold all the items of a stream until the stream ends, for example to let a source
+finish reading before a slow sink starts::
+
+    >> csv_source(f) | (spill_buffer(256 * 1024 * 1024) | inserter(conn, "t", columns))
+
+API
+---
+
+.. autoclass:: BoundedBuffer
+    :members:
+.. autoclass:: SpillBuffer
+    :members:
+.. autofunction:: spill_buffer
+.. autoclass:: BufferStats
+    :members:
+"""
+
+import collections
+import pickle
+import struct
+import sys
+import tempfile
+import threading
+import time
+from . import pipefilter
+from .rows import Row
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+_length = struct.Struct("<I")
+
+
+class BufferStats:
+    """Counters for a :py:class:`BoundedBuffer`, updated as items pass through it
+
+    :ivar name: name of the buffer (for a broadcast, the index of the branch)
+    :ivar maxsize: number of items the buffer holds in memory
+    :ivar overflow: the overflow policy
+    :ivar puts: number of items put in the buffer
+    :ivar gets: number of items taken from the buffer
+    :ivar dropped: number of items discarded by the "drop_oldest" policy
+    :ivar spilled: number of items written to disk by the "spill" policy
+    :ivar occupancy: number of items currently in the buffer (in memory or spilled)
+    :ivar max_occupancy: largest value of ``occupancy`` seen
+    :ivar blocked_time: total time the producer spent waiting for space, in seconds
+    """
+
+    def __init__(self, name=None, maxsize=0, overflow="block"):
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.puts = 0
+        self.gets = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.occupancy = 0
+        self.max_occupancy = 0
+        self.blocked_time = 0.0
+
+    def __repr__(self):
+        return ("BufferStats(name={!r}, occupancy={}/{}, max_occupancy={}, puts={}, gets={}, "
+                "dropped={}, spilled={}, blocked_time={:.3f})".format(
+                    self.name, self.occupancy, self.maxsize, self.max_occupancy, self.puts,
+                    self.gets, self.dropped, self.spilled, self.blocked_time))
+
+    @property
+    def fill(self):
+        """Fraction of the in-memory capacity currently used (above 1 when items are spilled)"""
+
+        return self.occupancy / self.maxsize if self.maxsize else 0.0
+
+    def as_dict(self):
+        """Return the stats as a dict"""
+
+        return {
+            "name": self.name,
+            "maxsize": self.maxsize,
+            "overflow": self.overflow,
+            "puts": self.puts,
+            "gets": self.gets,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "occupancy": self.occupancy,
+            "max_occupancy": self.max_occupancy,
+            "blocked_time": self.blocked_time,
+        }
+
+
+class BoundedBuffer:
+    """A FIFO buffer holding up to ``maxsize`` items in memory, with an overflow policy
+
+    The producer calls :py:meth:`put` for each item and :py:meth:`finish` at the end; the consumer
+    iterates over the buffer, which stops when the buffer is finished and empty.
+
+    :param maxsize: number of items held in memory
+    :param overflow: "block", "drop_oldest" or "spill"
+    :param name: name recorded in the stats
+    :param stats: :py:class:`BufferStats` to update; by default a new one is created
+    """
+
+    def __init__(self, maxsize, overflow="block", name=None, stats=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}, not {!r}".format(
+                ", ".join(OVERFLOW_POLICIES), overflow))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.stats = stats if stats is not None else BufferStats()
+        self.stats.name = name
+        self.stats.maxsize = maxsize
+        self.stats.overflow = overflow
+        #: Exception passed to :py:meth:`finish`, if any
+        self.error = None
+        self._items = collections.deque()
+        # Items over maxsize with the "spill" policy, all kept on disk
+        self._spilled = SpillBuffer(0)
+        self._finished = False
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def __repr__(self):
+        return "BoundedBuffer(maxsize={}, overflow={!r}, stats={})".format(
+            self.maxsize, self.overflow, self.stats)
+
+    def __len__(self):
+        return len(self._items) + len(self._spilled)
+
+    def __iter__(self):
+        while True:
+            with self._not_empty:
+                while not self._items and not self._spilled and not self._finished:
+                    self._not_empty.wait()
+                if self._items:
+                    item = self._items.popleft()
+                elif self._spilled:
+                    item = self._spilled.popleft()
+                else:
+                    return
+                self.stats.gets += 1
+                self.stats.occupancy = len(self)
+                self._not_full.notify()
+            yield item
+
+    def put(self, item):
+        """Add an item, applying the overflow policy if the buffer is full
+
+        Items put after the consumer has called :py:meth:`close` are discarded.
+        """
+
+        stats = self.stats
+        with self._not_full:
+            if self._closed:
+                return
+            if self._spilled or len(self._items) >= self.maxsize:
+                if self.overflow == "block":
+                    start = time.perf_counter()
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._not_full.wait()
+                    stats.blocked_time += time.perf_counter() - start
+                    if self._closed:
+                        return
+                    self._items.append(item)
+                elif self.overflow == "drop_oldest":
+                    self._items.popleft()
+                    self._items.append(item)
+                    stats.dropped += 1
+                else:
+                    # Once items are spilled, later items are too so that order is kept
+                    self._spilled.append(item)
+                    stats.spilled += 1
+            else:
+                self._items.append(item)
+            stats.puts += 1
+            stats.occupancy = len(self)
+            if stats.occupancy > stats.max_occupancy:
+                stats.max_occupancy = stats.occupancy
+            self._not_empty.notify()
+
+    def finish(self, error=None):
+        """Mark the end of the items (producer side)
+
+        :param error: an exception to record as the ``error`` attribute, for the consumer to
+            handle after the remaining items
+        """
+
+        with self._lock:
+            self.error = error
+            self._finished = True
+            self._not_empty.notify_all()
+
+    def close(self):
+        """Stop accepting items (consumer side), releasing a producer waiting for space"""
+
+        with self._lock:
+            self._closed = True
+            self._items.clear()
+            self._spilled.close()
+            self.stats.occupancy = 0
+            self._not_full.notify_all()
+
+
+def _estimate_size(item):
+    """Estimate the memory used by an item: its own size, and that of its direct contents"""
+
+    size = sys.getsizeof(item)
+    if isinstance(item, Row):
+        # The schema is shared with other rows
+        item = item._values
+        size += sys.getsizeof(item)
+    if isinstance(item, dict):
+        for key, value in item.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    elif isinstance(item, (list, tuple)):
+        for value in item:
+            size += sys.getsizeof(value)
+    return size
+
+
+class SpillBuffer:
+    """A FIFO queue keeping items in memory up to a size limit, and the rest in a temporary file
+
+    Once items have been spilled, later items are spilled too until the file has been read back,
+    so that items come out in the order they were added. Items written to the file must be
+    picklable; they are stored as length-prefixed pickles.
+
+    The size of items in memory is estimated with :py:func:`sys.getsizeof` (of the item and of
+    the keys and values of a dict, or the items of a list, tuple or
+    :py:class:`genpipeline.rows.Row`).
+
+    :param max_memory_bytes: estimated size of the items to keep in memory, in bytes
+    :param path: directory for the temporary file; by default the system's temporary directory
+    """
+
+    def __init__(self, max_memory_bytes, path=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.path = path
+        #: Estimated size of the items in memory, in bytes
+        self.memory_bytes = 0
+        #: Number of items written to disk so far
+        self.spilled = 0
+        self._items = collections.deque()
+        self._file = None
+        self._file_count = 0
+        self._read_position = 0
+        self._writing = True
+
+    def __repr__(self):
+        return "SpillBuffer(max_memory_bytes={}, items={}, on_disk={})".format(
+            self.max_memory_bytes, len(self), self._file_count)
+
+    def __len__(self):
+        return len(self._items) + self._file_count
+
+    def __bool__(self):
+        return bool(self._items) or self._file_count > 0
+
+    def __iter__(self):
+        """Remove and yield items until the buffer is empty"""
+
+        while self:
+            yield self.popleft()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, item):
+        """Add an item to the end of the queue"""
+
+        if not self._file_count:
+            size = _estimate_size(item)
+            if self.memory_bytes + size <= self.max_memory_bytes:
+                self._items.append((item, size))
+                self.memory_bytes += size
+                return
+        self._write(item)
+
+    def popleft(self):
+        """Remove and return the item at the start of the queue
+
+        :raises IndexError: if the queue is empty
+        """
+
+        if self._items:
+            item, size = self._items.popleft()
+            self.memory_bytes -= size
+            return item
+        if not self._file_count:
+            raise IndexError("pop from an empty SpillBuffer")
+        return self._read()
+
+    def close(self):
+        """Discard all items, deleting the temporary file"""
+
+        self._items.clear()
+        self.memory_bytes = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._file_count = 0
+        self._read_position = 0
+
+    def _write(self, item):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.path)
+            self._writing = True
+        elif not self._writing:
+            self._read_position = self._file.tell()
+            self._file.seek(0, 2)
+            self._writing = True
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        self._file.write(_length.pack(len(data)))
+        self._file.write(data)
+        self._file_count += 1
+        self.spilled += 1
+
+    def _read(self):
+        spill_file = self._file
+        if self._writing:
+            spill_file.seek(self._read_position)
+            self._writing = False
+        size, = _length.unpack(spill_file.read(_length.size))
+        item = pickle.loads(spill_file.read(size))
+        self._file_count -= 1
+        if not self._file_count:
+            # Everything on disk has been read back: reuse the file from the start
+            spill_file.seek(0)
+            spill_file.truncate()
+            self._read_position = 0
+            self._writing = True
+        return item
+
+
+@pipefilter
+def spill_buffer(max_memory_bytes, path=None, target=None):
+    """Filter: hold all items until the stream ends, then send them on in order
+
+    Items beyond ``max_memory_bytes`` are kept on disk, see :py:class:`SpillBuffer`.
+
+    :param max_memory_bytes: estimated size of the items to keep in memory, in bytes
+    :param path: directory for the temporary file
+    """
+
+    with SpillBuffer(max_memory_bytes, path) as buffer:
+        try:
+            while True:
+                buffer.append((yield))
+        except GeneratorExit:
+            if target is not None:
+                for item in buffer:
+                    target.send(item)
@@ -0,0 +1,347 @@
+"""
+Caching
+=======
+
+Filters that compute the same outputs again for repeated items (geocoding an address, parsing a
+recurring string) can be wrapped so that the computation is skipped for an item seen before, and
+what it computed the first time is used again::
+
+    >> @cached_pipefilter(key=lambda row: row["address"], maxsize=100000)
+    .. def geocode(target):
+    ..     while True:
+    ..         row = (yield)
+    ..         row["location"] = lookup_location(row["address"])
+    ..         target.send(row)
+
+    >> iter_source(rows) | (geocode() | appender(results))
+    >> geocode.cache_info()
+    CacheInfo(hits=9120, misses=880, evictions=0, expirations=0, maxsize=100000, currsize=880)
+
+:py:func:`memoize` wraps a single stage (or pipeline) in the same way. The wrapped filter must send
+on the same outputs whenever it is sent an item with the same key, regardless of what it was sent
+before. For rows (dicts, or other mappings), only the fields the filter added, changed or removed
+are cached, and for a row with a cached key they are applied to a copy of that row, so its other
+fields are kept: above, each row gets the location of its address and keeps its own ``id``. Other
+outputs are cached as they are, and sent on again in place of the outputs for later items with the
+same key. Cached values are copied (:py:func:`copy.copy`) when they are cached and again each time
+they are sent on, so that downstream filters changing rows do not change the cache.
+
+The cache keeps the ``maxsize`` most recently used keys, and with ``ttl`` set, entries expire after
+that many seconds. A persistent backend (:py:class:`SQLiteBackend` or :py:class:`DBMBackend`) keeps
+entries across runs: keys not held in memory are looked up in it. Keys and outputs stored in a
+backend must be picklable.
+
+API
+---
+
+.. autofunction:: cached_pipefilter
+.. autofunction:: memoize
+.. autoclass:: Cache
+    :members:
+.. autoclass:: SQLiteBackend
+.. autoclass:: DBMBackend
+"""
+
+import collections
+import dbm
+import pickle
+import sqlite3
+import time
+from collections.abc import Mapping
+from copy import copy
+from functools import wraps
+from . import Pipe, _accepts, appender, pipefilter
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "evictions", "expirations", "maxsize", "currsize"])
+
+_MISSING = object()
+
+# The fields a filter changed in a row, cached in place of the row it sent on
+_Changes = collections.namedtuple("_Changes", ["changed", "removed"])
+
+
+class SQLiteBackend:
+    """Persistent cache storage in an SQLite database
+
+    :param path: path of the database file
+    :param table: name of the table holding the cache
+    :param commit_every: number of writes between commits
+    """
+
+    def __init__(self, path, table="cache", commit_every=1000):
+        self._connection = sqlite3.connect(path)
+        self._table = table
+        self._commit_every = commit_every
+        self._pending = 0
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS {} (key BLOB PRIMARY KEY, expires REAL, value BLOB)"
+            .format(table))
+
+    def get(self, key):
+        row = self._connection.execute(
+            "SELECT expires, value FROM {} WHERE key = ?".format(self._table),
+            (pickle.dumps(key, pickle.HIGHEST_PROTOCOL),)).fetchone()
+        return None if row is None else (row[0], pickle.loads(row[1]))
+
+    def set(self, key, expires, value):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO {} VALUES (?, ?, ?)".format(self._table),
+            (pickle.dumps(key, pickle.HIGHEST_PROTOCOL), expires,
+             pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+        self._pending += 1
+        if self._pending >= self._commit_every:
+            self.flush()
+
+    def delete(self, key):
+        self._connection.execute("DELETE FROM {} WHERE key = ?".format(self._table),
+                                 (pickle.dumps(key, pickle.HIGHEST_PROTOCOL),))
+
+    def clear(self):
+        self._connection.execute("DELETE FROM {}".format(self._table))
+        self.flush()
+
+    def flush(self):
+        self._connection.commit()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+
+class DBMBackend:
+    """Persistent cache storage in a :py:mod:`dbm` database
+
+    :param path: path of the database file
+    """
+
+    def __init__(self, path):
+        self._db = dbm.open(path, "c")
+
+    def get(self, key):
+        value = self._db.get(pickle.dumps(key, pickle.HIGHEST_PROTOCOL))
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, expires, value):
+        self._db[pickle.dumps(key, pickle.HIGHEST_PROTOCOL)] = pickle.dumps(
+            (expires, value), pickle.HIGHEST_PROTOCOL)
+
+    def delete(self, key):
+        try:
+            del self._db[pickle.dumps(key, pickle.HIGHEST_PROTOCOL)]
+        except KeyError:
+            pass
+
+    def clear(self):
+        for key in list(self._db.keys()):
+            del self._db[key]
+
+    def flush(self):
+        sync = getattr(self._db, "sync", None)
+        if sync is not None:
+            sync()
+
+    def close(self):
+        self._db.close()
+
+
+class Cache:
+    """Least recently used cache with optional expiry and persistent backend
+
+    :param maxsize: number of entries held in memory
+    :param ttl: if set, entries expire this many seconds after they were stored
+    :param backend: optional :py:class:`SQLiteBackend` or :py:class:`DBMBackend`
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Keys mapped to (expiry time, value), least recently used first
+        self._entries = collections.OrderedDict()
+
+    def __repr__(self):
+        return "Cache({})".format(self.cache_info())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the value for a key, or ``default`` if it is not cached or has expired"""
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None:
+                self._store(key, entry)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires, value = entry
+        if expires is not None and expires <= time.time():
+            del self._entries[key]
+            if self.backend is not None:
+                self.backend.delete(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store the value for a key"""
+
+        entry = (time.time() + self.ttl if self.ttl is not None else None, value)
+        self._store(key, entry)
+        if self.backend is not None:
+            self.backend.set(key, *entry)
+
+    def _store(self, key, entry):
+        entries = self._entries
+        entries[key] = entry
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def cache_info(self):
+        """Return a named tuple of hits, misses, evictions, expirations, maxsize and currsize"""
+
+        return CacheInfo(self.hits, self.misses, self.evictions, self.expirations, self.maxsize,
+                         len(self._entries))
+
+    def clear(self):
+        """Remove all entries (including those in the backend) and reset the counters"""
+
+        self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def flush(self):
+        """Write pending changes to the backend"""
+
+        if self.backend is not None:
+            self.backend.flush()
+
+    def close(self):
+        """Close the backend"""
+
+        if self.backend is not None:
+            self.backend.close()
+
+
+def _default_key(item):
+    # Rows are keyed by their fields and values
+    if isinstance(item, Mapping):
+        return tuple(item.items())
+    return item
+
+
+def _cached_output(item, output):
+    """Return what to cache for an output of the stage, given a copy of the item sent to it"""
+
+    if isinstance(item, Mapping) and isinstance(output, Mapping):
+        # Values which weren't changed are still the same objects as in the copy of the item
+        changed = {name: value for name, value in output.items()
+                   if name not in item or item[name] is not value}
+        return _Changes(changed, tuple(name for name in item if name not in output))
+    return copy(output)
+
+
+def _cached_result(item, cached):
+    """Return the output for an item from what was cached"""
+
+    if isinstance(cached, _Changes):
+        output = copy(item)
+        output.update(cached.changed)
+        for name in cached.removed:
+            del output[name]
+        return output
+    return copy(cached)
+
+
+@pipefilter
+def memoize(stage, key=None, maxsize=1024, ttl=None, backend=None, cache=None, target=None):
+    """Filter: run a stage only for items whose key is not cached, sending on its cached outputs
+    for the others
+
+    :param stage: a pipeline element (or pipeline) sending on the same outputs for items with the
+        same key
+    :param key: function of an item returning its cache key; by default the item itself, or for
+        rows, a tuple of their fields and values (which must be hashable)
+    :param maxsize: number of entries held in memory
+    :param ttl: if set, entries expire this many seconds after they were stored
+    :param backend: optional persistent backend, see :py:class:`Cache`
+    :param cache: a :py:class:`Cache` to use instead of creating one from the arguments above
+    """
+
+    if cache is None:
+        cache = Cache(maxsize, ttl, backend)
+    if key is None:
+        key = _default_key
+    output = []
+    if _accepts(stage, "target") or isinstance(stage, Pipe):
+        inner = stage.resolve(appender(output))
+    else:
+        inner = stage.resolve()
+
+    try:
+        while True:
+            item = (yield)
+            item_key = key(item)
+            cached = cache.get(item_key, _MISSING)
+            if cached is _MISSING:
+                # The stage may change the item, so compare its outputs with a copy
+                original = copy(item) if isinstance(item, Mapping) else item
+                inner.send(item)
+                outputs = output[:]
+                del output[:]
+                cache.set(item_key, [_cached_output(original, value) for value in outputs])
+            else:
+                outputs = [_cached_result(item, value) for value in cached]
+            if target is not None:
+                for value in outputs:
+                    target.send(value)
+    except GeneratorExit:
+        inner.close()
+        cache.flush()
+        if target is not None:
+            for value in output:
+                target.send(value)
+
+
+def cached_pipefilter(key=None, maxsize=1024, ttl=None, backend=None):
+    """Decorator creating a filter like :py:func:`genpipeline.pipefilter`, whose outputs are
+    cached by :py:func:`memoize`
+
+    The cache is shared by every stage created by the decorated function (so the outputs must
+    not depend on the stage's arguments), and the decorated function gets ``cache``,
+    ``cache_info`` and ``cache_clear`` attributes like :py:func:`functools.lru_cache`.
+
+    See :py:func:`memoize` for the arguments.
+    """
+
+    def decorator(f):
+        cache = Cache(maxsize, ttl, backend)
+        factory = pipefilter(f)
+
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            element = memoize(factory(*args, **kwargs), key=key, cache=cache)
+            element.name = f.__name__
+            return element
+
+        wrapped.cache = cache
+        wrapped.cache_info = cache.cache_info
+        wrapped.cache_clear = cache.clear
+        return wrapped
+    return decorator
@@ -0,0 +1,240 @@
+"""
+Checkpoints
+===========
+
+A :py:class:`Checkpoint` lets a long-running pipeline resume where it stopped when it is run again
+after failing. The source records its position (row number, or last value of a column) as it
+sends rows on, and every ``every`` rows the sinks sharing the checkpoint commit what they have
+written before the position is saved to the checkpoint store::
+
+    >> checkpoint = Checkpoint(FileCheckpointStore("load.checkpoint"), "orders.csv", every=10000)
+    >> with open("orders.csv", newline="") as f:
+    ..     csv_source(f, checkpoint=checkpoint) | (
+    ..         rename(("id", "order_id"))
+    ..         | inserter(conn, "orders", columns, method="executemany", checkpoint=checkpoint))
+
+If the run fails, running it again skips the rows up to the saved position. When a run completes,
+the checkpoint of :py:func:`genpipeline.csv_source` is deleted, so the next run starts from the
+beginning.
+
+Incremental extracts keep their checkpoint when they complete: with ``checkpoint_column``,
+:py:func:`genpipeline.db.run_sqlalchemy` saves the largest value of the column sent on, and each
+run selects only the rows with a larger value::
+
+    >> query = sqlalchemy.select(events)
+    >> run_sqlalchemy(engine, query, checkpoint=checkpoint, checkpoint_column="id") | sink
+
+Filters between the source and the sinks must send each row on before the source sends the next
+(rather than holding rows back, as :py:func:`genpipeline.batch`,
+:py:func:`genpipeline.sorting.sort` or an :py:func:`genpipeline.iter_filter` run by the push
+engine do), otherwise rows held back when a checkpoint is saved are skipped on resume.
+
+Checkpoint stores hold a position (JSON values, dates and datetimes) per key. Other stores can be
+used in their place by implementing ``load``, ``save`` and ``delete``.
+
+API
+---
+
+.. autoclass:: Checkpoint
+    :members:
+.. autoclass:: FileCheckpointStore
+.. autoclass:: SQLiteCheckpointStore
+"""
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+
+_log = logging.getLogger(__name__)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    elif isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    raise TypeError("Can't store {!r} in a checkpoint".format(value))
+
+
+def _decode(value):
+    if "__datetime__" in value:
+        return datetime.datetime.fromisoformat(value["__datetime__"])
+    elif "__date__" in value:
+        return datetime.date.fromisoformat(value["__date__"])
+    return value
+
+
+def _dumps(position):
+    return json.dumps(position, default=_encode)
+
+
+def _loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+class FileCheckpointStore:
+    """Checkpoint store keeping positions in a JSON file, replaced atomically on each save
+
+    :param path: path of the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return _loads(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, positions):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(_dumps(positions))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def load(self, key):
+        return self._read().get(key)
+
+    def save(self, key, position):
+        positions = self._read()
+        positions[key] = position
+        self._write(positions)
+
+    def delete(self, key):
+        positions = self._read()
+        if positions.pop(key, None) is not None:
+            self._write(positions)
+
+
+class SQLiteCheckpointStore:
+    """Checkpoint store keeping positions in a table of an SQLite database
+
+    :param path: path of the database file
+    :param table: name of the table
+    """
+
+    def __init__(self, path, table="checkpoints"):
+        self._connection = sqlite3.connect(path)
+        self._table = table
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, position TEXT)"
+                .format(table))
+
+    def load(self, key):
+        row = self._connection.execute(
+            "SELECT position FROM {} WHERE key = ?".format(self._table), (key,)).fetchone()
+        return None if row is None else _loads(row[0])
+
+    def save(self, key, position):
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO {} VALUES (?, ?)".format(self._table),
+                (key, _dumps(position)))
+
+    def delete(self, key):
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM {} WHERE key = ?".format(self._table), (key,))
+
+    def close(self):
+        self._connection.close()
+
+
+class Checkpoint:
+    """Position of a source in a pipeline run, saved periodically so that a rerun can resume
+
+    Sources taking a ``checkpoint`` argument call :py:meth:`start`, :py:meth:`advance` for each
+    row sent on, and :py:meth:`finish` (or :py:meth:`abandon`); sinks taking one call
+    :py:meth:`register` to commit in step with the saved positions.
+
+    :param store: checkpoint store, such as :py:class:`FileCheckpointStore`
+    :param key: name of the position in the store
+    :param every: number of rows between saves
+    """
+
+    def __init__(self, store, key, every=10000):
+        self.store = store
+        self.key = key
+        self.every = every
+        #: Position of the last row sent on (or loaded by :py:meth:`start`)
+        self.position = None
+        self._callbacks = []
+        self._count = 0
+        self._deferred = False
+
+    def __repr__(self):
+        return "Checkpoint(key={!r}, position={!r})".format(self.key, self.position)
+
+    def register(self, callback):
+        """Add a function to be called before each save, to commit the rows written so far"""
+
+        self._callbacks.append(callback)
+
+    def defer(self):
+        """Save only when the run finishes, for sinks which can't commit part way"""
+
+        self._deferred = True
+
+    def start(self):
+        """Return the saved position to resume from, or None"""
+
+        self.position = self.store.load(self.key)
+        self._count = 0
+        if self.position is not None:
+            _log.info("Resuming %s from checkpoint %r", self.key, self.position)
+        return self.position
+
+    def advance(self, position):
+        """Record the position of a row which has been sent on, saving every ``every`` rows"""
+
+        self.position = position
+        self._count += 1
+        if self._count >= self.every:
+            self.save()
+
+    def save(self):
+        """Commit the registered sinks, then save the current position"""
+
+        self._count = 0
+        if self._deferred:
+            return
+        for callback in self._callbacks:
+            callback()
+        self.store.save(self.key, self.position)
+
+    def finish(self, keep=False):
+        """End a successful run, after the sinks have been closed
+
+        :param keep: if set to True, save the final position for the next run (incremental
+            extracts); otherwise delete it, so that the next run starts from the beginning
+        """
+
+        if keep:
+            if self.position is not None:
+                self.store.save(self.key, self.position)
+        else:
+            self.store.delete(self.key)
+        self._end_run()
+
+    def abandon(self):
+        """End a failed run, leaving the last saved position to resume from"""
+
+        self._end_run()
+
+    def _end_run(self):
+        self._callbacks = []
+        self._count = 0
+        self._deferred = False
@@ -0,0 +1,253 @@
+"""
+Columnar batches
+================
+
+For numeric workloads, a pipeline can pass column-oriented batches of rows rather than a dict per
+row, so that filters can work on a whole column at a time. A :py:class:`RecordBatch` maps column
+names to equal-length columns, which are NumPy arrays when NumPy is installed (or lists).
+
+This module provides columnar versions of the built-in row filters, and converters between rows
+and batches for the boundaries of the columnar section of a pipeline::
+
+    >> iter_source(rows) | (to_batches(10000) | rename(("px", "price"))
+                            | filter_rows(lambda batch: batch["price"] > 100)
+                            | project(["id", "price"]) | to_rows() | appender(results))
+
+The ``columns`` output of :py:func:`genpipeline.fastcsv.csv_batch_source` can be wrapped in a
+:py:class:`RecordBatch` directly.
+
+API
+---
+
+.. autoclass:: RecordBatch
+    :members:
+.. autofunction:: to_batches
+.. autofunction:: to_rows
+.. autofunction:: project
+.. autofunction:: rename
+.. autofunction:: set_default
+.. autofunction:: filter_rows
+"""
+
+import itertools
+import logging
+from . import pipefilter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_log = logging.getLogger(__name__)
+
+
+def _is_array(column):
+    return numpy is not None and isinstance(column, numpy.ndarray)
+
+
+def _missing(column):
+    """Return a mask of the None (or, for floating point arrays, NaN) values of a column"""
+
+    if _is_array(column):
+        if column.dtype.kind == "f":
+            return numpy.isnan(column)
+        return numpy.equal(column, None)
+    return [value is None for value in column]
+
+
+class RecordBatch:
+    """A batch of rows stored as columns
+
+    :param columns: mapping of column names to equal-length columns (NumPy arrays or lists)
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns):
+        self.columns = dict(columns)
+
+    def __repr__(self):
+        return "RecordBatch(columns={}, rows={})".format(list(self.columns), len(self))
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    @property
+    def names(self):
+        """List of column names"""
+
+        return list(self.columns)
+
+    @classmethod
+    def from_rows(cls, rows, names=None, arrays=True):
+        """Create a batch from a sequence of dicts
+
+        :param rows: sequence of dicts
+        :param names: column names; by default the keys of the first row. Missing values are None
+        :param arrays: if set to True (and NumPy is installed), columns are NumPy arrays
+        """
+
+        if names is None:
+            names = list(rows[0]) if rows else []
+        columns = {}
+        for name in names:
+            column = [row.get(name) for row in rows]
+            columns[name] = numpy.array(column) if arrays and numpy is not None else column
+        return cls(columns)
+
+    def to_rows(self):
+        """Return the rows of the batch as a list of dicts"""
+
+        names = list(self.columns)
+        columns = [column.tolist() if _is_array(column) else column
+                   for column in self.columns.values()]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def project(self, keys):
+        """Return a batch restricted to the columns in ``keys``"""
+
+        return RecordBatch((name, column) for name, column in self.columns.items()
+                           if name in keys)
+
+    def rename(self, *renames, quiet=False):
+        """Return a batch with columns renamed (in parallel)
+
+        :param renames: list of (old_name, new_name) pairs
+        :param quiet: if set to True, don't log warnings for missing columns
+        """
+
+        columns = dict(self.columns)
+        renamed = {}
+        for old_name, new_name in renames:
+            try:
+                renamed[new_name] = columns.pop(old_name)
+            except KeyError:
+                if not quiet:
+                    _log.warning("Failed to rename %s->%s. Batch contains columns: %s",
+                                 old_name, new_name, list(self.columns))
+        columns.update(renamed)
+        return RecordBatch(columns)
+
+    def set_default(self, value, default, default_is_key=False):
+        """Return a batch with missing values (None, or NaN in floating point arrays) in the
+        given columns replaced by a default
+
+        :param value: the name of a column (or a list / tuple of columns)
+        :param default: the default value (see ``default_is_key``)
+        :param default_is_key: if True, ``default`` is the name of the column to take values from
+        """
+
+        columns = dict(self.columns)
+        for name in value if isinstance(value, (list, tuple)) else (value,):
+            source = columns[default] if default_is_key else None
+            if name not in columns:
+                if default_is_key:
+                    columns[name] = source.copy() if _is_array(source) else list(source)
+                elif numpy is not None and any(_is_array(c) for c in columns.values()):
+                    columns[name] = numpy.full(len(self), default)
+                else:
+                    columns[name] = [default] * len(self)
+                continue
+
+            column = columns[name]
+            if _is_array(column):
+                columns[name] = numpy.where(_missing(column),
+                                            source if default_is_key else default, column)
+            elif default_is_key:
+                columns[name] = [s if v is None else v for v, s in zip(column, source)]
+            else:
+                columns[name] = [default if v is None else v for v in column]
+        return RecordBatch(columns)
+
+    def filter(self, mask):
+        """Return a batch with the rows for which ``mask`` is true"""
+
+        columns = {}
+        for name, column in self.columns.items():
+            if _is_array(column):
+                columns[name] = column[numpy.asarray(mask, dtype=bool)]
+            else:
+                columns[name] = list(itertools.compress(column, mask))
+        return RecordBatch(columns)
+
+
+@pipefilter
+def to_batches(size, names=None, arrays=True, target=None):
+    """Filter: collect rows (dicts) into :py:class:`RecordBatch` objects of up to ``size`` rows
+
+    See :py:meth:`RecordBatch.from_rows` for the other arguments.
+    """
+
+    rows = []
+    try:
+        while True:
+            rows.append((yield))
+            if len(rows) >= size:
+                target.send(RecordBatch.from_rows(rows, names, arrays))
+                rows = []
+    except GeneratorExit:
+        if rows:
+            target.send(RecordBatch.from_rows(rows, names, arrays))
+
+
+@pipefilter
+def to_rows(target):
+    """Filter: send on each row (as a dict) of incoming :py:class:`RecordBatch` objects"""
+
+    while True:
+        for row in (yield).to_rows():
+            target.send(row)
+
+
+@pipefilter
+def project(keys, target=None):
+    """Columnar projection operator - restrict batches to the columns in ``keys``"""
+
+    while True:
+        target.send((yield).project(keys))
+
+
+@pipefilter
+def rename(*renames, quiet=False, target=None):
+    """Columnar rename operator - parallel column rename
+
+    :param renames: list of (old_name, new_name) pairs
+    :param quiet: if set to True, don't log warnings when renames fail due to missing columns
+    """
+
+    while True:
+        target.send((yield).rename(*renames, quiet=quiet))
+
+
+@pipefilter
+def set_default(value, default, default_is_key=False, target=None):
+    """Columnar version of :py:func:`genpipeline.set_default`
+
+    See :py:meth:`RecordBatch.set_default`.
+    """
+
+    while True:
+        target.send((yield).set_default(value, default, default_is_key))
+
+
+@pipefilter
+def filter_rows(predicate, target=None):
+    """Filter: keep the rows of each batch selected by a vectorised predicate
+
+    :param predicate: function taking a :py:class:`RecordBatch` and returning a boolean mask
+        (NumPy array or sequence) with an entry for each row. Empty batches are not sent on
+    """
+
+    while True:
+        data = (yield)
+        data = data.filter(predicate(data))
+        if len(data):
+            target.send(data)
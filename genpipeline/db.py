@@ -4,21 +4,36 @@ Database pipelines
 
 The CSV handling code using COPY only works with PostgreSQL and requires Psycopg2 >2.5.
 
+Sources and sinks taking a DBAPI connection (or, for :py:func:`upload_csv`, an engine) also
+accept a :py:class:`ConnectionPool`, in which case a connection is checked out of the pool for
+the duration of the pipeline and then returned, rather than opened for each run. SQLAlchemy
+engines already pool their connections.
+
 API
 ---
 
+.. autoclass:: ConnectionPool
+    :members:
 .. autofunction:: run_query
 .. autofunction:: run_sqlalchemy
+.. autofunction:: partitioned_query
+.. autoclass:: PartitionError
 .. autofunction:: inserter
 .. autofunction:: upload_csv
+.. autoclass:: CSVCopyStream
+    :members:
 """
 
 import csv
 import io
 import itertools
 import logging
+import queue
+import threading
+import time
 from . import pipesource, pipefilter, iter_sink
-from contextlib import closing
+from .rows import Row, Schema
+from contextlib import closing, contextmanager
 from sqlalchemy import sql
 
 _log = logging.getLogger(__name__)
@@ -33,31 +48,229 @@ class tabdialect:
     quoting = csv.QUOTE_MINIMAL
 
 
-def execute(connection, query, parameters=None):
+def execute(connection, query, parameters=None, name=None):
     """Execute query on a DBAPI connection and return results
 
     :param connection: DBAPI connection object
     :param query: query string
     :param parameters: optional parameters, passed to cursor.execute method
+    :param name: optional cursor name, creating a named (server-side) cursor for drivers
+        supporting them, such as psycopg2
     """
 
-    cursor = connection.cursor()
+    cursor = connection.cursor() if name is None else connection.cursor(name)
     cursor.execute(query, parameters)
     return cursor
 
 
+class ConnectionPool:
+    """Bounded pool of DBAPI connections, reused across pipeline runs
+
+    Connections are checked for health with a ping query before being reused, and replaced if
+    the check fails. Like SQLAlchemy's reset on return, connections are rolled back when they are
+    returned to the pool (or discarded, if the rollback fails), and after the ping, so that idle
+    connections don't hold a transaction open: work which should be kept must be committed before
+    the connection is returned.
+
+    The pool keeps metrics as attributes: ``checkouts``, ``connections_created``,
+    ``failed_health_checks``, ``in_use``, and ``wait_time`` / ``max_wait`` (total and longest
+    time spent waiting for a connection, in seconds).
+
+    :param connect: function returning a new DBAPI connection (for example
+        ``engine.raw_connection`` or ``functools.partial(psycopg2.connect, dsn)``)
+    :param size: maximum number of connections in use at the same time
+    :param timeout: maximum time to wait for a connection, in seconds, before raising
+        :py:class:`TimeoutError`; by default, wait indefinitely
+    :param ping: query used to check a connection is alive before reuse, or None to disable checks
+    """
+
+    def __init__(self, connect, size=5, timeout=None, ping="SELECT 1"):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping = ping
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connections_created = 0
+        self.failed_health_checks = 0
+        self.in_use = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def __repr__(self):
+        return ("ConnectionPool(size={}, in_use={}, idle={}, checkouts={}, "
+                "connections_created={}, wait_time={:.3f})".format(
+                    self.size, self.in_use, len(self._idle), self.checkouts,
+                    self.connections_created, self.wait_time))
+
+    def _healthy(self, conn):
+        if self.ping is None:
+            return True
+        try:
+            with closing(conn.cursor()) as cursor:
+                cursor.execute(self.ping)
+                cursor.fetchall()
+            # End the transaction the ping started
+            conn.rollback()
+            return True
+        except Exception:
+            _log.warning("Pooled connection failed health check, replacing it", exc_info=True)
+            with self._lock:
+                self.failed_health_checks += 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+                with self._lock:
+                    self.connections_created += 1
+                return conn
+            if self._healthy(conn):
+                return conn
+
+    @contextmanager
+    def connection(self):
+        """Context manager checking a connection out of the pool"""
+
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Timed out waiting for a pooled connection")
+        waited = time.perf_counter() - start
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+
+        reuse = True
+        try:
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            except Exception:
+                reuse = False
+            with self._lock:
+                self.in_use -= 1
+                if reuse:
+                    self._idle.append(conn)
+            if not reuse:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._slots.release()
+
+    def close(self):
+        """Close the idle connections in the pool"""
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+@contextmanager
+def _dbapi_connection(source):
+    """Context manager providing a DBAPI connection from a DBAPI connection, a
+    :py:class:`ConnectionPool` or a SQLAlchemy engine
+    """
+
+    if isinstance(source, ConnectionPool):
+        with source.connection() as conn:
+            yield conn
+    elif hasattr(source, "raw_connection"):
+        with closing(source.raw_connection()) as rawconn:
+            yield getattr(rawconn, "dbapi_connection", None) or rawconn.connection
+    else:
+        yield source
+
+
+def _fetch_batches(result, fetch_size):
+    """Generate lists of up to fetch_size rows from a cursor or result, using fetchmany"""
+
+    while True:
+        rows = result.fetchmany(fetch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def _row_dict(row):
+    # SQLAlchemy 1.4+ rows are tuple-like, with a mapping view
+    return dict(getattr(row, "_mapping", row))
+
+
+_row_formats = {
+    "dict": _row_dict,
+    "tuple": tuple,
+}
+
+
+def _row_converter(row_format):
+    """Return a function converting the rows of one query result to the given format"""
+
+    if row_format != "row":
+        return _row_formats[row_format]
+    schema = None
+    positions = None
+
+    def convert(row):
+        # All the rows of a result share a schema
+        nonlocal schema, positions
+        if schema is None:
+            schema, positions = Schema.from_fields(row._fields)
+        if positions is not None:
+            return Row(schema, [row[i] for i in positions])
+        return Row(schema, list(row))
+    return convert
+
+
 @pipesource
-def run_query(conn, query, params=None, target=None):
+def run_query(conn, query, params=None, fetch_size=None, cursor_name=None, batched=False,
+              target=None):
     """Pipeline source pushing rows from a SQL query
 
-    :param conn: DBAPI connection object
+    :param conn: DBAPI connection object, or :py:class:`ConnectionPool`
     :param query: query text
     :param params: parameters for query, passed through to the cursor.execute method
+    :param fetch_size: if set, fetch rows this many at a time with ``cursor.fetchmany``
+    :param cursor_name: if set, use a named (server-side) cursor, so that the driver doesn't
+        hold the whole result in memory (psycopg2)
+    :param batched: if set to True, send lists of rows (as fetched) rather than single rows
     """
 
     try:
-        for row in execute(conn, query, params):
-            target.send(row)
+        with _dbapi_connection(conn) as conn:
+            cursor = execute(conn, query, params, cursor_name)
+            try:
+                if fetch_size or batched:
+                    for rows in _fetch_batches(cursor, fetch_size or 1000):
+                        if batched:
+                            target.send(rows)
+                        else:
+                            for row in rows:
+                                target.send(row)
+                else:
+                    for row in cursor:
+                        target.send(row)
+            finally:
+                cursor.close()
         target.close()
     except Exception as e:
         try:
@@ -67,22 +280,235 @@ def run_query(conn, query, params=None, target=None):
         raise e
 
 
+def _skip_rows(result, count, fetch_size):
+    # Fetch and discard rows already processed by a previous run
+    while count > 0:
+        rows = result.fetchmany(min(count, fetch_size))
+        if not rows:
+            break
+        count -= len(rows)
+
+
 @pipesource
-def run_sqlalchemy(engine, query, target=None):
+def run_sqlalchemy(engine, query, stream=False, fetch_size=1000, row_format="dict",
+                   batched=False, checkpoint=None, checkpoint_column=None, target=None):
     """Pipeline source pushing rows (as dicts) from a SQLAlchemy query
 
+    The connection used is returned to the engine's pool when the query is complete.
+
     :param engine: SQLAlchemy engine (:py:class:`sqlalchemy.engine.Engine`)object
     :param query: SQLAlchemy query (:py:class:`sqlalchemy.sql.expression.Select` or similar)
+    :param stream: if set to True, use a server-side cursor (``stream_results``) where the
+        database supports it, and fetch rows ``fetch_size`` at a time, so that memory use doesn't
+        grow with the size of the result
+    :param fetch_size: number of rows fetched at a time when streaming
+    :param row_format: "dict" to send rows as dicts, "tuple" to send rows as tuples, or "row" to
+        send rows as :py:class:`genpipeline.rows.Row` objects
+    :param batched: if set to True, send lists of rows (as fetched) rather than single rows
+    :param checkpoint: optional :py:class:`genpipeline.checkpoint.Checkpoint` recording the
+        number of rows sent on (advanced once per batch, if ``batched`` is set); a run skips the
+        rows of the saved position, and deletes it when complete
+    :param checkpoint_column: name of a column of the query (which must be a
+        :py:class:`sqlalchemy.sql.expression.Select`) to use for incremental extracts: rows are
+        selected in order of the column, and only those with a value greater than the saved
+        position, which is kept when the run completes. The column's values must be unique and
+        increase as rows are added (like an autoincrement key), otherwise rows sharing the saved
+        value, or added with a smaller one, are skipped
     """
 
-    try:
-        if engine.dialect.name == "sqlite":
-            # sqlite doesn't handle updates while querying another table
-            for row in list(engine.connect().execute(query)):
-                target.send(dict(row))
+    convert = _row_converter(row_format)
+    skip = 0
+    position_of = None
+    if checkpoint is not None:
+        position = checkpoint.start()
+        if checkpoint_column is not None:
+            if not hasattr(query, "selected_columns"):
+                raise ValueError("checkpoint_column needs a Select query")
+            column = (query.selected_columns[checkpoint_column]
+                      if isinstance(checkpoint_column, str) else checkpoint_column)
+            if position is not None:
+                query = query.where(column > position)
+            query = query.order_by(column)
+
+            def position_of(row, count):
+                return row._mapping[column]
         else:
-            for row in engine.connect().execute(query):
-                target.send(dict(row))
+            skip = position or 0
+
+            def position_of(row, count):
+                return count
+
+    try:
+        with engine.connect() as conn:
+            if stream:
+                conn = conn.execution_options(stream_results=True)
+            result = conn.execute(query)
+            if skip:
+                _skip_rows(result, skip, fetch_size)
+            count = skip
+            if stream or batched:
+                batches = _fetch_batches(result, fetch_size)
+            elif engine.dialect.name == "sqlite":
+                # sqlite doesn't handle updates while querying another table
+                batches = [result.fetchall()]
+            else:
+                batches = None
+
+            if batched:
+                for rows in batches:
+                    target.send([convert(row) for row in rows])
+                    if checkpoint is not None:
+                        count += len(rows)
+                        checkpoint.advance(position_of(rows[-1], count))
+            else:
+                for row in (result if batches is None else itertools.chain.from_iterable(batches)):
+                    target.send(convert(row))
+                    if checkpoint is not None:
+                        count += 1
+                        checkpoint.advance(position_of(row, count))
+        target.close()
+        if checkpoint is not None:
+            checkpoint.finish(keep=checkpoint_column is not None)
+    except Exception as e:
+        if checkpoint is not None:
+            checkpoint.abandon()
+        try:
+            target.throw(e)
+        except StopIteration:
+            pass
+        raise e
+
+
+class PartitionError(Exception):
+    """Raised by :py:func:`partitioned_query` when the query for a partition fails
+
+    The original exception is available as ``__cause__``.
+    """
+
+    def __init__(self, partition, low, high):
+        super().__init__("Query failed for partition {} ({} to {})".format(partition, low, high))
+        self.partition = partition
+        self.low = low
+        self.high = high
+
+
+_partition_done = object()
+
+
+def _partition_bounds(low, high, partitions):
+    """Split the range [low, high] into (low, high) pairs of (nearly) equal width"""
+
+    if isinstance(low, int) and isinstance(high, int):
+        bounds = [low + (high - low) * i // partitions for i in range(partitions + 1)]
+    else:
+        bounds = [low + (high - low) * i / partitions for i in range(partitions + 1)]
+        # Rounding can leave the ends just inside the range, missing rows at low or high
+        bounds[0] = low
+        bounds[-1] = high
+    return [(bounds[i], bounds[i + 1]) for i in range(partitions) if i == 0 or
+            bounds[i] != bounds[i + 1]]
+
+
+def _put(output, item, stop):
+    # Put an item in a bounded queue, giving up if the consumer has stopped
+    while not stop.is_set():
+        try:
+            output.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+@pipesource
+def partitioned_query(engine, query, partition_column, partitions=4, ordered=False,
+                      fetch_size=1000, row_format="dict", progress=None, target=None):
+    """Pipeline source running a query as range-partitioned sub-queries at the same time
+
+    The range of ``partition_column`` (which must be numeric) in the results of the query is
+    split into equal-width ranges, and a sub-query for each range is run in its own thread, on
+    its own connection from the engine's pool. Rows are sent on from the calling thread.
+
+    :param engine: SQLAlchemy engine (:py:class:`sqlalchemy.engine.Engine`) object
+    :param query: SQL query text (a SELECT statement)
+    :param partition_column: name of the (numeric) column in the query results to partition on
+    :param partitions: number of partitions (and of connections used at the same time)
+    :param ordered: if set to True, rows are sent on sorted by ``partition_column``; otherwise
+        rows are sent on as they are fetched, from any partition
+    :param fetch_size: number of rows fetched at a time by each partition
+    :param row_format: "dict" to send rows as dicts, "tuple" to send rows as tuples, or "row" to
+        send rows as :py:class:`genpipeline.rows.Row` objects
+    :param progress: optional function called as ``progress(partition, rows, done)`` with the
+        number of rows sent on for a partition so far, after each fetch and when the partition is
+        complete
+    :raises PartitionError: if the query for a partition fails
+    """
+
+    convert = _row_converter(row_format)
+    stop = threading.Event()
+    threads = []
+
+    def run_partition(partition, low, high, last, output):
+        try:
+            condition = "<=" if last else "<"
+            statement = sql.text(
+                "SELECT * FROM ({query}) AS partitioned_query "
+                "WHERE {column} >= :low AND {column} {condition} :high{order}".format(
+                    query=query, column=partition_column, condition=condition,
+                    order=" ORDER BY {}".format(partition_column) if ordered else ""))
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True).execute(
+                    statement, {"low": low, "high": high})
+                for rows in _fetch_batches(result, fetch_size):
+                    if stop.is_set():
+                        return
+                    _put(output, (partition, [convert(row) for row in rows]), stop)
+            _put(output, (partition, _partition_done), stop)
+        except Exception as e:
+            _put(output, (partition, e), stop)
+
+    try:
+        try:
+            with engine.connect() as conn:
+                low, high = conn.execute(sql.text(
+                    "SELECT min({column}), max({column}) FROM ({query}) AS partitioned_query"
+                    .format(column=partition_column, query=query))).fetchone()
+
+            ranges = _partition_bounds(low, high, partitions) if low is not None else []
+            if ordered:
+                outputs = [queue.Queue(2) for _ in ranges]
+            else:
+                outputs = [queue.Queue(2 * len(ranges) or 1)] * len(ranges)
+            for partition, (partition_low, partition_high) in enumerate(ranges):
+                thread = threading.Thread(
+                    target=run_partition,
+                    args=(partition, partition_low, partition_high,
+                          partition == len(ranges) - 1, outputs[partition]),
+                    daemon=True)
+                thread.start()
+                threads.append(thread)
+
+            counts = [0] * len(ranges)
+            remaining = set(range(len(ranges)))
+            while remaining:
+                # Ordered output reads each partition's queue in turn
+                output = outputs[min(remaining)]
+                partition, rows = output.get()
+                if rows is _partition_done:
+                    remaining.discard(partition)
+                    if progress is not None:
+                        progress(partition, counts[partition], True)
+                elif isinstance(rows, Exception):
+                    raise PartitionError(partition, *ranges[partition]) from rows
+                else:
+                    for row in rows:
+                        target.send(row)
+                    counts[partition] += len(rows)
+                    if progress is not None:
+                        progress(partition, counts[partition], False)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
         target.close()
     except Exception as e:
         try:
@@ -93,17 +519,95 @@ def run_sqlalchemy(engine, query, target=None):
 
 
 @pipefilter
-def inserter(conn, table, columns):
-    """Sink: insert rows into a database table"""
+def inserter(conn, table, columns, batch_size=1000, commit_every=None, method="execute",
+             placeholder="%s", checkpoint=None):
+    """Sink: insert rows into a database table
+
+    :param conn: DBAPI connection object, or :py:class:`ConnectionPool`
+    :param table: name of table to insert into
+    :param columns: list of columns to insert into; rows are sequences of values for these
+    :param batch_size: number of rows inserted at a time by the "executemany" and
+        "multirow_values" methods
+    :param commit_every: if set, commit after (at least) this number of rows, and when the
+        pipeline closes. Rows inserted using a connection from a :py:class:`ConnectionPool` are
+        always committed when the pipeline closes
+    :param method: "execute" to run an INSERT per row, "executemany" to pass batches of rows to
+        ``cursor.executemany``, or "multirow_values" to run one INSERT with a VALUES row per row
+        of a batch
+    :param placeholder: parameter placeholder for the connection's paramstyle ("%s" or "?")
+    :param checkpoint: optional :py:class:`genpipeline.checkpoint.Checkpoint` of the source;
+        the rows inserted so far are committed each time it is saved, and when the pipeline
+        closes
+    """
 
-    sql = "INSERT INTO {table} ({columns}) VALUES ({placeholders})".format(
+    if method not in ("execute", "executemany", "multirow_values"):
+        raise ValueError("Unsupported insert method: {}".format(method))
+
+    prefix = "INSERT INTO {table} ({columns}) VALUES ".format(
         table=table,
-        columns=", ".join(column for column in columns),
-        placeholders=", ".join("%s" for _ in columns))
+        columns=", ".join(column for column in columns))
+    values = "({})".format(", ".join(placeholder for _ in columns))
+    sql = prefix + values
+    batch_sql = prefix + ", ".join(values for _ in range(batch_size))
+    commit_on_close = (bool(commit_every) or isinstance(conn, ConnectionPool)
+                       or checkpoint is not None)
+    with _dbapi_connection(conn) as conn:
+        yield from _insert(conn, sql, batch_sql, prefix, values, batch_size, commit_every,
+                           commit_on_close, method, checkpoint)
+
+
+def _insert(conn, sql, batch_sql, prefix, values, batch_size, commit_every, commit_on_close,
+            method, checkpoint=None):
+    """Generator body for :py:func:`inserter`"""
+
     cursor = conn.cursor()
-    while True:
-        row = (yield)
-        cursor.execute(sql, row)
+    batch = []
+    uncommitted = 0
+
+    def flush():
+        nonlocal uncommitted
+        if method == "executemany":
+            cursor.executemany(sql, batch)
+        elif method == "multirow_values":
+            statement = batch_sql if len(batch) == batch_size else (
+                prefix + ", ".join(values for _ in batch))
+            cursor.execute(statement, [value for row in batch for value in row])
+        uncommitted += len(batch)
+        del batch[:]
+        if commit_every and uncommitted >= commit_every:
+            conn.commit()
+            uncommitted = 0
+
+    def commit():
+        # Called when the source's checkpoint is saved, between rows
+        nonlocal uncommitted
+        if batch:
+            flush()
+        conn.commit()
+        uncommitted = 0
+
+    if checkpoint is not None:
+        checkpoint.register(commit)
+
+    try:
+        if method == "execute":
+            while True:
+                row = (yield)
+                cursor.execute(sql, row)
+                uncommitted += 1
+                if commit_every and uncommitted >= commit_every:
+                    conn.commit()
+                    uncommitted = 0
+        else:
+            while True:
+                batch.append((yield))
+                if len(batch) >= batch_size:
+                    flush()
+    except GeneratorExit:
+        if batch:
+            flush()
+        if commit_on_close and (uncommitted or checkpoint is not None):
+            conn.commit()
 
 
 class CSVFileAdapter:
@@ -151,31 +655,150 @@ class CSVFileAdapter:
             raise
 
 
-@iter_sink
-def upload_csv(data, engine, table, columns):
+class CSVCopyStream:
+    """File-like object streaming rows as encoded CSV, for copying into PostgreSQL
+
+    Unlike :py:class:`CSVFileAdapter`, :py:meth:`read` honours its size argument and returns
+    bytes. Rows are formatted into a reused text buffer, encoded once, and kept in a reused byte
+    buffer until read.
+    """
+
+    def __init__(self, data, dialect=csv.excel, encoding="utf-8", line_count=None):
+        """
+        :param data: rows (sequences of values) to be exported to CSV - most likely an iterator
+        :param dialect: CSV dialect
+        :param encoding: encoding of the returned bytes
+        :param line_count: number of rows formatted at a time; by default, enough rows to fill
+            the requested size (estimated from the size of the rows read so far)
+        """
+
+        self._data = iter(data)
+        self._encoding = encoding
+        self._line_count = line_count
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text, dialect=dialect)
+        self._buffer = bytearray()
+        self._rows = 0
+        self._bytes = 0
+        self._exhausted = False
+
+    def _fill(self, size):
+        while not self._exhausted and (size is None or len(self._buffer) < size):
+            if self._line_count:
+                count = self._line_count
+            elif self._rows and size is not None:
+                count = max(1, (size - len(self._buffer)) * self._rows // self._bytes + 1)
+            else:
+                count = 100
+            lines = list(itertools.islice(self._data, count))
+            if len(lines) < count:
+                self._exhausted = True
+
+            self._text.seek(0)
+            self._text.truncate()
+            self._writer.writerows(lines)
+            encoded = self._text.getvalue().encode(self._encoding)
+            self._buffer += encoded
+            self._rows += len(lines)
+            self._bytes += len(encoded)
+
+    def _take(self, size):
+        # Remove and return the first size bytes of the buffer, copying them once
+        with memoryview(self._buffer) as view:
+            chunk = view[:size].tobytes()
+        del self._buffer[:size]
+        return chunk
+
+    def read(self, size=8192):
+        try:
+            if size is not None and size < 0:
+                size = None
+            self._fill(size)
+            if size is None:
+                size = len(self._buffer)
+            return self._take(size)
+        except Exception:
+            # Log exceptions here as they'll be caught by psycopg2 and raised as something else
+            _log.error("Error in CSVCopyStream.read", exc_info=True)
+            raise
+
+    def readline(self):
+        try:
+            while not self._exhausted and b"\n" not in self._buffer:
+                self._fill(len(self._buffer) + 1)
+            end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+            return self._take(end)
+        except Exception:
+            _log.error("Error in CSVCopyStream.readline", exc_info=True)
+            raise
+
+
+def _copy_rows(data, columns, null_string):
+    """Generate a list of values for the given columns from each dict in data, with None
+    replaced by null_string
+    """
+
+    for row in data:
+        yield [null_string if value is None else value for value in map(row.get, columns)]
+
+
+def upload_csv(engine, table, columns, line_count=None, checkpoint=None):
     """Insert data to a database table using the PostgreSQL COPY command, with CSV format
 
-    :param data: iterable yielding dicts to insert, indexed with columns to generate row
-    :param conn: psycopg2 database connection
+    The sink takes dicts, indexed with columns to generate rows.
+
+    :param engine: SQLAlchemy engine or :py:class:`ConnectionPool` (of psycopg2 connections)
     :param table: name of table (including schema if appropriate) to insert into
     :param columns: list of columns to insert into 
+    :param line_count: number of rows formatted at a time for COPY (see :py:class:`CSVCopyStream`)
+    :param checkpoint: optional :py:class:`genpipeline.checkpoint.Checkpoint` of the source. A
+        COPY can't be committed part way, so the checkpoint is only saved when the run completes
     """
-    with closing(engine.raw_connection()) as rawconn:
-        with rawconn.connection as conn:
-            with conn.cursor() as cursor:
-                data = ([row.get(column) for column in columns] for row in data)
+
+    if checkpoint is not None:
+        checkpoint.defer()
+    return _upload_csv(engine, table, columns, line_count)
+
+
+@iter_sink
+def _copy_from(data, cursor, table, columns, line_count=None):
+    cursor.copy_from(CSVCopyStream(_copy_rows(data, columns, r"\N"),
+                                   dialect=tabdialect, line_count=line_count),
+                     table,
+                     columns=columns)
+
+
+@pipefilter
+def _upload_csv(engine, table, columns, line_count=None):
+    # The connection is used in the calling thread, except by COPY, which reads the rows from a
+    # file-like object and so is run by an iter_sink
+    with _dbapi_connection(engine) as rawconn:
+        with rawconn as conn:
+            with closing(conn.cursor()) as cursor:
                 if hasattr(cursor, "copy_from"):
-                    cursor.copy_from(CSVFileAdapter(data, dialect=tabdialect, null_string=r"\N"),
-                                     table,
-                                     columns=columns)
+                    sink = _copy_from(cursor, table, columns, line_count).resolve()
+                    try:
+                        while True:
+                            sink.send((yield))
+                    except GeneratorExit:
+                        sink.close()
+                    except Exception as e:
+                        try:
+                            sink.throw(e)
+                        except:
+                            pass
+                        raise
                 else:
                     stmt = "INSERT INTO %s (%s) VALUES (%s)" % (table, ",".join(columns), 
                                                                 ",".join(["?"] * len(columns)))
                     batch = []
-                    for row in data:
-                        batch.append(row)
-                        if len(batch) >= 100:
+                    try:
+                        while True:
+                            row = (yield)
+                            batch.append([row.get(column) for column in columns])
+                            if len(batch) >= 100:
+                                cursor.executemany(stmt, batch)
+                                batch = []
+                    except GeneratorExit:
+                        if batch:
                             cursor.executemany(stmt, batch)
-                            batch = []
-                    if batch:
-                        cursor.executemany(stmt, batch)
@@ -0,0 +1,161 @@
+"""
+Bulk CSV loading
+================
+
+A CSV source for large files. Rather than sending a dict per row of strings like
+:py:func:`genpipeline.csv_source`, :py:func:`csv_batch_source` reads the file in large blocks and
+sends lists of rows (as tuples), or dicts of columns, converting typed columns a whole column at
+a time::
+
+    >> csv_batch_source("trades.csv.gz", schema={"id": "int", "price": "float", "day": "date"},
+                        batch_size=10000) | (unbatch() | appender(rows))
+
+Files can be given by path, optionally compressed with gzip or zstd (which requires the
+``zstandard`` package), or read through a memory map.
+
+API
+---
+
+.. autofunction:: csv_batch_source
+"""
+
+import codecs
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import mmap
+import os
+from . import pipesource
+
+_converters = {
+    "int": int,
+    "float": float,
+    "date": datetime.date.fromisoformat,
+    "datetime": datetime.datetime.fromisoformat,
+    "str": None,
+    None: None,
+}
+
+
+def _convert(values, converter):
+    """Convert a column of strings, with empty (or missing) values converted to None"""
+
+    try:
+        return list(map(converter, values))
+    except (TypeError, ValueError):
+        return [converter(value) if value else None for value in values]
+
+
+def _text_blocks(read, block_size, encoding):
+    """Generate text blocks from a read function, each ending at a line break
+
+    Each block is returned as a :py:class:`io.StringIO`, so that iterating over the chain of blocks
+    gives the lines of the file.
+    """
+
+    decoder = codecs.getincrementaldecoder(encoding)() if encoding else None
+    tail = ""
+    while True:
+        block = read(block_size)
+        if decoder is not None:
+            block = decoder.decode(block, final=not block)
+        if not block:
+            break
+        text = tail + block
+        cut = text.rfind("\n") + 1
+        tail = text[cut:]
+        yield io.StringIO(text[:cut], newline="")
+    if tail:
+        yield io.StringIO(tail, newline="")
+
+
+def _open(file, compression, use_mmap):
+    """Open a file for reading, returning the binary (or text) file and its read function"""
+
+    if not isinstance(file, (str, os.PathLike)):
+        return None, file.read
+    if compression is None:
+        compression = {".gz": "gzip", ".zst": "zstd"}.get(os.path.splitext(file)[1])
+    if compression == "gzip":
+        handle = gzip.open(file, "rb")
+        return handle, handle.read
+    elif compression == "zstd":
+        import zstandard
+        handle = zstandard.ZstdDecompressor().stream_reader(open(file, "rb"), closefd=True)
+        return handle, handle.read
+    elif compression is not None:
+        raise ValueError("Unsupported compression: {}".format(compression))
+
+    handle = open(file, "rb")
+    if use_mmap and os.fstat(handle.fileno()).st_size:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        handle.close()
+        return mapped, mapped.read
+    return handle, handle.read
+
+
+@pipesource
+def csv_batch_source(file, schema=None, batch_size=10000, output="tuples", fieldnames=None,
+                     compression=None, use_mmap=False, encoding="utf-8", block_size=1 << 20,
+                     target=None, **kwargs):
+    """Pipeline source pushing batches of rows from a CSV file
+
+    Any additional keyword arguments are passed to :py:func:`csv.reader`.
+
+    :param file: a path, or a file-like object containing CSV data
+    :param schema: dict mapping column names to types: "int", "float", "date", "datetime" or
+        "str"/None (left as strings). Empty values in typed columns become None
+    :param batch_size: number of rows in each batch
+    :param output: "tuples" to send lists of tuples, or "columns" to send dicts mapping column
+        names to sequences of values
+    :param fieldnames: column names; by default the first row of the file is used
+    :param compression: "gzip", "zstd" or None; by default inferred from the file extension
+    :param use_mmap: if set to True, read an uncompressed file through a memory map
+    :param encoding: encoding of the file (ignored for text file-like objects)
+    :param block_size: size of the blocks read from the file
+    """
+
+    if output not in ("tuples", "columns"):
+        raise ValueError("Unsupported output: {}".format(output))
+
+    try:
+        handle, read = _open(file, compression, use_mmap)
+        try:
+            if isinstance(read(0), str):
+                encoding = None
+            lines = itertools.chain.from_iterable(_text_blocks(read, block_size, encoding))
+            reader = csv.reader(lines, **kwargs)
+            if fieldnames is None:
+                fieldnames = next(reader, [])
+            conversions = [(i, _converters[schema[name]])
+                           for i, name in enumerate(fieldnames)
+                           if schema and _converters.get(schema.get(name)) is not None]
+
+            while True:
+                rows = list(itertools.islice(reader, batch_size))
+                if not rows:
+                    break
+                if conversions or output == "columns":
+                    columns = list(itertools.zip_longest(*rows))
+                    for i, converter in conversions:
+                        columns[i] = _convert(columns[i], converter)
+                    if output == "columns":
+                        batch = dict(zip(fieldnames, columns))
+                    else:
+                        batch = list(zip(*columns))
+                else:
+                    batch = list(map(tuple, rows))
+                del rows
+                target.send(batch)
+        finally:
+            if handle is not None:
+                handle.close()
+        target.close()
+    except Exception as e:
+        try:
+            target.throw(e)
+        except StopIteration:
+            pass
+        raise e
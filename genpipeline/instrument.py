@@ -0,0 +1,301 @@
+"""
+Instrumentation
+===============
+
+Per-stage counters and timings, to find the bottleneck in a slow pipeline. Instrumentation is
+opt-in: call ``instrument()`` on a pipeline before running it (or set the
+``GENPIPELINE_INSTRUMENT`` environment variable to log a report for every pipeline as it
+closes). Each coroutine is then wrapped when the pipeline is resolved; pipelines which are not
+instrumented are resolved exactly as before, so cost nothing extra per item::
+
+    >> pipeline = rename(("a", "b")) | my_filter() | appender(results)
+    >> stats = pipeline.instrument()
+    >> iter_source(rows) | pipeline
+    >> print(stats.format_report())
+
+Stages are named by their position and filter name (``"1:my_filter"``); stages of broadcast
+branches are named after the broadcast stage (``"0:broadcast[1]/0:printer"``). For each stage,
+the following are recorded:
+
+* items received (``items_in``) and sent on (``items_out``)
+* time in ``send``, with a histogram of ``send`` latencies
+* cumulative time (in ``send``, ``throw`` and ``close``), including the time of the stages
+  below, and self time (cumulative time less the time spent in the stages it sent to)
+* exceptions raised from ``send``, and the time taken to close
+
+Profiling
+---------
+
+Because each stage's ``send`` calls the ``send`` of the next, a function-level profiler
+attributes the time of a whole pipeline to nested ``send`` calls. A :py:class:`PipelineProfiler`
+records the exclusive time of each stage for each chain of stages it was called through
+(including broadcast branches, and filters such as :py:func:`genpipeline.iter_filter` which run
+their function in a worker thread), and writes it as collapsed stacks, the input format of flame
+graph tools such as ``flamegraph.pl`` and speedscope::
+
+    >> profiler = pipeline.instrument(PipelineProfiler())
+    >> iter_source(rows) | pipeline
+    >> with open("pipeline.folded", "w") as f:
+    ..     profiler.write_collapsed(f)
+
+API
+---
+
+.. autoclass:: PipelineStats
+    :members:
+.. autoclass:: StageStats
+    :members:
+.. autoclass:: PipelineProfiler
+    :members:
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+_log = logging.getLogger(__name__)
+
+#: Upper bounds (in seconds) of the send latency histogram buckets
+LATENCY_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+class StageStats:
+    """Counters and timings for one stage of a pipeline"""
+
+    __slots__ = ("name", "items_in", "items_out", "exceptions", "send_time", "cumulative_time",
+                 "self_time", "close_time", "latency_counts")
+
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.exceptions = 0
+        self.send_time = 0.0
+        self.cumulative_time = 0.0
+        self.self_time = 0.0
+        self.close_time = 0.0
+        # One count per bucket, plus one for latencies over the last bucket
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def __repr__(self):
+        return "StageStats({!r}, items_in={}, items_out={}, self_time={:.6f})".format(
+            self.name, self.items_in, self.items_out, self.self_time)
+
+    def as_dict(self):
+        """Return the stats as a dict"""
+
+        return {
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "exceptions": self.exceptions,
+            "send_time": self.send_time,
+            "cumulative_time": self.cumulative_time,
+            "self_time": self.self_time,
+            "close_time": self.close_time,
+            "latency_histogram": dict(zip(LATENCY_BUCKETS + (float("inf"),),
+                                          self.latency_counts)),
+        }
+
+
+class _Frame:
+    # A send in progress: the stage, and the time spent in the stages it sent to
+    __slots__ = ("stage", "child_time")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.child_time = 0.0
+
+
+class _InstrumentedTarget:
+    """Wrapper for a resolved coroutine, recording stats for its stage"""
+
+    __slots__ = ("_target", "_stage", "_pipeline", "_closed")
+
+    def __init__(self, target, stage, pipeline):
+        self._target = target
+        self._stage = stage
+        self._pipeline = pipeline
+        self._closed = False
+
+    def _enter(self):
+        frame = _Frame(self._stage)
+        self._pipeline._stack.append(frame)
+        return frame
+
+    def _exit(self, frame, start):
+        elapsed = time.perf_counter() - start
+        stack = self._pipeline._stack
+        stack.pop()
+        if stack:
+            stack[-1].child_time += elapsed
+        self._pipeline._record(frame, elapsed)
+        return elapsed
+
+    def send(self, value):
+        stage = self._stage
+        stage.items_in += 1
+        stack = self._pipeline._stack
+        if stack:
+            stack[-1].stage.items_out += 1
+        frame = self._enter()
+        start = time.perf_counter()
+        try:
+            return self._target.send(value)
+        except Exception:
+            stage.exceptions += 1
+            raise
+        finally:
+            elapsed = self._exit(frame, start)
+            stage.send_time += elapsed
+            stage.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def throw(self, *args):
+        frame = self._enter()
+        start = time.perf_counter()
+        try:
+            return self._target.throw(*args)
+        finally:
+            self._exit(frame, start)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        frame = self._enter()
+        start = time.perf_counter()
+        try:
+            return self._target.close()
+        finally:
+            self._stage.close_time += self._exit(frame, start)
+            pipeline = self._pipeline
+            if not pipeline._stack and threading.current_thread() is pipeline._thread:
+                pipeline._closed()
+
+
+class PipelineStats:
+    """Stats for the stages of an instrumented pipeline, in pipeline order
+
+    Stats accumulate across runs of the pipeline.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.hooks = []
+        # Sends in progress are tracked per thread, as broadcast branches may run in their own
+        # threads; hooks run when the pipeline closes in the thread that started it
+        self._local = threading.local()
+        self._thread = None
+
+    def __repr__(self):
+        return "PipelineStats(stages={})".format(list(self.stages.values()))
+
+    @property
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def stage(self, name):
+        """Return the :py:class:`StageStats` for the named stage, creating it if necessary"""
+
+        try:
+            return self.stages[name]
+        except KeyError:
+            stage = self.stages[name] = StageStats(name)
+            return stage
+
+    def wrap(self, target, name):
+        """Wrap a resolved coroutine to record stats under the given stage name"""
+
+        if self._thread is None:
+            self._thread = threading.current_thread()
+        return _InstrumentedTarget(target, self.stage(name), self)
+
+    def _record(self, frame, elapsed):
+        frame.stage.cumulative_time += elapsed
+        frame.stage.self_time += elapsed - frame.child_time
+
+    def _closed(self):
+        for hook in self.hooks:
+            hook(self)
+
+    def add_hook(self, hook):
+        """Add a function to be called with this object each time the pipeline closes, for
+        example to export the stats
+        """
+
+        self.hooks.append(hook)
+
+    def report(self):
+        """Return the stats as a dict mapping stage names to dicts of stats"""
+
+        return {name: stage.as_dict() for name, stage in self.stages.items()}
+
+    def format_report(self):
+        """Return the stats as a table in a string"""
+
+        lines = ["{:<40} {:>10} {:>10} {:>6} {:>12} {:>12}".format(
+            "stage", "in", "out", "errors", "cumulative", "self")]
+        for stage in self.stages.values():
+            lines.append("{:<40} {:>10} {:>10} {:>6} {:>12.6f} {:>12.6f}".format(
+                stage.name, stage.items_in, stage.items_out, stage.exceptions,
+                stage.cumulative_time, stage.self_time))
+        return "\n".join(lines)
+
+    def samples(self, prefix="genpipeline_stage_"):
+        """Generate (metric name, labels, value) tuples in the style of Prometheus metrics"""
+
+        for stage in self.stages.values():
+            labels = {"stage": stage.name}
+            yield prefix + "items_in_total", labels, stage.items_in
+            yield prefix + "items_out_total", labels, stage.items_out
+            yield prefix + "exceptions_total", labels, stage.exceptions
+            yield prefix + "self_seconds_total", labels, stage.self_time
+            yield prefix + "close_seconds_total", labels, stage.close_time
+            count = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + (float("inf"),),
+                                           stage.latency_counts):
+                count += bucket_count
+                yield (prefix + "send_seconds_bucket",
+                       dict(labels, le="+Inf" if bound == float("inf") else repr(bound)), count)
+            yield prefix + "send_seconds_sum", labels, stage.send_time
+            yield prefix + "send_seconds_count", labels, stage.items_in
+
+
+class PipelineProfiler(PipelineStats):
+    """Pipeline stats which also record exclusive time per stack of stages"""
+
+    def __init__(self):
+        super().__init__()
+        #: Dict mapping tuples of stage names (outermost first) to exclusive time, in seconds
+        self.stacks = {}
+
+    def _record(self, frame, elapsed):
+        super()._record(frame, elapsed)
+        path = tuple(f.stage.name for f in self._stack) + (frame.stage.name,)
+        self.stacks[path] = self.stacks.get(path, 0.0) + elapsed - frame.child_time
+
+    def collapsed(self):
+        """Generate lines of collapsed stacks (``stage;stage;stage microseconds``)"""
+
+        for path, seconds in self.stacks.items():
+            microseconds = int(round(seconds * 1e6))
+            if microseconds > 0:
+                yield "{} {}".format(
+                    ";".join(name.replace(";", "_").replace(" ", "_") for name in path),
+                    microseconds)
+
+    def write_collapsed(self, file):
+        """Write collapsed stacks to a text file, for flame graph tools"""
+
+        for line in self.collapsed():
+            file.write(line + "\n")
+
+
+def log_report(stats):
+    """Hook logging the report of a :py:class:`PipelineStats`"""
+
+    _log.info("Pipeline stats:\n%s", stats.format_report())
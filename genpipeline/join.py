@@ -0,0 +1,209 @@
+"""
+Lookup joins
+============
+
+:py:func:`lookup_join` enriches a stream of dict rows with fields from a reference table, loaded
+once from any pipeline source into a hash index when the pipeline starts, rather than querying
+for each row::
+
+    >> customers = run_sqlalchemy(engine, "SELECT id, name, region FROM customers")
+    >> csv_source(f) | (lookup_join(customers, key="customer_id", reference_key="id")
+    ..                  | inserter(conn, "orders", columns))
+
+The index maps each key to a tuple of the reference fields' values (the field names are held
+once), which takes much less memory than a dict per reference row. For reference tables too large
+for memory, pass ``spill_path`` to build the index in an SQLite database file instead.
+
+Rows from :py:func:`genpipeline.db.run_query` are sequences rather than dicts; pass the names of
+their columns as ``reference_columns``.
+
+API
+---
+
+.. autofunction:: lookup_join
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+from . import _key_function, pipefilter
+
+_log = logging.getLogger(__name__)
+
+JOIN_TYPES = ("left", "inner")
+
+
+def _join_key_function(key):
+    """Return a function getting a (possibly composite) key from a row, or None if any field is
+    missing or None, so that the row matches nothing
+    """
+
+    get_key = _key_function(key)
+    if isinstance(key, (list, tuple)):
+        def get_join_key(row):
+            values = get_key(row)
+            return None if None in values else values
+        return get_join_key
+    return get_key
+
+
+class _MemoryIndex:
+    """Index of reference values in a dict, mapping each key to a tuple of values (or a list of
+    tuples, for duplicate keys)
+    """
+
+    def __init__(self):
+        self._index = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, key, values):
+        existing = self._index.setdefault(key, values)
+        if existing is not values:
+            if isinstance(existing, list):
+                existing.append(values)
+            else:
+                self._index[key] = [existing, values]
+
+    def finish(self):
+        pass
+
+    def matches(self, key):
+        match = self._index.get(key)
+        if match is None:
+            return ()
+        elif isinstance(match, list):
+            return match
+        return (match,)
+
+    def close(self):
+        self._index.clear()
+
+
+class _SQLiteIndex:
+    """Index of reference values in an SQLite database file, deleted when the index is closed
+
+    Keys which SQLite can't store as they are (composite keys, for example) are pickled.
+    """
+
+    def __init__(self, path, batch_size=10000):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute("CREATE TABLE lookup (key, value BLOB)")
+        self._batch_size = batch_size
+        self._pending = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _encode(key):
+        if key is None or isinstance(key, (str, int, float)):
+            return key
+        return pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+
+    def add(self, key, values):
+        self._pending.append((self._encode(key), pickle.dumps(values, pickle.HIGHEST_PROTOCOL)))
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        self._connection.executemany("INSERT INTO lookup VALUES (?, ?)", self._pending)
+        self._count += len(self._pending)
+        self._pending = []
+
+    def finish(self):
+        self._flush()
+        self._connection.execute("CREATE INDEX lookup_key ON lookup (key)")
+        self._connection.commit()
+
+    def matches(self, key):
+        return [pickle.loads(value) for value, in self._connection.execute(
+            "SELECT value FROM lookup WHERE key = ? ORDER BY rowid", (self._encode(key),))]
+
+    def close(self):
+        self._connection.close()
+        os.remove(self.path)
+
+
+@pipefilter
+def _index_builder(index, reference_key, fields, reference_columns):
+    """Sink adding reference rows to an index; ``fields`` is filled from the first row if empty"""
+
+    row = (yield)
+    if reference_columns is not None:
+        row = dict(zip(reference_columns, row))
+    if not fields:
+        keys = reference_key if isinstance(reference_key, (list, tuple)) else (reference_key,)
+        fields.extend(name for name in row if name not in keys)
+    get_key = _join_key_function(reference_key)
+
+    while True:
+        key = get_key(row)
+        if key is not None:
+            index.add(key, tuple(row.get(name) for name in fields))
+        row = (yield)
+        if reference_columns is not None:
+            row = dict(zip(reference_columns, row))
+
+
+@pipefilter
+def lookup_join(reference_source, key, how="left", fields=None, reference_key=None,
+                reference_columns=None, spill_path=None, target=None):
+    """Filter: merge the fields of matching reference rows into each row
+
+    The reference source is run to build the index when the pipeline starts. A row matching
+    several reference rows is sent on once for each (as a copy).
+
+    :param reference_source: a pipeline source (such as :py:func:`genpipeline.db.run_query`,
+        :py:func:`genpipeline.csv_source` or :py:func:`genpipeline.iter_source`) of reference
+        rows
+    :param key: field (or list of fields) to match on
+    :param how: "left" to send on rows with no match with the reference fields set to None, or
+        "inner" to drop them
+    :param fields: reference fields to merge into rows; by default all the fields of the first
+        reference row except the key
+    :param reference_key: field (or list of fields) of the reference rows to match on, if
+        different to ``key``
+    :param reference_columns: names of the columns of reference rows which are sequences
+    :param spill_path: if set, build the index in an SQLite database file at this path (deleted
+        when the stream ends) rather than in memory
+    """
+
+    if how not in JOIN_TYPES:
+        raise ValueError("how must be one of {}, not {!r}".format(", ".join(JOIN_TYPES), how))
+    fields = list(fields) if fields is not None else []
+    index = _SQLiteIndex(spill_path) if spill_path is not None else _MemoryIndex()
+    try:
+        reference_source | _index_builder(
+            index, reference_key if reference_key is not None else key, fields,
+            reference_columns)
+        index.finish()
+        _log.debug("Built lookup_join index with %d keys", len(index))
+
+        get_key = _join_key_function(key)
+        missing = (None,) * len(fields)
+        inner = how == "inner"
+        matches = index.matches
+        while True:
+            row = (yield)
+            found = matches(get_key(row))
+            if not found:
+                if inner:
+                    continue
+                found = (missing,)
+            if len(found) > 1:
+                for values in found:
+                    joined = dict(row)
+                    joined.update(zip(fields, values))
+                    target.send(joined)
+            else:
+                row.update(zip(fields, found[0]))
+                target.send(row)
+    finally:
+        index.close()
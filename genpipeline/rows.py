@@ -0,0 +1,248 @@
+"""
+Compact rows
+============
+
+A :py:class:`Row` is a mutable mapping holding a list of values and a reference to a
+:py:class:`Schema`, which maps field names to positions and is shared by all the rows with the same
+fields. A row costs a small object and a list, rather than a dict whose keys are repeated in every
+row, which matters for wide tables. Sources with a ``row_format`` argument send rows as
+:py:class:`Row` objects with ``row_format="row"``::
+
+    >> csv_source(f, row_format="row") | (rename(("id", "order_id")) | project(["order_id"])
+    ..                                    | appender(results))
+
+Rows work anywhere dicts do. :py:func:`genpipeline.project`, :py:func:`genpipeline.rename` and
+:py:func:`genpipeline.rename_regexp` work out the new schema once for each schema they see
+(logging any rename warnings once per schema rather than once per row), and then only rearrange
+the values of each row. As with dicts, :py:func:`genpipeline.rename` changes the rows it is sent,
+while :py:func:`genpipeline.project` and :py:func:`genpipeline.rename_regexp` send on new rows and
+leave the rows they are sent unchanged. Adding or removing a field changes a row's schema to one
+derived from the old one, which is also worked out once per schema.
+
+API
+---
+
+.. autoclass:: Schema
+    :members:
+.. autoclass:: Row
+    :members:
+"""
+
+import weakref
+from collections.abc import Mapping, MutableMapping
+
+# Live schemas by field names, so that unpickled rows share a schema
+_schemas = weakref.WeakValueDictionary()
+
+
+class _FieldPositions(dict):
+    # Field names mapped to positions, standing in for a row when a row function is applied to a
+    # schema; shown as the field names, in warnings logged by the function
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<fields {}>".format(", ".join(map(repr, self)))
+
+
+class Schema:
+    """Ordered field names of a set of rows, and their positions
+
+    Schemas derived from this one (by :py:meth:`derive`, and by adding or removing a field) are
+    cached, so rows which go through the same changes share the same schemas. Rows pickled one at
+    a time (by :py:class:`genpipeline.buffers.SpillBuffer`, for example) are unpickled with a
+    schema with the same names if there is one.
+
+    :param names: field names, which must be unique (see :py:meth:`from_fields`)
+    """
+
+    __slots__ = ("names", "index", "_derived", "__weakref__")
+
+    def __init__(self, names):
+        #: Tuple of the field names
+        self.names = tuple(names)
+        #: Dict mapping field names to positions
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError("Duplicate field names in schema: {!r}".format(self.names))
+        self._derived = {}
+        _schemas.setdefault(self.names, self)
+
+    @classmethod
+    def from_fields(cls, fields):
+        """Return the schema of rows with fields which may be repeated (such as the columns of a
+        CSV file), and the positions of the values to keep (or None, if all are kept)
+
+        As when a dict is built from the fields, a repeated field keeps its first position and
+        its last value.
+        """
+
+        last = {name: i for i, name in enumerate(fields)}
+        if len(last) == len(fields):
+            return cls(fields), None
+        return cls(last), tuple(last.values())
+
+    def __repr__(self):
+        return "Schema({!r})".format(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __reduce__(self):
+        return _unpickle_schema, (self.names,)
+
+    def derive(self, row_function):
+        """Return the schema of rows after a function of dict rows depending only on the field
+        names (such as the function applied by :py:func:`genpipeline.rename`), and the positions
+        in the old rows of the new rows' values (or None, if they are unchanged)
+        """
+
+        try:
+            return self._derived[row_function]
+        except KeyError:
+            pass
+        positions = row_function(_FieldPositions(self.index))
+        schema = Schema(positions)
+        positions = tuple(positions.values())
+        if positions == tuple(range(len(self.names))):
+            positions = None
+        derived = self._derived[row_function] = (schema, positions)
+        return derived
+
+    def added(self, name):
+        """Return the schema with a field added at the end"""
+
+        key = ("added", name)
+        try:
+            return self._derived[key]
+        except KeyError:
+            schema = self._derived[key] = Schema(self.names + (name,))
+            return schema
+
+    def removed(self, name):
+        """Return the schema without a field"""
+
+        key = ("removed", name)
+        try:
+            return self._derived[key]
+        except KeyError:
+            schema = self._derived[key] = Schema(n for n in self.names if n != name)
+            return schema
+
+
+def _unpickle_schema(names):
+    schema = _schemas.get(names)
+    if schema is None:
+        schema = Schema(names)
+    return schema
+
+
+class Row(MutableMapping):
+    """A row of values with a shared :py:class:`Schema`, usable as a dict
+
+    :param schema: the schema of the row
+    :param values: list of values, in schema order (used as it is, not copied)
+    """
+
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema, values):
+        self._schema = schema
+        self._values = values
+
+    @classmethod
+    def from_dict(cls, data, schema=None):
+        """Create a row from a dict, with the given schema or one with the dict's keys"""
+
+        if schema is None:
+            schema = Schema(data)
+        return cls(schema, [data.get(name) for name in schema.names])
+
+    @property
+    def schema(self):
+        return self._schema
+
+    def __repr__(self):
+        return "Row({!r})".format(self.as_dict())
+
+    def __getitem__(self, key):
+        return self._values[self._schema.index[key]]
+
+    def get(self, key, default=None):
+        i = self._schema.index.get(key)
+        return default if i is None else self._values[i]
+
+    def __setitem__(self, key, value):
+        i = self._schema.index.get(key)
+        if i is None:
+            self._schema = self._schema.added(key)
+            self._values.append(value)
+        else:
+            self._values[i] = value
+
+    def __delitem__(self, key):
+        i = self._schema.index[key]
+        self._schema = self._schema.removed(key)
+        del self._values[i]
+
+    def __contains__(self, key):
+        return key in self._schema.index
+
+    def __iter__(self):
+        return iter(self._schema.names)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Row) and other._schema is self._schema:
+            return self._values == other._values
+        if isinstance(other, Mapping):
+            return self.as_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def copy(self):
+        """Return a copy of the row (sharing the schema)"""
+
+        return Row(self._schema, list(self._values))
+
+    __copy__ = copy
+
+    def as_dict(self):
+        """Return the row as a dict"""
+
+        return dict(zip(self._schema.names, self._values))
+
+    def remap(self, row_function, in_place=False):
+        """Apply a function of dict rows depending only on the field names, see
+        :py:meth:`Schema.derive`
+
+        :param in_place: if set to True, change this row and return it (for functions changing
+            dicts in place); otherwise return a new row, leaving this one unchanged
+        """
+
+        schema, positions = self._schema.derive(row_function)
+        values = self._values
+        if positions is not None:
+            values = [values[i] for i in positions]
+        if in_place:
+            self._schema = schema
+            self._values = values
+            return self
+        return Row(schema, list(values) if positions is None else values)
+
+
+def schema_function(row_function, in_place=False):
+    """Wrap a function of dict rows depending only on the field names, so that it is applied to
+    :py:class:`Row` objects through their schema (see :py:meth:`Row.remap`)
+
+    :param in_place: set to True if the function changes the dicts it is given, so that it
+        changes rows in the same way
+    """
+
+    def apply(data):
+        if type(data) is Row:
+            return data.remap(row_function, in_place)
+        return row_function(data)
+    return apply
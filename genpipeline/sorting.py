@@ -0,0 +1,98 @@
+"""
+Sorting
+=======
+
+:py:func:`sort` orders a stream without holding all of it in memory: items are collected into
+runs of up to ``max_memory`` bytes (estimated), each run is sorted and written to a temporary
+file, and when the stream ends the runs are merged and sent on in order::
+
+    >> csv_source(f) | (sort(key=itemgetter("customer_id"), max_memory=512 * 1024 * 1024)
+    ..                  | inserter(conn, "orders", columns))
+
+Streams which fit in ``max_memory`` are sorted in memory, as :py:func:`sorted` would. The sort is
+stable. Items which are written to disk must be picklable.
+
+Each run keeps a temporary file open until the stream ends. Runs are merged in levels: whenever
+there are ``MERGE_FAN_IN`` runs of the same level, they are merged into one run of the next level,
+and when the stream ends all the runs are merged at once. Each item is written once per level, so
+the data written grows with the logarithm of the stream's size in runs, as does the number of
+open files (at most ``MERGE_FAN_IN - 1`` per level).
+
+API
+---
+
+.. autofunction:: sort
+"""
+
+import heapq
+from . import pipefilter
+from .buffers import SpillBuffer, _estimate_size
+
+#: Number of runs of the same level merged into one run of the next level
+MERGE_FAN_IN = 64
+#: The size of one item in this many is estimated, and taken as the size of each of them
+SIZE_SAMPLE = 16
+
+
+def _write_run(items, path):
+    # Write sorted items to a new run on disk
+    run = SpillBuffer(0, path)
+    for item in items:
+        run.append(item)
+    return run
+
+
+def _merge_runs(runs, key, reverse, path):
+    # Merge runs into a single run, closing them
+    merged = _write_run(heapq.merge(*runs, key=key, reverse=reverse), path)
+    for run in runs:
+        run.close()
+    return merged
+
+
+@pipefilter
+def sort(key=None, reverse=False, max_memory=64 * 1024 * 1024, path=None, target=None):
+    """Filter: send items on in sorted order when the stream ends
+
+    :param key: function of an item returning the value to sort by, as for :py:func:`sorted`
+    :param reverse: if set to True, sort in descending order
+    :param max_memory: estimated size in bytes of the items to sort in memory at once
+    :param path: directory for the temporary files; by default the system's temporary directory
+    """
+
+    runs = []
+    # Level of each run: the number of merges its items went through
+    levels = []
+    items = []
+    size = 0
+    try:
+        try:
+            while True:
+                item = (yield)
+                items.append(item)
+                if not len(items) % SIZE_SAMPLE:
+                    # Estimating each item's size costs more than sorting it
+                    size += SIZE_SAMPLE * _estimate_size(item)
+                    if size > max_memory:
+                        items.sort(key=key, reverse=reverse)
+                        runs.append(_write_run(items, path))
+                        levels.append(0)
+                        items = []
+                        size = 0
+                        # Levels only decrease along the list, so runs of the same level are
+                        # together at the end; merging them in order keeps the sort stable
+                        while (len(runs) >= MERGE_FAN_IN
+                               and levels[-MERGE_FAN_IN] == levels[-1]):
+                            runs[-MERGE_FAN_IN:] = [_merge_runs(runs[-MERGE_FAN_IN:], key,
+                                                                reverse, path)]
+                            levels[-MERGE_FAN_IN:] = [levels[-1] + 1]
+        except GeneratorExit:
+            items.sort(key=key, reverse=reverse)
+            if runs:
+                items = heapq.merge(*runs, items, key=key, reverse=reverse)
+            if target is not None:
+                for item in items:
+                    target.send(item)
+    finally:
+        for run in runs:
+            run.close()
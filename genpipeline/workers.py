@@ -0,0 +1,193 @@
+"""
+Worker pools
+============
+
+Filters running a function on each item using a pool of workers: :py:func:`parallel` uses worker
+processes, so that CPU-heavy transforms can use more than one core, and :py:func:`threaded` uses
+threads, so that many I/O-bound calls (lookups, HTTP requests, database point queries) can wait at
+the same time. The number of tasks in flight is bounded so that a fast source cannot queue up
+unlimited work.
+
+The function must be a plain function of one item (not a filter). For :py:func:`parallel`, both
+the function and the items must be picklable::
+
+    >> iter_source(documents) | (parallel(parse_document, workers=4) | appender(results))
+
+Results are always sent on from the thread driving the pipeline, so the downstream filters do not
+need to be thread-safe. Exceptions raised by the function in a worker are thrown into the
+downstream target, and then raised in the pipeline.
+
+API
+---
+
+.. autofunction:: parallel
+.. autofunction:: threaded
+.. autoclass:: PoolStats
+    :members:
+"""
+
+import collections
+import concurrent.futures
+import os
+import time
+from . import pipefilter
+
+
+class PoolStats:
+    """Counters for a worker pool filter, updated as the pipeline runs
+
+    Pass an instance as the ``stats`` argument of :py:func:`parallel` or :py:func:`threaded`.
+
+    :ivar workers: number of workers in the pool
+    :ivar submitted: number of tasks submitted to the pool
+    :ivar completed: number of tasks whose results have been sent on
+    :ivar queue_depth: number of tasks submitted and not yet sent on
+    :ivar max_queue_depth: largest value of ``queue_depth`` seen
+    :ivar busy_time: total time spent by workers running tasks, in seconds
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self.submitted = 0
+        self.completed = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.busy_time = 0.0
+        self.start_time = None
+        self.end_time = None
+
+    def __repr__(self):
+        return ("PoolStats(workers={}, submitted={}, completed={}, queue_depth={}, "
+                "max_queue_depth={}, utilisation={:.2f})".format(
+                    self.workers, self.submitted, self.completed, self.queue_depth,
+                    self.max_queue_depth, self.utilisation))
+
+    @property
+    def utilisation(self):
+        """Fraction of the available worker time spent running tasks"""
+
+        if self.start_time is None or not self.workers:
+            return 0.0
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        elapsed = end_time - self.start_time
+        return self.busy_time / (elapsed * self.workers) if elapsed > 0 else 0.0
+
+
+def _map_batch(fn, items):
+    """Apply fn to each of a batch of items (run in a worker), returning the time taken and the
+    results
+    """
+
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def _run_pool(executor, workers, fn, batch_size, ordered, max_inflight, stats, target):
+    """Generator body shared by the worker pool filters
+
+    :param executor: a :py:class:`concurrent.futures.Executor`, shut down when the filter closes
+    :param workers: number of workers used by the executor
+    :param fn: function applied to each item
+    :param batch_size: number of items submitted to the executor in one task
+    :param ordered: if False, results are sent on in the order tasks complete
+    :param max_inflight: maximum number of tasks submitted and not yet sent on
+    :param stats: :py:class:`PoolStats` to update, or None
+    """
+
+    pending = collections.deque()
+    items = []
+    if stats is None:
+        stats = PoolStats()
+    stats.workers = workers
+    stats.start_time = time.perf_counter()
+    stats.end_time = None
+
+    def submit(items):
+        pending.append(executor.submit(_map_batch, fn, items))
+        stats.submitted += 1
+        stats.queue_depth = len(pending)
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+
+    def send_results(future):
+        elapsed, results = future.result()
+        stats.busy_time += elapsed
+        stats.completed += 1
+        stats.queue_depth = len(pending)
+        if target is not None:
+            for result in results:
+                target.send(result)
+
+    def wait(limit):
+        # Send on results until no more than limit tasks are in flight
+        while len(pending) > limit:
+            if ordered:
+                send_results(pending.popleft())
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    send_results(future)
+
+    try:
+        try:
+            while True:
+                items.append((yield))
+                if len(items) >= batch_size:
+                    submit(items)
+                    items = []
+                    wait(max_inflight)
+        except GeneratorExit:
+            if items:
+                submit(items)
+            wait(0)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+        stats.end_time = time.perf_counter()
+
+
+@pipefilter
+def parallel(fn, workers=None, ordered=True, batch_size=100, max_inflight=None, stats=None,
+             target=None):
+    """Filter: apply a function to each item on a pool of worker processes
+
+    :param fn: picklable function taking an item and returning the item to send on
+    :param workers: number of worker processes (defaults to the number of CPUs)
+    :param ordered: if set to False, results are sent on as batches complete rather than in the
+        order the items were received
+    :param batch_size: number of items sent to a worker at a time
+    :param max_inflight: maximum number of batches in flight (defaults to twice the number of
+        workers)
+    :param stats: optional :py:class:`PoolStats` updated with counters for the pool
+    """
+
+    workers = workers or os.cpu_count() or 1
+    executor = concurrent.futures.ProcessPoolExecutor(workers)
+    yield from _run_pool(executor, workers, fn, batch_size, ordered, max_inflight or 2 * workers,
+                         stats, target)
+
+
+@pipefilter
+def threaded(fn, workers=8, max_inflight=None, ordered=True, batch_size=1, stats=None,
+             target=None):
+    """Filter: apply a function to each item on a pool of threads
+
+    Use this for functions which spend most of their time waiting on I/O. The function is the
+    only code run in the worker threads.
+
+    :param fn: function taking an item and returning the item to send on
+    :param workers: number of worker threads
+    :param max_inflight: maximum number of tasks in flight (defaults to twice the number of
+        workers)
+    :param ordered: if set to False, results are sent on as they complete rather than in the
+        order the items were received
+    :param batch_size: number of items passed to a thread at a time
+    :param stats: optional :py:class:`PoolStats` updated with counters for the pool
+    """
+
+    executor = concurrent.futures.ThreadPoolExecutor(workers)
+    yield from _run_pool(executor, workers, fn, batch_size, ordered, max_inflight or 2 * workers,
+                         stats, target)
@@ -0,0 +1,74 @@
+import datetime
+import unittest
+from genpipeline import *
+from genpipeline.aggregate import *
+
+ROWS = [{"k": "a", "v": 1}, {"k": "b", "v": 5}, {"k": "a", "v": None}, {"k": "a", "v": 3}]
+AGGREGATIONS = {"rows": "count", "values": ("count", "v"), "sum": ("sum", "v"),
+                "min": ("min", "v"), "max": ("max", "v"), "mean": ("mean", "v"),
+                "first": ("first", "v"), "last": ("last", "v")}
+
+
+class GroupByTest(unittest.TestCase):
+    def test_hash(self):
+        results = []
+        iter_source(ROWS) | (group_by("k", AGGREGATIONS) | appender(results))
+        self.assertEqual(results, [
+            {"k": "a", "rows": 3, "values": 2, "sum": 4, "min": 1, "max": 3, "mean": 2.0,
+             "first": 1, "last": 3},
+            {"k": "b", "rows": 1, "values": 1, "sum": 5, "min": 5, "max": 5, "mean": 5.0,
+             "first": 5, "last": 5}])
+
+    def test_presorted(self):
+        results = []
+        iter_source([{"k": "a"}, {"k": "a"}, {"k": "b"}, {"k": "a"}]) | (
+            group_by("k", {"n": "count"}, presorted=True) | appender(results))
+        self.assertEqual(results, [{"k": "a", "n": 2}, {"k": "b", "n": 1}, {"k": "a", "n": 1}])
+
+    def test_composite_key(self):
+        results = []
+        iter_source([{"a": 1, "b": 2}, {"a": 1, "b": 2}, {"a": 1, "b": 3}]) | (
+            group_by(["a", "b"], {"n": "count"}) | appender(results))
+        self.assertEqual(results, [{"a": 1, "b": 2, "n": 2}, {"a": 1, "b": 3, "n": 1}])
+
+    def test_unknown_aggregate(self):
+        self.assertRaises(ValueError, lambda: group_by("k", {"x": "median"}).resolve())
+        self.assertRaises(ValueError, lambda: group_by("k", {"x": "sum"}).resolve())
+        self.assertRaises(ValueError, lambda: group_by("k", {"x": "first"}).resolve())
+
+
+class WindowTest(unittest.TestCase):
+    def test_tumbling(self):
+        results = []
+        rows = [{"t": t, "k": k} for t, k in [(0, "a"), (5, "b"), (9, "a"), (10, "a"), (25, "a")]]
+        iter_source(rows) | (tumbling_window("t", 10, {"n": "count"}, key="k")
+                             | appender(results))
+        self.assertEqual(results, [
+            {"window_start": 0, "window_end": 10, "k": "a", "n": 2},
+            {"window_start": 0, "window_end": 10, "k": "b", "n": 1},
+            {"window_start": 10, "window_end": 20, "k": "a", "n": 1},
+            {"window_start": 20, "window_end": 30, "k": "a", "n": 1}])
+
+    def test_lateness(self):
+        results = []
+        rows = [{"t": t} for t in [1, 11, 8, 22, 9]]
+        iter_source(rows) | (tumbling_window("t", 10, {"n": "count"}, lateness=5)
+                             | appender(results))
+        # 8 arrives within the lateness of its window; 9 arrives after the window was sent on
+        self.assertEqual([row["n"] for row in results], [2, 1, 1])
+
+    def test_sliding(self):
+        results = []
+        iter_source([{"t": t, "v": t} for t in range(6)]) | (
+            sliding_window("t", 4, 2, {"sum": ("sum", "v")}) | appender(results))
+        self.assertEqual([(row["window_start"], row["sum"]) for row in results],
+                         [(-2, 1), (0, 6), (2, 14), (4, 9)])
+
+    def test_datetime(self):
+        start = datetime.datetime(2020, 1, 1, 12, 0)
+        rows = [{"t": start + datetime.timedelta(minutes=m)} for m in (0, 30, 70)]
+        results = []
+        iter_source(rows) | (tumbling_window("t", datetime.timedelta(hours=1), {"n": "count"})
+                             | appender(results))
+        self.assertEqual([(row["window_start"], row["n"]) for row in results],
+                         [(start, 2), (start + datetime.timedelta(hours=1), 1)])
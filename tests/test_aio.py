@@ -0,0 +1,53 @@
+import asyncio
+import time
+import unittest
+from genpipeline import *
+from genpipeline.aio import *
+
+
+@pipefilter
+def double(target):
+    while True:
+        target.send((yield) * 2)
+
+
+@async_pipefilter
+async def slow_increment(value, delay):
+    await asyncio.sleep(delay)
+    return value + 1
+
+
+class AsyncPipelineTest(unittest.TestCase):
+    def test_concurrency(self):
+        results = []
+        start = time.perf_counter()
+        asyncio.run(run(async_source(range(20)) | (
+            double() | slow_increment(0.05, concurrency=20) | double() | appender(results))))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(sorted(results), [(i * 2 + 1) * 2 for i in range(20)])
+
+    def test_async_iterable(self):
+        async def values():
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield i
+
+        results = []
+        asyncio.run(run(async_source(values()) | (slow_increment(0) | slow_increment(0)
+                                                  | appender(results))))
+        self.assertEqual(results, [2, 3, 4])
+
+    def test_error(self):
+        @async_pipefilter
+        async def fail(value):
+            raise ValueError(value)
+
+        results = []
+        pipeline = async_source(range(3)) | (fail(concurrency=2) | appender(results))
+        self.assertRaises(ValueError, asyncio.run, run(pipeline))
+
+    def test_sync_run(self):
+        def pipeline():
+            iter_source(range(3)) | (slow_increment(0) | null())
+
+        self.assertRaises(TypeError, pipeline)
@@ -0,0 +1,168 @@
+import threading
+import time
+import unittest
+from genpipeline import *
+from genpipeline.buffers import *
+
+
+class BoundedBufferTest(unittest.TestCase):
+    def test_order(self):
+        buffer = BoundedBuffer(10)
+        for i in range(5):
+            buffer.put(i)
+        buffer.finish()
+        self.assertEqual(list(buffer), [0, 1, 2, 3, 4])
+        self.assertEqual(buffer.stats.max_occupancy, 5)
+        self.assertEqual(buffer.stats.occupancy, 0)
+
+    def test_block(self):
+        buffer = BoundedBuffer(2)
+        results = []
+        consumer = threading.Thread(target=lambda: (time.sleep(0.05), results.extend(buffer)))
+        consumer.start()
+        for i in range(10):
+            buffer.put(i)
+        buffer.finish()
+        consumer.join()
+        self.assertEqual(results, list(range(10)))
+        self.assertLessEqual(buffer.stats.max_occupancy, 2)
+        self.assertGreater(buffer.stats.blocked_time, 0)
+
+    def test_drop_oldest(self):
+        buffer = BoundedBuffer(3, overflow="drop_oldest")
+        for i in range(10):
+            buffer.put(i)
+        buffer.finish()
+        self.assertEqual(list(buffer), [7, 8, 9])
+        self.assertEqual(buffer.stats.dropped, 7)
+
+    def test_spill(self):
+        buffer = BoundedBuffer(3, overflow="spill")
+        for i in range(10):
+            buffer.put({"i": i})
+        self.assertEqual(buffer.stats.spilled, 7)
+        self.assertEqual(buffer.stats.occupancy, 10)
+        buffer.finish()
+        self.assertEqual([item["i"] for item in buffer], list(range(10)))
+
+    def test_close(self):
+        buffer = BoundedBuffer(1)
+        buffer.put(1)
+        threading.Timer(0.05, buffer.close).start()
+        buffer.put(2)
+        self.assertEqual(len(buffer), 0)
+
+    def test_invalid_overflow(self):
+        self.assertRaises(ValueError, BoundedBuffer, 10, overflow="ignore")
+
+
+class SpillBufferTest(unittest.TestCase):
+    def test_memory(self):
+        with SpillBuffer(1 << 20) as buffer:
+            for i in range(10):
+                buffer.append(i)
+            self.assertEqual(buffer.spilled, 0)
+            self.assertGreater(buffer.memory_bytes, 0)
+            self.assertEqual(list(buffer), list(range(10)))
+            self.assertEqual(buffer.memory_bytes, 0)
+
+    def test_spill(self):
+        with SpillBuffer(1000) as buffer:
+            for i in range(100):
+                buffer.append({"i": i, "name": "row {}".format(i)})
+            self.assertGreater(buffer.spilled, 0)
+            self.assertLessEqual(buffer.memory_bytes, 1000)
+            self.assertEqual(len(buffer), 100)
+            self.assertEqual([row["i"] for row in buffer], list(range(100)))
+            self.assertEqual(len(buffer), 0)
+
+    def test_interleaved(self):
+        results = []
+        with SpillBuffer(0) as buffer:
+            for i in range(10):
+                buffer.append(i)
+                buffer.append(-i)
+                results.append(buffer.popleft())
+            results.extend(buffer)
+        self.assertEqual(results, [value for i in range(10) for value in (i, -i)])
+
+    def test_empty(self):
+        self.assertRaises(IndexError, SpillBuffer(100).popleft)
+
+    def test_filter(self):
+        results = []
+        iter_source(range(1000)) | (spill_buffer(500) | appender(results))
+        self.assertEqual(results, list(range(1000)))
+
+
+class BufferedBroadcastTest(unittest.TestCase):
+    def test_broadcast(self):
+        @pipefilter
+        def slow(target):
+            while True:
+                item = (yield)
+                time.sleep(0.001)
+                target.send(item)
+
+        fast_results = []
+        slow_results = []
+        stats = []
+        iter_source(range(50)) | broadcast(appender(fast_results), slow() | appender(slow_results),
+                                           buffer_size=100, stats=stats)
+        self.assertEqual(fast_results, list(range(50)))
+        self.assertEqual(slow_results, list(range(50)))
+        self.assertEqual([branch.name for branch in stats], [0, 1])
+        self.assertEqual(stats[1].gets, 50)
+
+    def test_spill(self):
+        results = []
+        stats = []
+        iter_source(range(100)) | broadcast(appender(results), buffer_size=5, overflow="spill",
+                                            stats=stats)
+        self.assertEqual(results, list(range(100)))
+
+    def test_target_error(self):
+        thrown = []
+
+        @pipefilter
+        def failing():
+            while True:
+                if (yield) == 3:
+                    raise ValueError("failed")
+
+        @pipefilter
+        def catcher():
+            try:
+                while True:
+                    (yield)
+            except ValueError as e:
+                thrown.append(e)
+                raise
+
+        def pipeline():
+            iter_source(range(1000)) | broadcast(failing(), catcher(), buffer_size=10)
+
+        self.assertRaises(ValueError, pipeline)
+        self.assertEqual(len(thrown), 1)
+
+    def test_source_error(self):
+        thrown = []
+
+        @pipefilter
+        def catcher():
+            try:
+                while True:
+                    (yield)
+            except KeyError as e:
+                thrown.append(e)
+                raise
+
+        def values():
+            yield 1
+            raise KeyError("source")
+
+        def pipeline():
+            iter_source(values()) | broadcast(catcher(), catcher(), buffer_size=10)
+
+        self.assertRaises(KeyError, pipeline)
+        self.assertEqual(len(thrown), 2)
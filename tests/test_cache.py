@@ -0,0 +1,128 @@
+import os
+import tempfile
+import time
+import unittest
+from genpipeline import *
+from genpipeline.cache import *
+
+
+class CachedPipefilterTest(unittest.TestCase):
+    def test_cached(self):
+        calls = []
+
+        @cached_pipefilter(key=lambda row: row["name"])
+        def upper(target):
+            while True:
+                row = (yield)
+                calls.append(row["name"])
+                row["upper"] = row["name"].upper()
+                target.send(row)
+
+        results = []
+        iter_source([{"name": "a"}, {"name": "b"}, {"name": "a"}]) | (upper() | appender(results))
+        self.assertEqual(calls, ["a", "b"])
+        self.assertEqual([row["upper"] for row in results], ["A", "B", "A"])
+        self.assertEqual(upper.cache_info().hits, 1)
+        self.assertEqual(upper.cache_info().misses, 2)
+
+        # Changing an output must not change the cache
+        results[0]["upper"] = "changed"
+        results = []
+        iter_source([{"name": "a"}]) | (upper() | appender(results))
+        self.assertEqual(results, [{"name": "a", "upper": "A"}])
+        self.assertEqual(calls, ["a", "b"])
+
+        upper.cache_clear()
+        self.assertEqual(upper.cache_info().currsize, 0)
+
+
+class MemoizeTest(unittest.TestCase):
+    def test_row_fields(self):
+        calls = []
+
+        @pipefilter
+        def locate(target):
+            while True:
+                row = (yield)
+                calls.append(row["address"])
+                location = row.pop("raw_location")
+                row["location"] = location.upper()
+                target.send(row)
+
+        rows = [{"address": "x", "id": 1, "raw_location": "a"},
+                {"address": "x", "id": 2, "raw_location": "b"},
+                {"address": "y", "id": 3, "raw_location": "c"}]
+        results = []
+        iter_source(rows) | (memoize(locate(), key=lambda row: row["address"])
+                             | appender(results))
+        self.assertEqual(calls, ["x", "y"])
+        # Later rows keep their own fields, with the changes cached for their key
+        self.assertEqual(results, [{"address": "x", "id": 1, "location": "A"},
+                                   {"address": "x", "id": 2, "location": "A"},
+                                   {"address": "y", "id": 3, "location": "C"}])
+
+    def test_default_row_key(self):
+        results = []
+        cache = Cache()
+        iter_source([{"a": 1}, {"a": 1}, {"a": 2}]) | (memoize(rename(("a", "b")), cache=cache)
+                                                        | appender(results))
+        self.assertEqual(results, [{"b": 1}, {"b": 1}, {"b": 2}])
+        self.assertEqual(cache.cache_info().hits, 1)
+
+    def test_multiple_outputs(self):
+        calls = []
+
+        @pipefilter
+        def repeat(target):
+            while True:
+                value = (yield)
+                calls.append(value)
+                for _ in range(value):
+                    target.send(value)
+
+        results = []
+        iter_source([2, 0, 2, 1]) | (memoize(repeat()) | appender(results))
+        self.assertEqual(results, [2, 2, 2, 2, 1])
+        self.assertEqual(calls, [2, 0, 1])
+
+    def test_lru(self):
+        cache = Cache(maxsize=2)
+        iter_source([1, 2, 3, 1]) | (memoize(double(), cache=cache) | null())
+        self.assertEqual(cache.cache_info(), CacheInfo(hits=0, misses=4, evictions=2,
+                                                       expirations=0, maxsize=2, currsize=2))
+
+    def test_ttl(self):
+        cache = Cache(ttl=0.05)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.cache_info().expirations, 1)
+
+
+class BackendTest(unittest.TestCase):
+    def check_backend(self, make_backend):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache")
+            cache = Cache(backend=make_backend(path))
+            iter_source([1, 2]) | (memoize(double(), cache=cache) | null())
+            cache.close()
+
+            results = []
+            cache = Cache(backend=make_backend(path))
+            iter_source([2, 1]) | (memoize(double(), cache=cache) | appender(results))
+            cache.close()
+            self.assertEqual(results, [4, 2])
+            self.assertEqual(cache.cache_info().hits, 2)
+
+    def test_sqlite(self):
+        self.check_backend(SQLiteBackend)
+
+    def test_dbm(self):
+        self.check_backend(DBMBackend)
+
+
+@pipefilter
+def double(target):
+    while True:
+        target.send((yield) * 2)
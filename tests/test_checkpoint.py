@@ -0,0 +1,158 @@
+import datetime
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+import sqlalchemy
+from genpipeline import *
+from genpipeline.checkpoint import *
+from genpipeline.db import inserter, run_sqlalchemy
+
+
+class LoadError(Exception):
+    pass
+
+
+@pipefilter
+def fail_at(value, target):
+    while True:
+        row = (yield)
+        if row["id"] == value:
+            raise LoadError()
+        target.send((int(row["id"]), row["name"]))
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+
+class StoreTest(CheckpointTestCase):
+    def check_store(self, store):
+        position = {"id": 5, "time": datetime.datetime(2020, 1, 2, 3, 4, 5),
+                    "day": datetime.date(2020, 1, 2)}
+        self.assertIsNone(store.load("a"))
+        store.save("a", position)
+        store.save("b", 1)
+        self.assertEqual(store.load("a"), position)
+        store.delete("a")
+        self.assertIsNone(store.load("a"))
+        self.assertEqual(store.load("b"), 1)
+
+    def test_file(self):
+        self.check_store(FileCheckpointStore(self.path("checkpoint.json")))
+
+    def test_sqlite(self):
+        store = SQLiteCheckpointStore(self.path("checkpoint.db"))
+        self.check_store(store)
+        store.close()
+
+
+class CSVResumeTest(CheckpointTestCase):
+    def test_resume(self):
+        data = "id,name\n" + "".join("{},name {}\n".format(i, i) for i in range(10))
+        conn = sqlite3.connect(self.path("test.db"))
+        conn.execute("CREATE TABLE test (id INTEGER, name TEXT)")
+        store = FileCheckpointStore(self.path("checkpoint.json"))
+
+        def run(fail):
+            checkpoint = Checkpoint(store, "test.csv", every=3)
+            csv_source(io.StringIO(data), checkpoint=checkpoint) | (
+                fail_at(fail) | inserter(conn, "test", ["id", "name"], method="executemany",
+                                         placeholder="?", checkpoint=checkpoint))
+
+        self.assertRaises(LoadError, run, "7")
+        conn.rollback()
+        # Rows up to the last checkpoint were committed
+        self.assertEqual(store.load("test.csv"), 6)
+        self.assertEqual([row[0] for row in conn.execute("SELECT id FROM test ORDER BY id")],
+                         list(range(6)))
+
+        run(None)
+        self.assertEqual([row[0] for row in conn.execute("SELECT id FROM test ORDER BY id")],
+                         list(range(10)))
+        self.assertIsNone(store.load("test.csv"))
+        conn.close()
+
+
+class IncrementalQueryTest(CheckpointTestCase):
+    def test_incremental(self):
+        engine = sqlalchemy.create_engine("sqlite:///" + self.path("test.db"))
+        metadata = sqlalchemy.MetaData()
+        events = sqlalchemy.Table("events", metadata,
+                                  sqlalchemy.Column("id", sqlalchemy.Integer),
+                                  sqlalchemy.Column("name", sqlalchemy.Text))
+        metadata.create_all(engine)
+        store = SQLiteCheckpointStore(self.path("checkpoint.db"))
+
+        def insert(ids):
+            with engine.begin() as conn:
+                conn.execute(events.insert(), [{"id": i, "name": str(i)} for i in ids])
+
+        def extract():
+            results = []
+            checkpoint = Checkpoint(store, "events")
+            run_sqlalchemy(engine, sqlalchemy.select(events), checkpoint=checkpoint,
+                           checkpoint_column="id") | appender(results)
+            return [row["id"] for row in results]
+
+        insert([2, 1])
+        self.assertEqual(extract(), [1, 2])
+        insert([3, 4])
+        self.assertEqual(extract(), [3, 4])
+        self.assertEqual(extract(), [])
+        self.assertEqual(store.load("events"), 4)
+        store.close()
+        engine.dispose()
+
+    def test_resume_rows(self):
+        engine = sqlalchemy.create_engine("sqlite:///" + self.path("test.db"))
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE TABLE test (id INTEGER, name TEXT)"))
+            conn.execute(sqlalchemy.text("INSERT INTO test VALUES (:id, :name)"),
+                         [{"id": i, "name": str(i)} for i in range(5)])
+        store = FileCheckpointStore(self.path("checkpoint.json"))
+        store.save("test", 3)
+
+        results = []
+        run_sqlalchemy(engine, sqlalchemy.text("SELECT id FROM test ORDER BY id"),
+                       checkpoint=Checkpoint(store, "test")) | appender(results)
+        self.assertEqual([row["id"] for row in results], [3, 4])
+        self.assertIsNone(store.load("test"))
+        engine.dispose()
+
+    def test_resume_batches(self):
+        engine = sqlalchemy.create_engine("sqlite:///" + self.path("test.db"))
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE TABLE test (id INTEGER, name TEXT)"))
+            conn.execute(sqlalchemy.text("INSERT INTO test VALUES (:id, :name)"),
+                         [{"id": i, "name": str(i)} for i in range(10)])
+        store = FileCheckpointStore(self.path("checkpoint.json"))
+        processed = []
+
+        @pipefilter
+        def process(fail):
+            while True:
+                rows = (yield)
+                if fail in [row["id"] for row in rows]:
+                    raise LoadError()
+                processed.extend(row["id"] for row in rows)
+
+        def run(fail):
+            run_sqlalchemy(engine, sqlalchemy.text("SELECT id FROM test ORDER BY id"),
+                           fetch_size=2, batched=True,
+                           checkpoint=Checkpoint(store, "test", every=1)) | process(fail)
+
+        self.assertRaises(LoadError, run, 6)
+        self.assertEqual(store.load("test"), 6)
+        run(None)
+        self.assertEqual(processed, list(range(10)))
+        self.assertIsNone(store.load("test"))
+        engine.dispose()
@@ -0,0 +1,35 @@
+import unittest
+from genpipeline import appender, iter_source
+from genpipeline import columnar
+from genpipeline.columnar import RecordBatch
+
+ROWS = [{"id": 1, "px": 10.0, "qty": None},
+        {"id": 2, "px": 200.0, "qty": 5},
+        {"id": 3, "px": 300.0, "qty": None}]
+
+
+class RecordBatchTest(unittest.TestCase):
+    def test_round_trip(self):
+        for arrays in (True, False):
+            batch = RecordBatch.from_rows(ROWS, arrays=arrays)
+            self.assertEqual(len(batch), 3)
+            self.assertEqual(batch.to_rows(), ROWS)
+
+    def test_pipeline(self):
+        for arrays in (True, False):
+            results = []
+            iter_source([dict(row) for row in ROWS]) | (
+                columnar.to_batches(2, arrays=arrays)
+                | columnar.rename(("px", "price"))
+                | columnar.set_default("qty", 0)
+                | columnar.filter_rows(lambda batch: [p > 100 for p in batch["price"]])
+                | columnar.project(["id", "qty"])
+                | columnar.to_rows()
+                | appender(results))
+            self.assertEqual(results, [{"id": 2, "qty": 5}, {"id": 3, "qty": 0}])
+
+    def test_set_default_from_key(self):
+        batch = RecordBatch.from_rows(ROWS).set_default(["qty", "extra"], "id",
+                                                        default_is_key=True)
+        self.assertEqual([row["qty"] for row in batch.to_rows()], [1, 5, 3])
+        self.assertEqual([row["extra"] for row in batch.to_rows()], [1, 2, 3])
@@ -0,0 +1,260 @@
+import csv
+from contextlib import closing
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+import sqlalchemy
+from genpipeline import *
+from genpipeline.db import *
+from genpipeline.db import tabdialect
+
+
+class DBTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = sqlalchemy.create_engine(
+            "sqlite:///" + os.path.join(self.directory.name, "test.db"))
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE TABLE test (id INTEGER, name TEXT)"))
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def select(self):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(
+                sqlalchemy.text("SELECT id, name FROM test ORDER BY id"))]
+
+
+class CSVCopyStreamTest(unittest.TestCase):
+    rows = [[i, "name\t{}".format(i), None] for i in range(1000)]
+
+    def expected(self):
+        text = io.StringIO()
+        csv.writer(text, dialect=tabdialect).writerows(self.rows)
+        return text.getvalue().encode("utf-8")
+
+    def test_read_size(self):
+        for line_count in (None, 7):
+            stream = CSVCopyStream(self.rows, dialect=tabdialect, line_count=line_count)
+            chunks = []
+            while True:
+                chunk = stream.read(1000)
+                self.assertLessEqual(len(chunk), 1000)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            self.assertEqual(b"".join(chunks), self.expected())
+            self.assertTrue(all(len(chunk) == 1000 for chunk in chunks[:-1]))
+
+    def test_read_all(self):
+        self.assertEqual(CSVCopyStream(self.rows, dialect=tabdialect).read(-1), self.expected())
+
+
+class UploadCSVTest(DBTestCase):
+    def test_upload(self):
+        iter_source([{"id": 1, "name": "a"}, {"id": 2}]) | upload_csv(
+            self.engine, "test", ["id", "name"])
+        self.assertEqual(self.select(), [(1, "a"), (2, None)])
+
+    def test_memory_database(self):
+        # The in-memory database is only visible to the thread which created it
+        engine = sqlalchemy.create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE TABLE test (id INTEGER, name TEXT)"))
+        iter_source([{"id": i, "name": str(i)} for i in range(150)]) | upload_csv(
+            engine, "test", ["id", "name"])
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(sqlalchemy.text("SELECT COUNT(*) FROM test")).scalar(),
+                             150)
+        engine.dispose()
+
+
+class InserterTest(unittest.TestCase):
+    def test_methods(self):
+        for method in ("execute", "executemany", "multirow_values"):
+            conn = sqlite3.connect(":memory:")
+            conn.execute("CREATE TABLE test (id INTEGER, name TEXT)")
+            rows = [(i, str(i)) for i in range(25)]
+            iter_source(rows) | inserter(conn, "test", ["id", "name"], batch_size=10,
+                                         method=method, placeholder="?")
+            self.assertEqual(conn.execute("SELECT id, name FROM test ORDER BY id").fetchall(), rows)
+
+    def test_commit_every(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE test (id INTEGER)")
+            conn.commit()
+
+            def committed():
+                with closing(sqlite3.connect(path)) as other:
+                    return other.execute("SELECT count(*) FROM test").fetchone()[0]
+
+            counts = []
+
+            @pipefilter
+            def count_committed(target):
+                while True:
+                    item = (yield)
+                    counts.append(committed())
+                    target.send(item)
+
+            iter_source([(i,) for i in range(7)]) | (
+                count_committed()
+                | inserter(conn, "test", ["id"], batch_size=2, commit_every=4,
+                           method="executemany", placeholder="?"))
+            self.assertEqual(counts, [0, 0, 0, 0, 4, 4, 4])
+            self.assertEqual(committed(), 7)
+            conn.close()
+
+
+class RunQueryTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.engine.begin() as conn:
+            for i in range(5):
+                conn.execute(sqlalchemy.text("INSERT INTO test VALUES (:id, :name)"),
+                             {"id": i, "name": str(i)})
+        self.query = sqlalchemy.text("SELECT id, name FROM test ORDER BY id")
+
+    def test_run_sqlalchemy(self):
+        results = []
+        run_sqlalchemy(self.engine, self.query) | appender(results)
+        self.assertEqual(results, [{"id": i, "name": str(i)} for i in range(5)])
+
+    def test_run_sqlalchemy_stream(self):
+        results = []
+        run_sqlalchemy(self.engine, self.query, stream=True, fetch_size=2, row_format="tuple",
+                       batched=True) | appender(results)
+        self.assertEqual(results, [[(0, "0"), (1, "1")], [(2, "2"), (3, "3")], [(4, "4")]])
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+
+    def test_run_query_fetch_size(self):
+        conn = self.engine.raw_connection()
+        try:
+            results = []
+            run_query(conn, "SELECT id FROM test ORDER BY id", (), fetch_size=2) | appender(results)
+            self.assertEqual(results, [(i,) for i in range(5)])
+        finally:
+            conn.close()
+
+
+class PartitionedQueryTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text("INSERT INTO test VALUES (:id, :name)"),
+                         [{"id": i, "name": str(i)} for i in range(100)])
+
+    def test_unordered(self):
+        results = []
+        progress = {}
+        partitioned_query(self.engine, "SELECT id, name FROM test", "id", partitions=4,
+                          fetch_size=7, row_format="tuple",
+                          progress=lambda p, rows, done: progress.__setitem__(p, (rows, done))
+                          ) | appender(results)
+        self.assertEqual(sorted(results), [(i, str(i)) for i in range(100)])
+        self.assertEqual(sorted(progress.items()),
+                         [(0, (24, True)), (1, (25, True)), (2, (25, True)), (3, (26, True))])
+
+    def test_ordered(self):
+        results = []
+        partitioned_query(self.engine, "SELECT id FROM test WHERE id % 3 = 0", "id",
+                          partitions=3, ordered=True, fetch_size=5) | appender(results)
+        self.assertEqual(results, [{"id": i} for i in range(0, 100, 3)])
+
+    def test_float_column(self):
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE TABLE measures (value REAL)"))
+            conn.execute(sqlalchemy.text("INSERT INTO measures VALUES (:value)"),
+                         [{"value": value} for value in (0.1, 1.5, 2.9)])
+        results = []
+        # The ends of the range must not be lost to rounding in the partition bounds
+        partitioned_query(self.engine, "SELECT value FROM measures", "value",
+                          partitions=3) | appender(results)
+        self.assertEqual(sorted(row["value"] for row in results), [0.1, 1.5, 2.9])
+
+    def test_failure(self):
+        def check(value):
+            # Fail in the partition queries, which run in other threads
+            if value == 70 and threading.current_thread() is not threading.main_thread():
+                raise ValueError(value)
+            return value
+
+        sqlalchemy.event.listen(self.engine, "connect",
+                                lambda conn, record: conn.create_function("checked", 1, check))
+        self.engine.dispose()
+        try:
+            partitioned_query(self.engine, "SELECT checked(id) AS id FROM test", "id",
+                              partitions=4) | null()
+        except PartitionError as e:
+            self.assertIn(e.partition, range(4))
+            self.assertIsNotNone(e.__cause__)
+        else:
+            self.fail("Expected PartitionError")
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "test.db")
+        self.pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False),
+                                   size=1)
+        with self.pool.connection() as conn:
+            conn.execute("CREATE TABLE test (id INTEGER)")
+
+    def tearDown(self):
+        self.pool.close()
+        self.directory.cleanup()
+
+    def test_reuse(self):
+        for _ in range(3):
+            iter_source([(1,), (2,)]) | inserter(self.pool, "test", ["id"], placeholder="?")
+        results = []
+        run_query(self.pool, "SELECT count(*) FROM test", ()) | appender(results)
+        self.assertEqual(results, [(6,)])
+        self.assertEqual(self.pool.connections_created, 1)
+        self.assertEqual(self.pool.checkouts, 5)
+        self.assertEqual(self.pool.in_use, 0)
+
+    def test_bounded(self):
+        checked_out = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with self.pool.connection():
+                checked_out.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        checked_out.wait()
+        threading.Timer(0.1, release.set).start()
+        with self.pool.connection():
+            pass
+        thread.join()
+        self.assertGreaterEqual(self.pool.max_wait, 0.05)
+
+    def test_reset_on_return(self):
+        with self.pool.connection() as conn:
+            conn.execute("INSERT INTO test VALUES (1)")
+            self.assertTrue(conn.in_transaction)
+        # Returned connections don't keep a transaction (or uncommitted work) open
+        self.assertFalse(conn.in_transaction)
+        with self.pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(conn.execute("SELECT count(*) FROM test").fetchall(), [(0,)])
+
+    def test_health_check(self):
+        with self.pool.connection() as conn:
+            pass
+        conn.close()
+        with self.pool.connection() as conn:
+            conn.execute("SELECT 1")
+        self.assertEqual(self.pool.failed_health_checks, 1)
+        self.assertEqual(self.pool.connections_created, 2)
@@ -0,0 +1,50 @@
+import datetime
+import gzip
+import io
+import os
+import tempfile
+import unittest
+from genpipeline import *
+from genpipeline.fastcsv import *
+
+CSV_DATA = "id,price,day,name\n1,1.5,2020-01-02,a\n2,,2020-01-03,\"b\nc\"\n3,2.5,,d\n"
+
+
+class CSVBatchSourceTest(unittest.TestCase):
+    schema = {"id": "int", "price": "float", "day": "date"}
+
+    def test_tuples(self):
+        results = []
+        csv_batch_source(io.StringIO(CSV_DATA), schema=self.schema, batch_size=2) | (
+            appender(results))
+        self.assertEqual(results, [
+            [(1, 1.5, datetime.date(2020, 1, 2), "a"),
+             (2, None, datetime.date(2020, 1, 3), "b\nc")],
+            [(3, 2.5, None, "d")]])
+
+    def test_columns(self):
+        results = []
+        csv_batch_source(io.StringIO(CSV_DATA), schema=self.schema, output="columns") | (
+            appender(results))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(list(results[0]["id"]), [1, 2, 3])
+        self.assertEqual(list(results[0]["name"]), ["a", "b\nc", "d"])
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.check_files(directory)
+
+    def check_files(self, directory):
+        plain = os.path.join(directory, "data.csv")
+        compressed = os.path.join(directory, "data.csv.gz")
+        with open(plain, "w", newline="") as f:
+            f.write(CSV_DATA)
+        with gzip.open(compressed, "wt", newline="") as f:
+            f.write(CSV_DATA)
+
+        expected = []
+        csv_batch_source(io.StringIO(CSV_DATA)) | (unbatch() | appender(expected))
+        for path, options in [(plain, {}), (plain, {"use_mmap": True}), (compressed, {})]:
+            results = []
+            csv_batch_source(path, block_size=7, **options) | (unbatch() | appender(results))
+            self.assertEqual(results, expected)
@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+import unittest
+from genpipeline import *
+from genpipeline.join import *
+
+REFERENCE = [{"id": 1, "name": "one", "region": "north"},
+             {"id": 2, "name": "two", "region": "south"}]
+
+
+class LookupJoinTest(unittest.TestCase):
+    def join(self, rows, **kwargs):
+        results = []
+        iter_source(rows) | (lookup_join(**kwargs) | appender(results))
+        return results
+
+    def test_left(self):
+        results = self.join([{"customer": 1, "x": "a"}, {"customer": 3, "x": "b"}],
+                            reference_source=iter_source(REFERENCE), key="customer",
+                            reference_key="id")
+        self.assertEqual(results, [{"customer": 1, "x": "a", "name": "one", "region": "north"},
+                                   {"customer": 3, "x": "b", "name": None, "region": None}])
+
+    def test_inner(self):
+        results = self.join([{"id": 1}, {"id": 3}, {"id": 2}],
+                            reference_source=iter_source(REFERENCE), key="id", how="inner",
+                            fields=["name"])
+        self.assertEqual(results, [{"id": 1, "name": "one"}, {"id": 2, "name": "two"}])
+
+    def test_duplicates(self):
+        reference = iter_source([{"id": 1, "tag": "a"}, {"id": 1, "tag": "b"}])
+        results = self.join([{"id": 1}], reference_source=reference, key="id")
+        self.assertEqual(results, [{"id": 1, "tag": "a"}, {"id": 1, "tag": "b"}])
+
+    def test_composite_key(self):
+        # Rows missing a key field don't match reference rows missing it too
+        reference = iter_source([{"a": 1, "b": 2, "value": "x"}, {"a": 1, "value": "y"}])
+        results = self.join([{"a": 1, "b": 2}, {"a": 1}],
+                            reference_source=reference, key=["a", "b"], how="inner")
+        self.assertEqual(results, [{"a": 1, "b": 2, "value": "x"}])
+
+    def test_csv_reference(self):
+        reference = csv_source(io.StringIO("id,name\n1,one\n2,two\n"))
+        results = self.join([{"id": "2"}], reference_source=reference, key="id")
+        self.assertEqual(results, [{"id": "2", "name": "two"}])
+
+    def test_reference_columns(self):
+        reference = iter_source([(1, "one"), (2, "two")])
+        results = self.join([{"id": 2}], reference_source=reference, key="id",
+                            reference_columns=["id", "name"])
+        self.assertEqual(results, [{"id": 2, "name": "two"}])
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.db")
+            reference = iter_source([{"a": 1, "b": 2, "value": "x"},
+                                     {"a": 1, "b": 3, "value": "y"}])
+            results = self.join([{"a": 1, "b": 3}, {"a": 2, "b": 2}], reference_source=reference,
+                                key=["a", "b"], spill_path=path)
+            self.assertEqual(results, [{"a": 1, "b": 3, "value": "y"},
+                                       {"a": 2, "b": 2, "value": None}])
+            self.assertFalse(os.path.exists(path))
+
+    def test_invalid_how(self):
+        self.assertRaises(ValueError, self.join, [], reference_source=iter_source([]), key="id",
+                          how="outer")
@@ -1,5 +1,7 @@
+import io
 import unittest
 from genpipeline import *
+from genpipeline.instrument import PipelineProfiler
 import sys
 
 @pipefilter
@@ -105,6 +107,63 @@ class IterSinkTest(unittest.TestCase):
         else:
             assert False, "Expected TestError exception"
 
+    def test_stop_iteration_error(self):
+        @iter_filter
+        def broken(i):
+            for v in i:
+                if v == 3:
+                    next(iter([]))
+                yield v
+
+        with self.assertRaises(RuntimeError):
+            iter_source(range(10)) | (broken() | null())
+
+    def test_later_stage_error(self):
+        cleaned_up = []
+
+        @iter_filter
+        def passthrough(i):
+            try:
+                yield from i
+            finally:
+                cleaned_up.append(True)
+
+        @pipefilter
+        def fail():
+            (yield)
+            raise TestError()
+
+        with self.assertRaises(TestError):
+            iter_source(range(2000)) | (passthrough() | fail())
+        # The function was ended, rather than left waiting for items
+        self.assertEqual(cleaned_up, [True])
+
+    def test_chunk_size(self):
+        chunks = []
+
+        @iter_filter(chunk_size=3)
+        def record_chunks(i):
+            for value in i:
+                yield value
+
+        @pipefilter
+        def record(target):
+            while True:
+                chunks.append((yield))
+                target.send(None)
+
+        @pipefilter
+        def count_received(target):
+            while True:
+                (yield)
+                target.send(len(chunks))
+
+        results = []
+        iter_source(range(7)) | (record() | record_chunks() | count_received()
+                                 | appender(results))
+        # Outputs only come through once a full chunk (or the rest on close) has been handed over
+        self.assertEqual(results, [3, 3, 3, 6, 6, 6, 7])
+
 
 class RenameRegexpTest(unittest.TestCase):
     def test_rename(self):
@@ -125,3 +184,238 @@ class RenameRegexpTest(unittest.TestCase):
                           (r"^key_2$", r"key_1"))
             | appender(result))
         self.assertEqual(result, [{"key_1": 2, "key_2": 1, "key_3": 3}])
+
+
+class BatchTest(unittest.TestCase):
+    def test_batch_unbatch(self):
+        batches = []
+        results = []
+        iter_source(range(5)) | (batch(2) | appender(batches, batched=False) | unbatch()
+                                 | appender(results))
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+
+    def test_builtin_filters(self):
+        results = []
+        iter_source([{"a": 1, "b": None, "c": 3}, {"a": 2, "c": 4}]) | (
+            batch(10)
+            | rename(("a", "x"))
+            | set_default("b", 0)
+            | project(["x", "b"])
+            | appender(results))
+        self.assertEqual(results, [{"x": 1, "b": 0}, {"x": 2, "b": 0}])
+
+    def test_per_item_adapter(self):
+        @pipefilter
+        def append(last, target):
+            try:
+                while True:
+                    target.send((yield))
+            except GeneratorExit:
+                target.send(last)
+
+        batches = []
+        iter_source(range(3)) | (batch(2) | double() | append(99)
+                                 | appender(batches, batched=False))
+        self.assertEqual(batches, [[0, 2], [4], [99]])
+
+    def test_element_reuse(self):
+        results = []
+        element = rename(("a", "b"))
+        iter_source([{"a": 1}]) | (batch(2) | element | unbatch() | appender(results))
+        # The element itself isn't switched to batch mode, so it can be used unbatched
+        self.assertNotIn("batched", element.kwargs)
+        iter_source([{"a": 2}]) | (element | appender(results))
+        self.assertEqual(results, [{"b": 1}, {"b": 2}])
+
+
+class FusionTest(unittest.TestCase):
+    def test_fused(self):
+        @pipefilter
+        def increment(target):
+            while True:
+                data = (yield)
+                data["x"] += 1
+                target.send(data)
+
+        results = []
+        pipeline = (rename(("a", "x")) | set_default("b", 0) | project(["x", "b"]) | increment()
+                    | rename(("x", "y")) | appender(results))
+        iter_source([{"a": 1}, {"a": 2, "b": 5}]) | pipeline
+        self.assertEqual(results, [{"y": 2, "b": 0}, {"y": 3, "b": 5}])
+        self.assertEqual(pipeline.fused, [("rename", "set_default", "project")])
+
+    def test_not_fused(self):
+        results = []
+        pipeline = rename(("a", "x")) | project(["x"]) | appender(results)
+        pipeline.fuse = False
+        iter_source([{"a": 1, "b": 2}]) | pipeline
+        self.assertEqual(results, [{"x": 1}])
+        self.assertEqual(pipeline.fused, [])
+
+
+class PullEngineTest(unittest.TestCase):
+    def test_over(self):
+        pipeline = rename(("a", "b")) | project(["b"])
+        self.assertEqual(list(pipeline.over([{"a": 1, "c": 2}, {"a": 2}])), [{"b": 1}, {"b": 2}])
+        self.assertEqual(list((double() | double()).over([1, 2])), [4, 8])
+
+    def test_over_element(self):
+        self.assertEqual(list(double().over([1, 2])), [2, 4])
+
+    def test_selected_engine(self):
+        @iter_filter
+        def passthrough(i):
+            yield from i
+
+        self.assertEqual((rename(("a", "b")) | project(["b"]) | null()).selected_engine(), "pull")
+        self.assertEqual((passthrough() | null()).selected_engine(), "push")
+        self.assertEqual((double() | null()).selected_engine(), "push")
+        self.assertEqual((passthrough() | broadcast(null(), null())).selected_engine(), "push")
+
+        pipeline = rename(("a", "b")) | null()
+        pipeline.engine = "push"
+        self.assertEqual(pipeline.selected_engine(), "push")
+        pipeline = rename(("a", "b")) | null()
+        pipeline.instrument()
+        self.assertEqual(pipeline.selected_engine(), "push")
+
+    def test_run(self):
+        @iter_filter
+        def joiner(i):
+            while True:
+                yield next(i) + " " + next(i)
+
+        @pipefilter
+        def append(last, target):
+            try:
+                while True:
+                    target.send((yield))
+            except GeneratorExit:
+                target.send(last)
+
+        results = []
+        pipeline = joiner() | append("end") | appender(results)
+        pipeline.engine = "pull"
+        iter_source(["this", "is", "a", "test"]) | pipeline
+        self.assertEqual(results, ["this is", "a test", "end"])
+
+    def test_stop_iteration_error(self):
+        @iter_filter
+        def broken(i):
+            for v in i:
+                if v == 3:
+                    next(iter([]))
+                yield v
+
+        results = []
+        pipeline = broken() | appender(results)
+        pipeline.engine = "pull"
+        with self.assertRaises(RuntimeError):
+            iter_source(range(10)) | pipeline
+        self.assertEqual(results, [0, 1, 2])
+
+    def test_batched(self):
+        @pipefilter
+        def repeat(target):
+            while True:
+                item = (yield)
+                target.send(item)
+                target.send(item)
+
+        results = []
+        pipeline = batch(2) | rename(("a", "b")) | repeat() | unbatch() | appender(results)
+        pipeline.engine = "pull"
+        iter_source([{"a": 1}, {"a": 2}, {"a": 3}]) | pipeline
+        self.assertEqual(results, [{"b": 1}, {"b": 1}, {"b": 2}, {"b": 2}, {"b": 3}, {"b": 3}])
+
+    def test_error(self):
+        received = []
+
+        @pipefilter
+        def record_errors():
+            try:
+                while True:
+                    (yield)
+            except TestError as e:
+                received.append(e)
+                raise
+
+        def values():
+            yield 1
+            raise TestError()
+
+        pipeline = double() | record_errors()
+        pipeline.engine = "pull"
+        with self.assertRaises(TestError):
+            iter_source(values()) | pipeline
+        self.assertEqual(len(received), 1)
+
+
+class InstrumentTest(unittest.TestCase):
+    def test_stats(self):
+        @pipefilter
+        def evens(target):
+            while True:
+                value = (yield)
+                if value % 2 == 0:
+                    target.send(value)
+
+        results = []
+        closed = []
+        pipeline = double() | evens() | broadcast(appender(results), null())
+        stats = pipeline.instrument()
+        stats.add_hook(closed.append)
+        iter_source(range(4)) | pipeline
+
+        report = stats.report()
+        self.assertEqual(list(report), ["0:double", "1:evens", "2:broadcast",
+                                        "2:broadcast[0]/0:appender", "2:broadcast[1]/0:null"])
+        self.assertEqual(report["0:double"]["items_in"], 4)
+        self.assertEqual(report["0:double"]["items_out"], 4)
+        self.assertEqual(report["2:broadcast"]["items_out"], 8)
+        self.assertEqual(report["2:broadcast[1]/0:null"]["items_in"], 4)
+        self.assertEqual(sum(report["0:double"]["latency_histogram"].values()), 4)
+        self.assertAlmostEqual(sum(stage["self_time"] for stage in report.values()),
+                               report["0:double"]["cumulative_time"], places=4)
+        self.assertLessEqual(report["0:double"]["send_time"],
+                             report["0:double"]["cumulative_time"])
+        self.assertEqual(closed, [stats])
+        self.assertIn(("genpipeline_stage_items_in_total", {"stage": "1:evens"}, 4),
+                      list(stats.samples()))
+
+    def test_fused_names(self):
+        pipeline = rename(("a", "b")) | project(["b"]) | null()
+        stats = pipeline.instrument()
+        iter_source([{"a": 1}]) | pipeline
+        self.assertEqual(list(stats.report()), ["0:rename+project", "1:null"])
+
+    def test_profiler(self):
+        @pipefilter
+        def passthrough(target=None):
+            while True:
+                value = (yield)
+                if target is not None:
+                    target.send(value)
+
+        pipeline = passthrough() | broadcast(passthrough(), passthrough() | null())
+        profiler = pipeline.instrument(PipelineProfiler())
+        iter_source(range(5)) | pipeline
+
+        self.assertEqual(set(profiler.stacks), {
+            ("0:passthrough",),
+            ("0:passthrough", "1:broadcast"),
+            ("0:passthrough", "1:broadcast", "1:broadcast[0]/0:passthrough"),
+            ("0:passthrough", "1:broadcast", "1:broadcast[1]/0:passthrough"),
+            ("0:passthrough", "1:broadcast", "1:broadcast[1]/0:passthrough",
+             "1:broadcast[1]/1:null")})
+        # Exclusive times add up to the time spent in the first stage
+        self.assertAlmostEqual(sum(profiler.stacks.values()),
+                               profiler.report()["0:passthrough"]["cumulative_time"], places=6)
+
+        output = io.StringIO()
+        profiler.write_collapsed(output)
+        for line in output.getvalue().splitlines():
+            stack, microseconds = line.rsplit(" ", 1)
+            self.assertIn(tuple(stack.split(";")), profiler.stacks)
+            self.assertGreater(int(microseconds), 0)
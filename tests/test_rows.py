@@ -0,0 +1,120 @@
+import copy as copying
+import io
+import pickle
+import unittest
+from unittest import mock
+import sqlalchemy
+import genpipeline
+from genpipeline import *
+from genpipeline.rows import *
+from genpipeline.db import run_sqlalchemy
+
+
+class RowTest(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema(["a", "b"])
+
+    def test_mapping(self):
+        row = Row(self.schema, [1, 2])
+        self.assertEqual(row["a"], 1)
+        self.assertEqual(row.get("c", 3), 3)
+        self.assertEqual(list(row.items()), [("a", 1), ("b", 2)])
+        self.assertEqual(row, {"a": 1, "b": 2})
+        self.assertIn("b", row)
+        self.assertRaises(KeyError, lambda: row["c"])
+
+    def test_change_fields(self):
+        row = Row(self.schema, [1, 2])
+        other = Row(self.schema, [3, 4])
+        row["c"] = 3
+        other["c"] = 5
+        self.assertIs(row.schema, other.schema)
+        del row["a"]
+        self.assertEqual(row, {"b": 2, "c": 3})
+        self.assertEqual(other.pop("a"), 3)
+        self.assertIs(row.schema, other.schema)
+
+    def test_copy(self):
+        row = Row(self.schema, [1, 2])
+        copied = copying.copy(row)
+        copied["a"] = 5
+        self.assertEqual(row["a"], 1)
+        self.assertEqual(pickle.loads(pickle.dumps(row)), row)
+
+    def test_pickle_shares_schema(self):
+        names = ("x", "y")
+        loaded = [pickle.loads(pickle.dumps(Row(Schema(names), [i, i]))) for i in range(2)]
+        self.assertIs(loaded[0].schema, loaded[1].schema)
+        self.assertIs(pickle.loads(pickle.dumps(self.schema)), self.schema)
+
+
+class RowFilterTest(unittest.TestCase):
+    def run_rows(self, pipeline, rows):
+        results = []
+        iter_source(rows) | (pipeline | appender(results))
+        return results
+
+    def test_filters(self):
+        schema = Schema(["key_1", "key_2", "key_3", "value"])
+        rows = [Row(schema, [1, 2, 3, None]), Row(schema, [4, 5, 6, 7])]
+        results = self.run_rows(
+            rename_regexp((r"^key_([0-9]+)$", r"k\1")) | rename(("k1", "first"))
+            | set_default("value", 0) | project(["first", "k3", "value"]), rows)
+        self.assertEqual(results, [{"first": 1, "k3": 3, "value": 0},
+                                   {"first": 4, "k3": 6, "value": 7}])
+        self.assertTrue(all(isinstance(row, Row) for row in results))
+        self.assertIs(results[0].schema, results[1].schema)
+
+    def test_parallel_rename(self):
+        schema = Schema(["key_1", "key_2", "key_3"])
+        results = self.run_rows(rename_regexp((r"^key_1$", r"key_2"), (r"^key_2$", r"key_1")),
+                                [Row(schema, [1, 2, 3])])
+        self.assertEqual(results, [{"key_1": 2, "key_2": 1, "key_3": 3}])
+
+    def test_in_place(self):
+        schema = Schema(["a", "b"])
+        for renames in [("a", "c"), ("b", "c")]:
+            row = Row(schema, [1, 2])
+            self.assertIs(self.run_rows(rename(renames), [row])[0], row)
+            self.assertEqual(set(row), {"c", "b" if renames[0] == "a" else "a"})
+        row = Row(schema, [1, 2])
+        for pipeline in [project(["b"]), project(["a", "b"]), rename_regexp(("^a$", "c"))]:
+            result = self.run_rows(pipeline, [row])[0]
+            self.assertIsNot(result, row)
+            self.assertEqual(row, {"a": 1, "b": 2})
+
+    def test_rename_warning(self):
+        schema = Schema(["a", "b"])
+        with mock.patch.object(genpipeline._log, "warning") as warning:
+            self.run_rows(rename(("c", "d")), [Row(schema, [1, 2]), Row(schema, [3, 4])])
+        # Logged once for the schema, showing its fields
+        warning.assert_called_once()
+        self.assertIn("<fields 'a', 'b'>", warning.call_args[0][0])
+
+
+class RowSourceTest(unittest.TestCase):
+    def test_csv(self):
+        results = []
+        csv_source(io.StringIO("a,b\n1,2\n\n3\n4,5,6\n"), row_format="row") | appender(results)
+        self.assertEqual(results, [{"a": "1", "b": "2"}, {"a": "3", "b": None},
+                                   {"a": "4", "b": "5", None: ["6"]}])
+        self.assertIs(results[0].schema, results[1].schema)
+
+    def test_csv_repeated_columns(self):
+        data = "a,a,b\n1,2,3\n4\n"
+        results = []
+        csv_source(io.StringIO(data), row_format="row") | appender(results)
+        expected = []
+        csv_source(io.StringIO(data)) | appender(expected)
+        self.assertEqual(results, expected)
+        self.assertEqual(list(results[0]), ["a", "b"])
+        self.assertEqual(len(results[0]), 2)
+        self.assertRaises(ValueError, Schema, ["a", "a"])
+
+    def test_sqlalchemy(self):
+        engine = sqlalchemy.create_engine("sqlite://")
+        results = []
+        run_sqlalchemy(engine, sqlalchemy.text("SELECT 1 AS a, 2 AS b"),
+                       row_format="row") | appender(results)
+        self.assertEqual(results, [{"a": 1, "b": 2}])
+        self.assertIsInstance(results[0], Row)
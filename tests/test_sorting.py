@@ -0,0 +1,77 @@
+import random
+import unittest
+from operator import itemgetter
+from genpipeline import *
+from genpipeline import sorting
+from genpipeline.sorting import *
+
+
+class SortTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        self.rows = [{"id": i, "group": random.randint(0, 20)} for i in range(2000)]
+
+    def test_in_memory(self):
+        results = []
+        iter_source([3, 1, 2]) | (sort() | appender(results))
+        self.assertEqual(results, [1, 2, 3])
+
+    def test_spill(self):
+        results = []
+        iter_source(self.rows) | (sort(key=itemgetter("group"), max_memory=10000)
+                                  | appender(results))
+        # Stable: rows with equal keys stay in input order
+        self.assertEqual(results, sorted(self.rows, key=itemgetter("group")))
+
+    def test_reverse(self):
+        results = []
+        iter_source(self.rows) | (sort(key=itemgetter("group"), reverse=True, max_memory=10000)
+                                  | appender(results))
+        self.assertEqual(results, sorted(self.rows, key=itemgetter("group"), reverse=True))
+
+    def test_merge_passes(self):
+        fan_in = sorting.MERGE_FAN_IN
+        sorting.MERGE_FAN_IN = 4
+        try:
+            results = []
+            iter_source(self.rows) | (sort(key=itemgetter("group"), max_memory=2000)
+                                      | appender(results))
+        finally:
+            sorting.MERGE_FAN_IN = fan_in
+        self.assertEqual(results, sorted(self.rows, key=itemgetter("group")))
+
+    def test_merge_levels(self):
+        runs = []
+        written = []
+        most_open = 0
+        write_run = sorting._write_run
+
+        def record_write_run(items, path):
+            nonlocal most_open
+            run = write_run(items, path)
+            runs.append(run)
+            written.append(len(run))
+            most_open = max(most_open, sum(run._file is not None for run in runs))
+            return run
+
+        fan_in = sorting.MERGE_FAN_IN
+        sorting.MERGE_FAN_IN = 4
+        sorting._write_run = record_write_run
+        try:
+            results = []
+            iter_source(self.rows * 4) | (sort(key=itemgetter("group"), max_memory=2000)
+                                          | appender(results))
+        finally:
+            sorting.MERGE_FAN_IN = fan_in
+            sorting._write_run = write_run
+        self.assertEqual(results, sorted(self.rows * 4, key=itemgetter("group")))
+        self.assertGreater(len(written), 4 ** 4)
+        # Each item is written once in its first run and once per level of merges (4 levels for
+        # fewer than 4 ** 5 runs), with up to 3 runs open per level, and the run being merged to
+        self.assertLessEqual(sum(written), len(results) * 5)
+        self.assertLessEqual(most_open, 3 * 5 + 1)
+
+    def test_empty(self):
+        results = []
+        iter_source([]) | (sort() | appender(results))
+        self.assertEqual(results, [])
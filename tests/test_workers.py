@@ -0,0 +1,62 @@
+import time
+import unittest
+from genpipeline import *
+from genpipeline.workers import *
+
+
+class ParallelTest(unittest.TestCase):
+    def test_ordered(self):
+        results = []
+        iter_source(range(-10, 0)) | (parallel(abs, workers=2, batch_size=3) | appender(results))
+        self.assertEqual(results, list(range(10, 0, -1)))
+
+    def test_unordered(self):
+        results = []
+        iter_source(range(-10, 0)) | (parallel(abs, workers=2, batch_size=3, ordered=False)
+                                      | appender(results))
+        self.assertEqual(sorted(results), list(range(1, 11)))
+
+    def test_error(self):
+        thrown = []
+
+        @pipefilter
+        def catcher(target=None):
+            try:
+                while True:
+                    (yield)
+            except ValueError as e:
+                thrown.append(e)
+                raise
+
+        def pipeline():
+            iter_source(["1", "2", "x"]) | (parallel(int, workers=1, batch_size=1) | catcher())
+
+        self.assertRaises(ValueError, pipeline)
+        self.assertEqual(len(thrown), 1)
+
+
+class ThreadedTest(unittest.TestCase):
+    def test_ordered(self):
+        def slow_double(value):
+            time.sleep(0.01 * (5 - value))
+            return value * 2
+
+        results = []
+        stats = PoolStats()
+        iter_source(range(5)) | (threaded(slow_double, workers=5, stats=stats) | appender(results))
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+        self.assertEqual(stats.submitted, 5)
+        self.assertEqual(stats.completed, 5)
+        self.assertEqual(stats.queue_depth, 0)
+        self.assertGreater(stats.max_queue_depth, 1)
+        self.assertGreater(stats.utilisation, 0)
+
+    def test_as_completed(self):
+        def slow_double(value):
+            time.sleep(0.02 * (3 - value))
+            return value * 2
+
+        results = []
+        iter_source(range(3)) | (threaded(slow_double, workers=3, ordered=False)
+                                 | appender(results))
+        self.assertEqual(results, [4, 2, 0])